@@ -0,0 +1,287 @@
+"""Micro-benchmarks for chunking, embedding, indexing and search.
+
+Generates deterministic synthetic corpora at several sizes and measures how
+`DocumentChunker.chunk_text`, `SentenceTransformer.encode` batching,
+`VectorStore.add_documents` and `VectorStore.search` scale. Each size runs
+in a fresh process, so its peak RSS is not inflated by earlier sizes.
+Results are written as JSON so runs can be diffed between commits.
+
+Example:
+    python benchmark.py --sizes 1000,10000,100000 --output bench_results.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from src.ingestion import DocumentChunker
+from src.vector_store import VectorStore
+import src.config as config
+
+
+def generate_vocabulary(rng: random.Random, size: int) -> List[str]:
+    """Build a deterministic vocabulary of pseudo-words."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def generate_documents(seed: int, num_chunks: int, chunks_per_source: int,
+                       chunk_size: int, chunk_overlap: int) -> Iterator[Dict[str, Any]]:
+    """Yield synthetic documents that chunk into exactly `num_chunks` chunks."""
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary(rng, 5000)
+    # Zipf-like weights so term frequencies resemble natural text
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    step = chunk_size - chunk_overlap
+
+    source_index = 0
+    remaining = num_chunks
+    while remaining > 0:
+        count = min(chunks_per_source, remaining)
+        num_words = chunk_size + (count - 1) * step
+        words = rng.choices(vocabulary, weights=weights, k=num_words)
+        yield {
+            "text": " ".join(words),
+            "metadata": {
+                "source": f"synthetic_{source_index:06d}.txt",
+                "file_path": f"synthetic/synthetic_{source_index:06d}.txt",
+                "file_type": ".txt"
+            }
+        }
+        remaining -= count
+        source_index += 1
+
+
+def generate_queries(seed: int, num_queries: int) -> List[str]:
+    """Build deterministic short queries from the synthetic vocabulary."""
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary(rng, 5000)
+    query_rng = random.Random(seed + 1)
+    return [" ".join(query_rng.choices(vocabulary[:1000], k=query_rng.randint(3, 8)))
+            for _ in range(num_queries)]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (seconds) as millisecond percentiles."""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def peak_rss_mb() -> float:
+    """Return peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+def directory_size_bytes(path: Path) -> int:
+    """Return total size of all files under a directory."""
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def bench_encode(store: VectorStore, texts: List[str], batch_sizes: List[int]) -> Dict[str, Any]:
+    """Measure embedding throughput for different batch sizes."""
+    results = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        store.embedding_model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        elapsed = time.perf_counter() - start
+        results[str(batch_size)] = {
+            "texts": len(texts),
+            "seconds": round(elapsed, 4),
+            "texts_per_sec": round(len(texts) / elapsed, 1) if elapsed else None
+        }
+    return results
+
+
+def bench_size(num_chunks: int, args: argparse.Namespace, queries: List[str]) -> Dict[str, Any]:
+    """Run the chunk/index/search benchmark for a single corpus size."""
+    chunker = DocumentChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    persist_dir = Path(tempfile.mkdtemp(prefix=f"bench_{num_chunks}_", dir=args.workdir))
+    store = VectorStore(persist_directory=persist_dir)
+
+    chunk_seconds = 0.0
+    add_seconds = 0.0
+    total_chunks = 0
+    total_words = 0
+    sources = []
+    pending = []
+
+    for doc in generate_documents(args.seed, num_chunks, args.chunks_per_source,
+                                  args.chunk_size, args.chunk_overlap):
+        total_words += len(doc["text"].split())
+        start = time.perf_counter()
+        chunks = chunker.chunk_text(doc["text"], doc["metadata"])
+        chunk_seconds += time.perf_counter() - start
+        sources.append(doc["metadata"]["source"])
+        total_chunks += len(chunks)
+        pending.extend(chunks)
+
+        if len(pending) >= args.add_batch_size:
+            start = time.perf_counter()
+            store.add_documents(pending)
+            add_seconds += time.perf_counter() - start
+            pending = []
+
+    if pending:
+        start = time.perf_counter()
+        store.add_documents(pending)
+        add_seconds += time.perf_counter() - start
+
+    rss_after_index = peak_rss_mb()
+
+    # Search latency with and without source filters
+    rng = random.Random(args.seed + num_chunks)
+    search_results = {}
+    filter_cases = {
+        "no_filter": lambda: None,
+        "filter_1_source": lambda: [rng.choice(sources)],
+        "filter_10pct_sources": lambda: rng.sample(sources, max(1, len(sources) // 10))
+    }
+    for name, make_filter in filter_cases.items():
+        samples = []
+        for query in queries:
+            source_filter = make_filter()
+            start = time.perf_counter()
+            store.search(query, top_k=args.top_k, source_filter=source_filter)
+            samples.append(time.perf_counter() - start)
+        search_results[name] = latency_summary(samples)
+
+    result = {
+        "chunks": total_chunks,
+        "sources": len(sources),
+        "chunking": {
+            "seconds": round(chunk_seconds, 4),
+            "words_per_sec": round(total_words / chunk_seconds, 1) if chunk_seconds else None,
+            "chunks_per_sec": round(total_chunks / chunk_seconds, 1) if chunk_seconds else None
+        },
+        "add_documents": {
+            "seconds": round(add_seconds, 4),
+            "chunks_per_sec": round(total_chunks / add_seconds, 1) if add_seconds else None,
+            "batch_size": args.add_batch_size
+        },
+        "search": search_results,
+        "peak_rss_mb": {
+            "after_index": rss_after_index,
+            "after_search": peak_rss_mb()
+        },
+        "index_size_bytes": directory_size_bytes(persist_dir)
+    }
+
+    if not args.keep_indexes:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+    return result
+
+
+def bench_size_isolated(num_chunks: int, args: argparse.Namespace, queries: List[str]) -> Dict[str, Any]:
+    """Run `bench_size` in a fresh process, so peak RSS covers this size only."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(bench_size, num_chunks, args, queries).result()
+
+
+def git_commit() -> str:
+    """Return the current git commit, if available."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=config.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_int_list(value: str) -> List[int]:
+    """Parse a comma-separated list of integers."""
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    """Run the benchmark suite and write JSON results."""
+    parser = argparse.ArgumentParser(description="Benchmark chunking, embedding, indexing and search.")
+    parser.add_argument("--sizes", type=parse_int_list, default=[1000, 10000, 100000],
+                        help="Comma-separated corpus sizes in chunks (up to 1000000)")
+    parser.add_argument("--queries", type=int, default=100, help="Number of search queries per case")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--chunk-size", type=int, default=config.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=config.CHUNK_OVERLAP)
+    parser.add_argument("--chunks-per-source", type=int, default=20)
+    parser.add_argument("--add-batch-size", type=int, default=1000,
+                        help="Chunks passed to each add_documents call")
+    parser.add_argument("--encode-batch-sizes", type=parse_int_list, default=[8, 32, 128])
+    parser.add_argument("--encode-sample", type=int, default=1024,
+                        help="Number of chunks used for the encode batching benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", type=str, default=None, help="Directory for temporary indexes")
+    parser.add_argument("--keep-indexes", action="store_true")
+    parser.add_argument("--output", type=str, default="bench_results.json")
+    args = parser.parse_args()
+
+    queries = generate_queries(args.seed, args.queries)
+
+    # Encode batching is measured once on a fixed sample of chunks
+    chunker = DocumentChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    sample_texts = []
+    for doc in generate_documents(args.seed, args.encode_sample, args.chunks_per_source,
+                                  args.chunk_size, args.chunk_overlap):
+        sample_texts.extend(c["text"] for c in chunker.chunk_text(doc["text"], doc["metadata"]))
+    encode_dir = Path(tempfile.mkdtemp(prefix="bench_encode_", dir=args.workdir))
+    encode_results = bench_encode(VectorStore(persist_directory=encode_dir), sample_texts,
+                                  args.encode_batch_sizes)
+    shutil.rmtree(encode_dir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embedding_model": config.EMBEDDING_MODEL,
+            "seed": args.seed,
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "top_k": args.top_k,
+            "queries": args.queries
+        },
+        "encode": encode_results,
+        "sizes": {}
+    }
+
+    for size in args.sizes:
+        print(f"Benchmarking {size} chunks...")
+        results["sizes"][str(size)] = bench_size_isolated(size, args, queries)
+        # Write after every size so long runs still leave partial results
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 """Script to index documents from the docs directory."""
+import argparse
 import sys
 import io
 from pathlib import Path
 from src.rag import RAGPipeline
+from src.tenants import resolve_tenant, tenant_docs_dir
 import src.config as config
 
 # Fix Windows console encoding
@@ -10,8 +12,14 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='repla
 
 def main():
     """Index all documents in the docs directory."""
+    parser = argparse.ArgumentParser(description="Index documents from the docs directory.")
+    parser.add_argument("--tenant", type=str, default=None,
+                        help="Tenant to index into (reads tenant_docs/<tenant>/; default: docs/)")
+    args = parser.parse_args()
+    tenant = resolve_tenant(args.tenant)
+    
     rag = RAGPipeline()
-    docs_dir = config.DOCS_DIR
+    docs_dir = tenant_docs_dir(tenant)
     
     # Find all supported documents
     doc_files = []
@@ -27,14 +35,14 @@ def main():
     
     for doc_file in doc_files:
         print(f"\nIndexing: {doc_file.name}")
-        result = rag.ingest_document(doc_file)
+        result = rag.ingest_document(doc_file, tenant=tenant)
         if result["status"] == "success":
             print(f"  [OK] Successfully indexed {result['chunks']} chunks")
         else:
             print(f"  [ERROR] Error: {result.get('error', 'Unknown error')}")
     
     # Print stats
-    stats = rag.get_stats()
+    stats = rag.get_stats(tenant)
     print(f"\n[SUCCESS] Indexing complete! Total chunks in knowledge base: {stats['count']}")
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 """Main entry point for RAG system."""
+import os
 import uvicorn
-from src.api import app
 import src.config as config
 
 if __name__ == "__main__":
@@ -17,11 +17,20 @@ if __name__ == "__main__":
             print("⚠️  Warning: No HF_API_KEY set. Some models may require authentication.")
             print("   Get a free token at: https://huggingface.co/settings/tokens")
     
-    uvicorn.run(
-        app,
-        host=config.API_HOST,
-        port=config.API_PORT,
-        log_level="info"
-    )
+    if config.QUERY_WORKERS > 1 and hasattr(os, "fork"):
+        # One writer process plus N read-only query workers sharing the model
+        from src.deploy import run
+        print(f"Query workers: {config.QUERY_WORKERS} (writer on {config.WRITER_URL})")
+        run(config.QUERY_WORKERS)
+    else:
+        if config.QUERY_WORKERS > 1:
+            print("⚠️  Warning: multi-worker mode needs os.fork; running a single process.")
+        from src.api import app
+        uvicorn.run(
+            app,
+            host=config.API_HOST,
+            port=config.API_PORT,
+            log_level="info"
+        )
 
 
@@ -0,0 +1,71 @@
+"""Export, import and inspect knowledge base snapshots.
+
+Examples:
+    python manage_snapshot.py export                  # write snapshots/knowledge_base.snap
+    python manage_snapshot.py import --overwrite      # replace the index with the snapshot
+    python manage_snapshot.py info
+"""
+import argparse
+import json
+from pathlib import Path
+
+from src.rag import RAGPipeline
+from src.snapshot import Snapshot, SnapshotError, export_snapshot, import_snapshot
+import src.config as config
+
+
+def main():
+    """Run the snapshot CLI."""
+    parser = argparse.ArgumentParser(description="Manage knowledge base snapshots.")
+    parser.add_argument("--path", type=str, default=str(config.SNAPSHOT_PATH))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("export", help="Write the current index to a snapshot")
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into the index")
+    import_parser.add_argument("--overwrite", action="store_true", help="Clear the current index first")
+    import_parser.add_argument("--force", action="store_true",
+                               help="Skip the embedding model / chunking config check")
+    import_parser.add_argument("--no-verify", action="store_true", help="Skip checksum verification")
+
+    info_parser = subparsers.add_parser("info", help="Show a snapshot's manifest")
+    info_parser.add_argument("--verify", action="store_true")
+
+    args = parser.parse_args()
+    path = Path(args.path)
+
+    if args.command == "info":
+        snapshot = Snapshot(path)
+        try:
+            if args.verify:
+                snapshot.verify()
+                print("Checksums OK")
+            print(json.dumps(snapshot.manifest, indent=2, sort_keys=True))
+        finally:
+            snapshot.close()
+        return
+
+    # Don't let the pipeline auto-load the snapshot we are about to manage
+    config.SNAPSHOT_AUTOLOAD = False
+    rag = RAGPipeline()
+
+    if args.command == "export":
+        manifest = export_snapshot(rag.vector_store, path)
+        print(f"[SUCCESS] Exported {manifest['count']} chunks and {manifest['parent_count']} parents to {path} ({path.stat().st_size} bytes)")
+    elif args.command == "import":
+        count = rag.get_stats()["count"]
+        if count and not args.overwrite:
+            print(f"Index already holds {count} chunks. Use --overwrite to replace it.")
+            return
+        if count:
+            rag.vector_store.delete_collection()
+        try:
+            manifest = import_snapshot(rag.vector_store, path, verify=not args.no_verify, force=args.force)
+        except SnapshotError as e:
+            print(f"[ERROR] {e}")
+            return
+        print(f"[SUCCESS] Imported {manifest['count']} chunks from {path}")
+
+
+if __name__ == "__main__":
+    main()
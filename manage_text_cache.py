@@ -0,0 +1,79 @@
+"""Prewarm, inspect and garbage-collect the extracted-text cache.
+
+Examples:
+    python manage_text_cache.py prewarm            # extract all PDFs in docs/
+    python manage_text_cache.py gc --orphans       # drop entries for files in neither docs/ nor tenant_docs/
+    python manage_text_cache.py gc --max-age-days 30 --max-mb 500
+    python manage_text_cache.py stats
+"""
+import argparse
+from pathlib import Path
+from typing import List
+
+from src.ingestion import DocumentChunker, EXTRACTOR_VERSION
+from src.text_cache import ExtractedTextCache, file_hash
+import src.config as config
+
+
+def find_pdfs(paths: List[str]) -> List[Path]:
+    """Collect PDF files from the given files/directories."""
+    pdfs = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            pdfs.extend(sorted(path.rglob("*.pdf")))
+        elif path.suffix.lower() == ".pdf":
+            pdfs.append(path)
+    return pdfs
+
+
+def prewarm(cache: ExtractedTextCache, paths: List[str]) -> None:
+    """Extract and cache the text of every PDF under the given paths."""
+    chunker = DocumentChunker(text_cache=cache)
+    pdfs = find_pdfs(paths)
+    print(f"Prewarming text cache for {len(pdfs)} PDF(s)...")
+    for pdf in pdfs:
+        try:
+            pages = chunker.load_pdf_pages(pdf)
+            print(f"  [OK] {pdf.name}: {len(pages)} pages")
+        except Exception as e:
+            print(f"  [ERROR] {pdf.name}: {e}")
+
+
+def main():
+    """Run the text cache CLI."""
+    parser = argparse.ArgumentParser(description="Manage the extracted-text cache.")
+    parser.add_argument("--cache-dir", type=str, default=str(config.TEXT_CACHE_DIR))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prewarm_parser = subparsers.add_parser("prewarm", help="Extract and cache PDF text")
+    prewarm_parser.add_argument("paths", nargs="*", default=[str(config.DOCS_DIR)])
+
+    gc_parser = subparsers.add_parser("gc", help="Remove stale cache entries")
+    gc_parser.add_argument("--orphans", action="store_true",
+                           help="Remove entries whose file is no longer in the docs paths")
+    # Every tenant's uploads share the cache, so their files are live too
+    gc_parser.add_argument("--docs", nargs="*", default=[str(config.DOCS_DIR), str(config.TENANT_DOCS_DIR)],
+                           help="Paths considered live for --orphans (default: docs/ and all tenant docs)")
+    gc_parser.add_argument("--max-age-days", type=float, default=None)
+    gc_parser.add_argument("--max-mb", type=float, default=None)
+
+    subparsers.add_parser("stats", help="Show cache size")
+
+    args = parser.parse_args()
+    cache = ExtractedTextCache(Path(args.cache_dir), extractor_version=EXTRACTOR_VERSION)
+
+    if args.command == "prewarm":
+        prewarm(cache, args.paths)
+    elif args.command == "gc":
+        keep = {file_hash(p) for p in find_pdfs(args.docs)} if args.orphans else None
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        result = cache.gc(keep_hashes=keep, max_age_days=args.max_age_days, max_bytes=max_bytes)
+        print(f"Removed {result['removed']} entries, freed {result['freed_bytes']} bytes")
+
+    stats = cache.stats()
+    print(f"Cache: {stats['entries']} entries, {stats['bytes']} bytes in {stats['directory']} "
+          f"(extractor {stats['extractor_version']})")
+
+
+if __name__ == "__main__":
+    main()
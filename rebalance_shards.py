@@ -0,0 +1,84 @@
+"""Rebalance the knowledge base to a different number of shards.
+
+Copies every chunk (vectors, metadata and text, plus the parent chunks of
+hierarchical chunking) from the current layout into a new N-shard layout
+without re-embedding anything. Afterwards, start the
+server with VECTOR_SHARDS=N to use the new layout.
+
+Examples:
+    python rebalance_shards.py --to 4              # unsharded (or VECTOR_SHARDS) -> 4 shards
+    python rebalance_shards.py --from 4 --to 8
+    python rebalance_shards.py --from 4 --to 1     # back to a single collection
+"""
+import argparse
+import shutil
+
+from src.sharded_store import ShardedVectorStore, shard_directory
+from src.vector_store import VectorStore
+import src.config as config
+
+
+def open_layout(num_shards: int):
+    """Open the local store for an N-shard layout (1 = unsharded)."""
+    if num_shards == 1:
+        return VectorStore()
+    return ShardedVectorStore(num_shards=num_shards, shard_addresses=[])
+
+
+def main():
+    """Copy all chunks into a new shard layout."""
+    parser = argparse.ArgumentParser(description="Rebalance chunks across a new number of shards.")
+    parser.add_argument("--from", dest="from_shards", type=int, default=config.VECTOR_SHARDS,
+                        help="Current shard count (default: VECTOR_SHARDS)")
+    parser.add_argument("--to", dest="to_shards", type=int, required=True, help="New shard count")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--overwrite", action="store_true", help="Clear the target layout first")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the old sharded layout after a successful copy")
+    args = parser.parse_args()
+
+    if args.from_shards == args.to_shards:
+        print("Source and target shard counts are the same; nothing to do.")
+        return
+
+    source = open_layout(args.from_shards)
+    target = open_layout(args.to_shards)
+
+    existing = target.get_collection_info()["count"]
+    if existing:
+        if not args.overwrite:
+            print(f"Target layout already holds {existing} chunks. Use --overwrite to replace it.")
+            return
+        target.delete_collection()
+
+    # Parents first, so every child's parent can be resolved once it is searchable
+    parents = 0
+    for batch in source.export_parents():
+        target.import_parents(batch)
+        parents += len(batch)
+    if parents:
+        print(f"Copied {parents} parent chunks")
+
+    total = source.get_collection_info()["count"]
+    print(f"Copying {total} chunks from {args.from_shards} to {args.to_shards} shard(s)...")
+    copied = 0
+    for chunks, embeddings in source.export_chunks(batch_size=args.batch_size):
+        target.import_chunks(chunks, embeddings)
+        copied += len(chunks)
+        print(f"  {copied}/{total}")
+
+    info = target.get_collection_info()
+    print(f"[SUCCESS] Target holds {info['count']} chunks; per shard: {info.get('shards', [info['count']])}")
+
+    if args.delete_old and info["count"] == total:
+        if args.from_shards == 1:
+            print("Not deleting the unsharded collection; remove it manually if no longer needed.")
+        else:
+            shutil.rmtree(shard_directory(args.from_shards, 0).parent, ignore_errors=True)
+            print(f"Deleted old {args.from_shards}-shard layout")
+
+    print(f"Start the server with VECTOR_SHARDS={args.to_shards} to use the new layout.")
+
+
+if __name__ == "__main__":
+    main()
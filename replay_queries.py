@@ -0,0 +1,138 @@
+"""Inspect the query log and replay it as load against a running server.
+
+Replayed queries keep their tenant, question, top_k and filters, and are sent
+either at the recorded pace (scaled by --speed) or as fast as --concurrency
+allows (--speed 0). Latency percentiles, status codes and mean server-side
+stage timings are written as JSON, so runs can be compared between commits
+like benchmark.py results.
+
+Examples:
+    python replay_queries.py top --limit 20
+    python replay_queries.py replay --url http://localhost:8000 --hours 24 --limit 1000 --speed 0 --concurrency 8
+    python replay_queries.py replay --speed 2 --output replay_results.json
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+
+from benchmark import latency_summary
+from src.query_log import most_frequent, read_records
+import src.config as config
+
+
+def replay_one(session: requests.Session, url: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Send one logged query to /api/query and time it."""
+    payload = {
+        "question": record["question"],
+        "top_k": record.get("top_k"),
+        "source_filter": record.get("source_filter"),
+        "search_mode": record.get("search_mode"),
+        "ef_search": record.get("ef_search"),
+        "include_timings": True
+    }
+    filters = dict(record.get("filters") or {})
+    for key in ("ingested_after", "ingested_before"):
+        if key in filters:
+            # The log stores Unix timestamps, the API takes datetimes
+            filters[key] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(filters[key]))
+    if filters:
+        payload["filters"] = filters
+    headers = {"X-Tenant": record["tenant"]} if record.get("tenant") else {}
+    start = time.perf_counter()
+    try:
+        response = session.post(f"{url}/api/query", json=payload, headers=headers, timeout=300)
+        body = response.json() if response.ok else {}
+        status = response.status_code
+    except requests.RequestException:
+        body, status = {}, "error"
+    return {"seconds": time.perf_counter() - start, "status": status, "timings": body.get("timings") or {}}
+
+
+def replay(records: List[Dict[str, Any]], url: str, speed: float, concurrency: int) -> Dict[str, Any]:
+    """Replay records against a server and summarize the results."""
+    local = threading.local()
+    first_ts = records[0].get("ts", 0) if records else 0
+    start = time.perf_counter()
+
+    def run(record: Dict[str, Any]) -> Dict[str, Any]:
+        if speed > 0:
+            # Keep the recorded inter-arrival times, compressed by `speed`
+            delay = start + (record.get("ts", first_ts) - first_ts) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return replay_one(local.session, url, record)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, records))
+    elapsed = time.perf_counter() - start
+
+    statuses: Dict[str, int] = {}
+    stages: Dict[str, List[float]] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+        for stage, ms in result["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+    ok = [r["seconds"] for r in results if r["status"] == 200]
+    return {
+        "queries": len(results),
+        "seconds": round(elapsed, 3),
+        "queries_per_sec": round(len(results) / elapsed, 2) if elapsed else None,
+        "status": statuses,
+        "latency": latency_summary(ok) if ok else None,
+        "stage_mean_ms": {stage: round(statistics.mean(values), 3) for stage, values in sorted(stages.items())}
+    }
+
+
+def main():
+    """Run the query log CLI."""
+    parser = argparse.ArgumentParser(description="Inspect and replay the query log.")
+    parser.add_argument("--log-dir", type=str, default=str(config.QUERY_LOG_DIR))
+    parser.add_argument("--hours", type=float, default=None, help="Only use queries of the last N hours")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    top_parser = subparsers.add_parser("top", help="Show the most frequent queries")
+    top_parser.add_argument("--limit", type=int, default=20)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay logged queries against a server")
+    replay_parser.add_argument("--url", type=str, default=f"http://localhost:{config.API_PORT}")
+    replay_parser.add_argument("--limit", type=int, default=None, help="Replay at most the first N queries")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Pace relative to the recorded one (0 = as fast as possible)")
+    replay_parser.add_argument("--concurrency", type=int, default=4)
+    replay_parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    records = read_records(args.log_dir, since=since)
+
+    if args.command == "top":
+        for record in most_frequent(records, args.limit):
+            tenant = f" [{record['tenant']}]" if record.get("tenant") != config.DEFAULT_TENANT else ""
+            print(f"{record['count']:>6}  {record['question']}{tenant}")
+        return
+
+    records = sorted((r for r in records if r.get("question")), key=lambda r: r.get("ts", 0))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No logged queries to replay.")
+        return
+    print(f"Replaying {len(records)} queries against {args.url}...")
+    results = replay(records, args.url.rstrip("/"), args.speed, args.concurrency)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
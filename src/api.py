@@ -1,18 +1,49 @@
 """FastAPI backend for RAG system."""
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response
+from fastapi.datastructures import Default
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, FileResponse
 from pathlib import Path
-from typing import Optional, List
-from pydantic import BaseModel
+from datetime import datetime, timezone
+from typing import Any, Optional, List, Dict, Literal
+from pydantic import BaseModel, Field
+import requests
 import tempfile
-import shutil
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+from starlette.concurrency import run_in_threadpool
 
 from src.rag import RAGPipeline
+from src.metrics import registry, server_timing_header
+from src.profiling import ProfilingError, resolve_mode, profile_request, get_profile_path
+from src.tenants import TenantError, list_tenants, resolve_tenant, tenant_docs_dir
+from src.sessions import SessionError
+from src.metadata_index import normalize_metadata_filter
+from src.web import INDEX, FastJSONResponse, StaticAssets
+from src.upload import UploadSink, UploadTooLarge, copy_upload, receive_upload
 import src.config as config
 
 
-app = FastAPI(title="RAG Knowledge Base Assistant")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the retrieval cache from the query log in the background; flush the log on shutdown."""
+    if rag.query_log is not None and config.QUERY_LOG_WARM_QUERIES > 0:
+        def warm():
+            result = rag.warm_from_log()
+            if result["queries"]:
+                print(f"Warmed {result['warmed']}/{result['queries']} logged queries in {result['seconds']}s")
+        threading.Thread(target=warm, name="query-log-warm", daemon=True).start()
+    yield
+    if rag.query_log is not None:
+        rag.query_log.close()
+
+
+# Kept as the default (placeholder) response class so routes with a response
+# model still take FastAPI's direct Pydantic-to-JSON path
+app = FastAPI(title="RAG Knowledge Base Assistant", lifespan=lifespan,
+              default_response_class=Default(FastJSONResponse))
 
 # CORS middleware
 app.add_middleware(
@@ -22,535 +53,393 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Negotiated compression of API responses (static assets are precompressed)
+app.add_middleware(GZipMiddleware, minimum_size=config.API_COMPRESSION_MIN_BYTES)
 
 # Initialize RAG pipeline
 rag = RAGPipeline()
+static_assets = StaticAssets()
+
+
+class MetadataFilter(BaseModel):
+    file_type: Optional[List[str]] = None  # e.g. [".pdf", ".md"]
+    page_from: Optional[int] = Field(None, ge=1)  # Chunks overlapping this page range (PDFs)
+    page_to: Optional[int] = Field(None, ge=1)
+    ingested_after: Optional[datetime] = None  # Naive datetimes are taken as UTC
+    ingested_before: Optional[datetime] = None
+
+    def to_filter(self) -> Dict:
+        """Plain filter dict with ingest bounds as Unix timestamps."""
+        result = self.model_dump(exclude_none=True)
+        for key in ("ingested_after", "ingested_before"):
+            if key in result:
+                value = result[key]
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=timezone.utc)
+                result[key] = value.timestamp()
+        return result
 
 
 class QueryRequest(BaseModel):
     question: str
     top_k: Optional[int] = None
     source_filter: Optional[List[str]] = None  # Filter by source file names
+    ef_search: Optional[int] = Field(None, ge=1, le=10000)  # HNSW ef_search override
+    search_mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    session_id: Optional[str] = None  # Continue a chat session
+    new_session: bool = False  # Start a chat session; its ID is returned
+    filters: Optional[MetadataFilter] = None  # Metadata filters (file type, pages, ingest date)
+    include_timings: bool = False  # Include per-stage latency breakdown (ms)
+    include_docs: Optional[Literal["compact", "full"]] = None  # Include the retrieved chunks
+
+
+class PrefetchRequest(BaseModel):
+    question: str  # Partially typed question
+    top_k: Optional[int] = None
+    source_filter: Optional[List[str]] = None
+    ef_search: Optional[int] = Field(None, ge=1, le=10000)
+    search_mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    filters: Optional[MetadataFilter] = None
 
 
 class QueryResponse(BaseModel):
     question: str
     answer: str
     sources: list
+    session_id: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    retrieved_docs: Optional[List[Dict[str, Any]]] = None
 
 
 @app.get("/")
-async def root():
+async def root(http_request: Request):
     """Serve the web UI."""
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>RAG Knowledge Base Assistant</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            body {
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                padding: 20px;
-            }
-            .container {
-                max-width: 1200px;
-                margin: 0 auto;
-                background: white;
-                border-radius: 20px;
-                box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-                overflow: hidden;
-            }
-            .header {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 30px;
-                text-align: center;
-            }
-            .header h1 {
-                font-size: 2.5em;
-                margin-bottom: 10px;
-            }
-            .header p {
-                opacity: 0.9;
-                font-size: 1.1em;
-            }
-            .content {
-                padding: 40px;
-            }
-            .upload-section {
-                background: #f8f9fa;
-                padding: 30px;
-                border-radius: 15px;
-                margin-bottom: 30px;
-                border: 2px dashed #667eea;
-            }
-            .upload-section h2 {
-                color: #333;
-                margin-bottom: 20px;
-            }
-            .file-input-wrapper {
-                position: relative;
-                display: inline-block;
-                width: 100%;
-            }
-            .file-input-wrapper input[type=file] {
-                font-size: 18px;
-                padding: 15px;
-                width: 100%;
-                border: 2px solid #667eea;
-                border-radius: 10px;
-                background: white;
-            }
-            .upload-btn {
-                margin-top: 15px;
-                padding: 15px 30px;
-                background: #667eea;
-                color: white;
-                border: none;
-                border-radius: 10px;
-                font-size: 18px;
-                cursor: pointer;
-                transition: background 0.3s;
-            }
-            .upload-btn:hover {
-                background: #5568d3;
-            }
-            .upload-btn:disabled {
-                background: #ccc;
-                cursor: not-allowed;
-            }
-            .query-section {
-                margin-top: 30px;
-            }
-            .query-section h2 {
-                color: #333;
-                margin-bottom: 20px;
-            }
-            .query-input {
-                width: 100%;
-                padding: 20px;
-                font-size: 18px;
-                border: 2px solid #e0e0e0;
-                border-radius: 10px;
-                margin-bottom: 15px;
-                font-family: inherit;
-            }
-            .query-input:focus {
-                outline: none;
-                border-color: #667eea;
-            }
-            .query-btn {
-                padding: 15px 40px;
-                background: #667eea;
-                color: white;
-                border: none;
-                border-radius: 10px;
-                font-size: 18px;
-                cursor: pointer;
-                transition: background 0.3s;
-            }
-            .query-btn:hover {
-                background: #5568d3;
-            }
-            .query-btn:disabled {
-                background: #ccc;
-                cursor: not-allowed;
-            }
-            .answer-section {
-                margin-top: 30px;
-                padding: 30px;
-                background: #f8f9fa;
-                border-radius: 15px;
-                display: none;
-            }
-            .answer-section.visible {
-                display: block;
-            }
-            .answer-section h3 {
-                color: #333;
-                margin-bottom: 15px;
-            }
-            .answer-text {
-                background: white;
-                padding: 20px;
-                border-radius: 10px;
-                line-height: 1.8;
-                color: #333;
-                white-space: pre-wrap;
-                margin-bottom: 20px;
-            }
-            .sources {
-                margin-top: 20px;
-            }
-            .sources h4 {
-                color: #667eea;
-                margin-bottom: 10px;
-            }
-            .source-list {
-                list-style: none;
-                padding: 0;
-            }
-            .source-item {
-                background: white;
-                padding: 10px 15px;
-                margin-bottom: 10px;
-                border-radius: 8px;
-                border-left: 4px solid #667eea;
-            }
-            .status {
-                padding: 15px;
-                border-radius: 10px;
-                margin-top: 15px;
-                display: none;
-            }
-            .status.success {
-                background: #d4edda;
-                color: #155724;
-                border: 1px solid #c3e6cb;
-                display: block;
-            }
-            .status.error {
-                background: #f8d7da;
-                color: #721c24;
-                border: 1px solid #f5c6cb;
-                display: block;
-            }
-            .status.info {
-                background: #d1ecf1;
-                color: #0c5460;
-                border: 1px solid #bee5eb;
-                display: block;
-            }
-            .loading {
-                display: none;
-                text-align: center;
-                padding: 20px;
-            }
-            .loading.visible {
-                display: block;
-            }
-            .spinner {
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #667eea;
-                border-radius: 50%;
-                width: 40px;
-                height: 40px;
-                animation: spin 1s linear infinite;
-                margin: 0 auto;
-            }
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-            .stats {
-                background: #e9ecef;
-                padding: 20px;
-                border-radius: 10px;
-                margin-bottom: 30px;
-            }
-            .stats h3 {
-                color: #333;
-                margin-bottom: 10px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🤖 RAG Knowledge Base Assistant</h1>
-                <p>Ask questions based on your uploaded documents</p>
-            </div>
-            <div class="content">
-                <div class="stats">
-                    <h3>Knowledge Base Statistics</h3>
-                    <p id="stats-text">Loading...</p>
-                    <div id="sources-list" style="margin-top: 10px; display: none;">
-                        <h4 style="color: #667eea; font-size: 14px; margin-bottom: 5px;">Indexed Documents:</h4>
-                        <div id="sources-container" style="display: flex; flex-wrap: wrap; gap: 10px;"></div>
-                    </div>
-                </div>
-                
-                <div class="upload-section">
-                    <h2>📄 Upload Document</h2>
-                    <form id="upload-form">
-                        <div class="file-input-wrapper">
-                            <input type="file" id="file-input" accept=".pdf,.txt,.md" required>
-                        </div>
-                        <button type="submit" class="upload-btn" id="upload-btn">Upload & Index</button>
-                        <div id="upload-status" class="status"></div>
-                    </form>
-                </div>
-                
-                <div class="query-section">
-                    <h2>💬 Ask a Question</h2>
-                    <input type="text" class="query-input" id="query-input" placeholder="Enter your question here...">
-                    <div style="margin-bottom: 15px;">
-                        <label style="display: block; color: #667eea; font-weight: bold; margin-bottom: 5px;">
-                            Filter by documents (optional - leave empty to search all):
-                        </label>
-                        <select id="source-filter" multiple style="width: 100%; padding: 10px; border: 2px solid #e0e0e0; border-radius: 10px; font-size: 14px;">
-                            <option value="">-- Select documents (hold Ctrl/Cmd for multiple) --</option>
-                        </select>
-                        <small style="color: #666; display: block; margin-top: 5px;">
-                            Tip: Leave empty to search all documents, or select specific documents
-                        </small>
-                    </div>
-                    <button class="query-btn" id="query-btn">Ask</button>
-                    <div id="query-loading" class="loading">
-                        <div class="spinner"></div>
-                        <p>Thinking...</p>
-                    </div>
-                    <div id="query-status" class="status"></div>
-                    <div class="answer-section" id="answer-section">
-                        <h3>Answer</h3>
-                        <div class="answer-text" id="answer-text"></div>
-                        <div class="sources">
-                            <h4>Sources</h4>
-                            <ul class="source-list" id="source-list"></ul>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <script>
-            // Load stats
-            let availableSources = [];
-            async function loadStats() {
-                try {
-                    const response = await fetch('/api/stats');
-                    const data = await response.json();
-                    document.getElementById('stats-text').textContent = 
-                        `Chunks indexed: ${data.count || 0}`;
-                    
-                    // Show available sources
-                    if (data.sources && data.sources.length > 0) {
-                        availableSources = data.sources;
-                        const sourcesContainer = document.getElementById('sources-container');
-                        sourcesContainer.innerHTML = '';
-                        data.sources.forEach(source => {
-                            const badge = document.createElement('span');
-                            badge.textContent = source;
-                            badge.style.cssText = 'background: #667eea; color: white; padding: 5px 10px; border-radius: 15px; font-size: 12px;';
-                            sourcesContainer.appendChild(badge);
-                        });
-                        document.getElementById('sources-list').style.display = 'block';
-                    }
-                    
-                    // Populate source filter dropdown
-                    populateSourceFilter();
-                } catch (error) {
-                    document.getElementById('stats-text').textContent = 'Error loading stats';
-                }
-            }
-            
-            // Populate source filter dropdown
-            function populateSourceFilter() {
-                const select = document.getElementById('source-filter');
-                if (!select) return;
-                
-                // Clear existing options except the first one
-                while (select.options.length > 1) {
-                    select.remove(1);
-                }
-                // Add available sources
-                availableSources.forEach(source => {
-                    const option = document.createElement('option');
-                    option.value = source;
-                    option.textContent = source;
-                    select.appendChild(option);
-                });
-            }
-            
-            loadStats();
-            
-            // Upload form
-            document.getElementById('upload-form').addEventListener('submit', async (e) => {
-                e.preventDefault();
-                const fileInput = document.getElementById('file-input');
-                const file = fileInput.files[0];
-                const uploadBtn = document.getElementById('upload-btn');
-                const status = document.getElementById('upload-status');
-                
-                if (!file) return;
-                
-                uploadBtn.disabled = true;
-                status.className = 'status info';
-                status.textContent = 'Uploading and indexing...';
-                
-                const formData = new FormData();
-                formData.append('file', file);
-                
-                try {
-                    const response = await fetch('/api/ingest', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    const data = await response.json();
-                    
-                    if (data.status === 'success') {
-                        status.className = 'status success';
-                        status.textContent = `Success! Indexed ${data.chunks} chunks from ${data.file}`;
-                        fileInput.value = '';
-                        loadStats();
-                    } else {
-                        status.className = 'status error';
-                        status.textContent = `Error: ${data.error || 'Unknown error'}`;
-                    }
-                } catch (error) {
-                    status.className = 'status error';
-                    status.textContent = `Error: ${error.message}`;
-                } finally {
-                    uploadBtn.disabled = false;
-                }
-            });
-            
-            // Query
-            document.getElementById('query-btn').addEventListener('click', async () => {
-                const queryInput = document.getElementById('query-input');
-                const sourceFilter = document.getElementById('source-filter');
-                const query = queryInput.value.trim();
-                const queryBtn = document.getElementById('query-btn');
-                const loading = document.getElementById('query-loading');
-                const status = document.getElementById('query-status');
-                const answerSection = document.getElementById('answer-section');
-                const answerText = document.getElementById('answer-text');
-                const sourceList = document.getElementById('source-list');
-                
-                if (!query) return;
-                
-                // Get selected sources
-                const selectedSources = Array.from(sourceFilter.selectedOptions)
-                    .map(opt => opt.value)
-                    .filter(val => val !== '');
-                
-                queryBtn.disabled = true;
-                loading.className = 'loading visible';
-                status.className = 'status';
-                answerSection.classList.remove('visible');
-                
-                try {
-                    const requestBody = { question: query };
-                    if (selectedSources.length > 0) {
-                        requestBody.source_filter = selectedSources;
-                    }
-                    
-                    const response = await fetch('/api/query', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(requestBody)
-                    });
-                    const data = await response.json();
-                    
-                    loading.className = 'loading';
-                    
-                    if (data.answer) {
-                        answerText.textContent = data.answer;
-                        sourceList.innerHTML = '';
-                        if (data.sources && data.sources.length > 0) {
-                            data.sources.forEach(source => {
-                                const li = document.createElement('li');
-                                li.className = 'source-item';
-                                li.textContent = source.source;
-                                sourceList.appendChild(li);
-                            });
-                        }
-                        answerSection.classList.add('visible');
-                    } else {
-                        status.className = 'status error';
-                        status.textContent = 'No answer received';
-                    }
-                } catch (error) {
-                    loading.className = 'loading';
-                    status.className = 'status error';
-                    status.textContent = `Error: ${error.message}`;
-                } finally {
-                    queryBtn.disabled = false;
-                }
-            });
-            
-            // Enter key for query
-            document.getElementById('query-input').addEventListener('keypress', (e) => {
-                if (e.key === 'Enter') {
-                    document.getElementById('query-btn').click();
-                }
-            });
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+    return static_assets.response(INDEX, http_request)
+
+
+@app.get("/static/{name}")
+async def static_file(name: str, http_request: Request):
+    """Serve a precompressed UI asset."""
+    response = static_assets.response(name, http_request)
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"Not found: {name}")
+    return response
 
 
 @app.get("/api/stats")
-async def get_stats():
-    """Get knowledge base statistics."""
+async def get_stats(http_request: Request):
+    """Get knowledge base statistics (for the tenant in X-Tenant / ?tenant=)."""
+    tenant = _request_tenant(http_request)
     try:
-        stats = rag.get_stats()
+        stats = rag.get_stats(tenant)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _resolve_profile_mode(http_request: Request) -> Optional[str]:
+    """Resolve the profiling mode requested via X-Profile header or ?profile=."""
+    requested = http_request.headers.get("X-Profile") or http_request.query_params.get("profile")
+    # Only from the header: query strings end up in access logs and browser history
+    token = http_request.headers.get("X-Admin-Token")
+    try:
+        return resolve_mode(requested, token)
+    except ProfilingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+def _request_tenant(http_request: Request, create: bool = False) -> str:
+    """Resolve the tenant from the X-Tenant header or ?tenant= and open its store."""
+    try:
+        tenant = resolve_tenant(http_request.headers.get("X-Tenant") or http_request.query_params.get("tenant"))
+        with rag.store_for(tenant, create=create):
+            pass
+    except TenantError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return tenant
+
+
+def _forward_to_writer(http_request: Request, method: str, path: str, **kwargs) -> Response:
+    """Forward a write request from a read-only query worker to the writer process.
+    
+    Blocking; call it through run_in_threadpool. The writer's status and body
+    are passed through as they are, whether or not the body is JSON.
+    """
+    headers = {
+        name: value for name, value in http_request.headers.items()
+        if name.lower() in ("x-profile", "x-admin-token", "x-tenant")
+    }
+    try:
+        writer_response = requests.request(
+            method, f"{config.WRITER_URL}{path}", params=http_request.query_params,
+            headers=headers, timeout=600, **kwargs
+        )
+    except requests.exceptions.RequestException as e:
+        raise HTTPException(status_code=503, detail=f"Writer process unavailable: {e}")
+    response = Response(content=writer_response.content, status_code=writer_response.status_code,
+                        media_type=writer_response.headers.get("Content-Type"))
+    for name in ("Server-Timing", "X-Profile-Id"):
+        if name in writer_response.headers:
+            response.headers[name] = writer_response.headers[name]
+    return response
+
+
+@app.get("/metrics")
+async def metrics():
+    """Expose metrics in Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def _check_upload_name(filename: str) -> str:
+    """Return the bare file name of an upload, rejecting unsupported types."""
+    filename = Path(filename or "").name
+    if Path(filename).suffix.lower() not in [".pdf", ".txt", ".md"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF, TXT, or MD.")
+    return filename
+
+
+def _check_upload_length(http_request: Request) -> None:
+    """Reject uploads whose declared length exceeds MAX_UPLOAD_BYTES before reading them."""
+    length = http_request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > config.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {config.MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit")
+
+
+def _ingest_upload(sink: UploadSink, tenant: str, http_request: Request, response: Response) -> Dict:
+    """Index a received upload, reusing the chunks or hash computed while it streamed in."""
+    profile_mode = _resolve_profile_mode(http_request)
+    with profile_request(profile_mode, "ingest") as profile:
+        result = rag.ingest_document(sink.destination, tenant=tenant, chunks=sink.chunks,
+                                     content_hash=sink.content_hash)
+    response.headers["Server-Timing"] = server_timing_header(result.get("timings", {}))
+    if profile.profile_id:
+        response.headers["X-Profile-Id"] = profile.profile_id
+    return {**result, "bytes": sink.size, "sha256": sink.content_hash}
+
+
 @app.post("/api/ingest")
-async def ingest_document(file: UploadFile = File(...)):
+async def ingest_document(http_request: Request, response: Response, file: UploadFile = File(...)):
     """Ingest a document into the knowledge base."""
-    # Check file type
-    suffix = Path(file.filename).suffix.lower()
-    if suffix not in [".pdf", ".txt", ".md"]:
-        raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF, TXT, or MD.")
+    filename = _check_upload_name(file.filename)
+    _check_upload_length(http_request)
+    if config.SERVER_ROLE == "reader":
+        return await run_in_threadpool(
+            _forward_to_writer, http_request, "POST", "/api/ingest",
+            files={"file": (filename, file.file, file.content_type)}
+        )
+    tenant = _request_tenant(http_request, create=True)
     
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-        shutil.copyfileobj(file.file, tmp_file)
-        tmp_path = Path(tmp_file.name)
+    # Hash, save into the tenant's docs directory and chunk text in one pass
+    try:
+        sink = UploadSink(tenant_docs_dir(tenant) / filename, rag.chunker)
+        await run_in_threadpool(copy_upload, file.file, sink)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Text files must be UTF-8 encoded.")
     
     try:
-        # Move to docs directory
-        docs_path = config.DOCS_DIR / file.filename
-        shutil.move(str(tmp_path), str(docs_path))
-        
-        # Ingest document
-        result = rag.ingest_document(docs_path)
-        return result
+        return await run_in_threadpool(_ingest_upload, sink, tenant, http_request, response)
     except Exception as e:
-        # Clean up temp file
-        if tmp_path.exists():
-            tmp_path.unlink()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.put("/api/ingest/{filename}")
+async def ingest_stream(filename: str, http_request: Request, response: Response):
+    """Ingest a document sent as the raw request body.
+    
+    The body is hashed, saved and (for TXT/MD) chunked while it arrives, so
+    indexing starts as soon as the upload ends.
+    """
+    filename = _check_upload_name(filename)
+    _check_upload_length(http_request)
+    if config.SERVER_ROLE == "reader":
+        # The writer does the streaming ingest; spool the body to forward it
+        with tempfile.SpooledTemporaryFile(max_size=config.UPLOAD_BUFFER_BYTES) as spool:
+            size = 0
+            async for block in http_request.stream():
+                size += len(block)
+                if size > config.MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+                spool.write(block)
+            spool.seek(0)
+            return await run_in_threadpool(_forward_to_writer, http_request, "PUT",
+                                           f"/api/ingest/{quote(filename)}", data=spool)
+    tenant = _request_tenant(http_request, create=True)
+    
+    try:
+        sink = UploadSink(tenant_docs_dir(tenant) / filename, rag.chunker)
+        await receive_upload(http_request.stream(), sink)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Text files must be UTF-8 encoded.")
+    
+    try:
+        return await run_in_threadpool(_ingest_upload, sink, tenant, http_request, response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/api/documents/{source}")
+async def delete_document(source: str, http_request: Request):
+    """Delete a document and all of its chunks from the knowledge base."""
+    if config.SERVER_ROLE == "reader":
+        return await run_in_threadpool(_forward_to_writer, http_request, "DELETE",
+                                       f"/api/documents/{quote(source)}")
+    tenant = _request_tenant(http_request)
+    try:
+        result = rag.delete_document(source, tenant=tenant)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result["removed"] and not result["file_deleted"]:
+        raise HTTPException(status_code=404, detail=f"Document not found: {source}")
+    return result
+
+
 @app.post("/api/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, http_request: Request, response: Response):
     """Query the RAG system.
     
-    You can filter by specific documents using source_filter.
-    Example: {"question": "What is RAG?", "source_filter": ["myfile.pdf"]}
+    You can filter by specific documents using source_filter, and by chunk
+    metadata using filters.
+    Example: {"question": "What is RAG?", "source_filter": ["myfile.pdf"],
+              "filters": {"page_from": 3, "page_to": 5}}
+    
+    Send `X-Profile: cprofile|sample` with `X-Admin-Token` to profile this request.
     """
+    profile_mode = _resolve_profile_mode(http_request)
+    tenant = _request_tenant(http_request)
     try:
-        result = rag.query(
-            request.question, 
-            top_k=request.top_k,
-            source_filter=request.source_filter
-        )
+        metadata_filter = normalize_metadata_filter(request.filters.to_filter()) if request.filters else None
+        with profile_request(profile_mode, "query") as profile:
+            result = rag.query(
+                request.question, 
+                top_k=request.top_k,
+                source_filter=request.source_filter,
+                ef_search=request.ef_search,
+                search_mode=request.search_mode,
+                tenant=tenant,
+                session_id=request.session_id,
+                new_session=request.new_session,
+                metadata_filter=metadata_filter
+            )
+        timings = result.get("timings", {})
+        _log_query(request, tenant, metadata_filter, result)
+        response.headers["Server-Timing"] = server_timing_header(timings)
+        if profile.profile_id:
+            response.headers["X-Profile-Id"] = profile.profile_id
         return QueryResponse(
             question=result["question"],
             answer=result["answer"],
-            sources=result["sources"]
+            sources=result["sources"],
+            session_id=result.get("session_id"),
+            timings=timings if request.include_timings else None,
+            retrieved_docs=_response_docs(result.get("retrieved_docs", []), request.include_docs)
         )
+    except SessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _response_docs(docs: List[Dict], form: Optional[str]) -> Optional[List[Dict]]:
+    """Retrieved chunks for the response: IDs, sources and scores ("compact") or whole chunks ("full")."""
+    if form is None:
+        return None
+    if form == "full":
+        return docs
+    compact = []
+    for doc in docs:
+        metadata = doc.get("metadata", {})
+        item = {"id": doc["id"], "source": metadata.get("source")}
+        for key in ("page_start", "page_end"):
+            if key in metadata:
+                item[key] = metadata[key]
+        for key in ("distance", "score", "rerank_score"):
+            if doc.get(key) is not None:
+                item[key] = round(float(doc[key]), 6)
+        if "matched_children" in doc:
+            item["matched_children"] = doc["matched_children"]
+        compact.append(item)
+    return compact
+
+
+def _log_query(request: QueryRequest, tenant: str, metadata_filter: Optional[Dict], result: Dict) -> None:
+    """Append a query to the query log (written in the background)."""
+    if rag.query_log is None:
+        return
+    rag.query_log.append({
+        "tenant": tenant,
+        "question": request.question,
+        "top_k": request.top_k or config.TOP_K,
+        "source_filter": request.source_filter,
+        "filters": metadata_filter,
+        "search_mode": request.search_mode,
+        "ef_search": request.ef_search,
+        "session": bool(request.session_id or request.new_session),
+        "ids": [doc["id"] for doc in result.get("retrieved_docs", [])],
+        "timings": result.get("timings", {})
+    })
+
+
+@app.delete("/api/sessions/{session_id}")
+async def end_session(session_id: str, http_request: Request):
+    """End a chat session."""
+    tenant = _request_tenant(http_request)
+    if not rag.end_session(session_id, tenant=tenant):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return {"status": "success", "session_id": session_id}
+
+
+@app.post("/api/prefetch")
+def prefetch(request: PrefetchRequest, http_request: Request):
+    """Warm retrieval for a question that is still being typed.
+    
+    The web UI calls this on debounced keystrokes; a following /api/query
+    with the same settings reuses the prefetched candidates. Defined as a
+    sync endpoint so frequent prefetches run in the thread pool.
+    """
+    tenant = _request_tenant(http_request)
+    try:
+        return rag.prefetch(
+            request.question,
+            top_k=request.top_k,
+            source_filter=request.source_filter,
+            ef_search=request.ef_search,
+            search_mode=request.search_mode,
+            tenant=tenant,
+            metadata_filter=request.filters.to_filter() if request.filters else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/tenants")
+async def get_tenants():
+    """List tenants and which of them currently have an open store."""
+    return {
+        "tenants": list_tenants(),
+        "open": rag.tenants.open_tenants(),
+        "max_open": rag.tenants.max_open
+    }
+
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request):
+    """Download a stored request profile (.pstats or collapsed stacks)."""
+    token = http_request.headers.get("X-Admin-Token")
+    try:
+        path = get_profile_path(profile_id, token)
+    except ProfilingError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=config.API_HOST, port=config.API_PORT)
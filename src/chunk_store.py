@@ -0,0 +1,239 @@
+"""Compressed external storage for chunk text.
+
+Chunk texts are kept out of ChromaDB. Each source gets a block file of
+zlib-compressed blocks (several chunks per block) that is appended to, or
+rewritten when the source is replaced. A small SQLite index maps chunk ID ->
+(source, block offset, block length, position) and doubles as the
+per-source chunk-ID index used for targeted deletes.
+Reads memory-map the block files and decompress each needed block once, so
+the texts for a whole top-k result set are fetched in a single batch.
+"""
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import src.config as config
+
+
+class ChunkStore:
+    """Stores chunk text in compressed per-source block files."""
+
+    def __init__(self, directory: Path, block_chunks: int = None, compression_level: int = None):
+        self.directory = Path(directory)
+        self.blocks_dir = self.directory / "blocks"
+        self.blocks_dir.mkdir(parents=True, exist_ok=True)
+        self.block_chunks = block_chunks or config.CHUNK_STORE_BLOCK_CHUNKS
+        self.compression_level = compression_level if compression_level is not None else config.CHUNK_STORE_COMPRESSION_LEVEL
+
+        self._lock = threading.Lock()
+        self._maps: Dict[str, Tuple[mmap.mmap, Tuple[int, int]]] = {}
+        self._db = sqlite3.connect(str(self.directory / "index.sqlite3"), check_same_thread=False)
+        # WAL lets reader processes query the index while a writer commits
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source_key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                file_path TEXT
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                source_key TEXT NOT NULL,
+                block_offset INTEGER NOT NULL,
+                block_length INTEGER NOT NULL,
+                position INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_source ON chunks (source_key);
+        """)
+
+    @staticmethod
+    def source_key(source: str) -> str:
+        """Stable, filesystem-safe key for a source name."""
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+    def _block_path(self, source_key: str) -> Path:
+        return self.blocks_dir / f"{source_key}.blk"
+
+    def _write_blocks(self, f, key: str, chunks: List[Dict[str, Any]]) -> List[tuple]:
+        """Write chunks as compressed blocks at the end of `f`; return index rows."""
+        rows = []
+        offset = f.tell()
+        for start in range(0, len(chunks), self.block_chunks):
+            block = chunks[start:start + self.block_chunks]
+            payload = zlib.compress(
+                json.dumps([c["text"] for c in block]).encode("utf-8"),
+                self.compression_level
+            )
+            f.write(payload)
+            for position, chunk in enumerate(block):
+                rows.append((chunk["id"], key, offset, len(payload), position))
+            offset += len(payload)
+        return rows
+
+    def _record_source(self, key: str, source: str, chunks: List[Dict[str, Any]]) -> None:
+        file_path = chunks[0]["metadata"].get("file_path") if chunks else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO sources (source_key, source, file_path) VALUES (?, ?, ?)",
+            (key, source, file_path)
+        )
+
+    def put(self, chunks: List[Dict[str, Any]]) -> None:
+        """Append chunk texts, grouped into compressed blocks per source."""
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk["metadata"].get("source", ""), []).append(chunk)
+
+        with self._lock:
+            for source, source_chunks in by_source.items():
+                key = self.source_key(source)
+                with open(self._block_path(key), "ab") as f:
+                    rows = self._write_blocks(f, key, source_chunks)
+                self._record_source(key, source, source_chunks)
+                self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+                # File grew, so any cached mapping is stale
+                self._close_map(key)
+            self._db.commit()
+
+    def replace_source(self, source: str, chunks: List[Dict[str, Any]]) -> None:
+        """Replace all stored chunks of a source, rewriting its block file."""
+        if not chunks:
+            self.delete_source(source)
+            return
+        key = self.source_key(source)
+        path = self._block_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                rows = self._write_blocks(f, key, chunks)
+            self._close_map(key)
+            os.replace(tmp_path, path)
+            self._db.execute("DELETE FROM chunks WHERE source_key = ?", (key,))
+            self._record_source(key, source, chunks)
+            self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def delete_source(self, source: str) -> None:
+        """Remove all stored chunks of a source."""
+        key = self.source_key(source)
+        with self._lock:
+            self._close_map(key)
+            self._block_path(key).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM chunks WHERE source_key = ?", (key,))
+            self._db.execute("DELETE FROM sources WHERE source_key = ?", (key,))
+            self._db.commit()
+
+    def get_chunk_ids(self, source: str) -> List[str]:
+        """Return the IDs of all stored chunks of a source."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunk_id FROM chunks WHERE source_key = ?", (self.source_key(source),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_sources(self) -> List[str]:
+        """Return all source names with stored chunks."""
+        with self._lock:
+            rows = self._db.execute("SELECT source FROM sources").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        """Return the number of stored chunks."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, str]:
+        """Fetch texts for many chunk IDs, decompressing each block once."""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return {}
+        try:
+            return self._read_many(chunk_ids)
+        except (OSError, zlib.error, ValueError, IndexError):
+            # Another process replaced a block file between our index read
+            # and the file read; the second attempt sees a consistent state
+            return self._read_many(chunk_ids)
+
+    def _read_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        with self._lock:
+            rows = []
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(
+                    f"SELECT chunk_id, source_key, block_offset, block_length, position "
+                    f"FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall())
+
+            texts = {}
+            blocks: Dict[tuple, List[str]] = {}
+            for chunk_id, key, offset, length, position in rows:
+                block_key = (key, offset)
+                if block_key not in blocks:
+                    data = self._get_map(key)[offset:offset + length]
+                    blocks[block_key] = json.loads(zlib.decompress(data).decode("utf-8"))
+                texts[chunk_id] = blocks[block_key][position]
+        return texts
+
+    def get_file_paths(self, sources: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Return the stored file path for each source."""
+        keys = {self.source_key(s): s for s in set(sources)}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT source_key, file_path FROM sources WHERE source_key IN ({placeholders})",
+                list(keys)
+            ).fetchall()
+        return {keys[key]: file_path for key, file_path in rows}
+
+    def _get_map(self, source_key: str) -> mmap.mmap:
+        """Return a (cached) read-only memory map of a source's block file.
+
+        The mapping is revalidated against the file's inode and size, so
+        appends or rewrites made by another process are picked up.
+        """
+        path = self._block_path(source_key)
+        stat = os.stat(path)
+        cached = self._maps.get(source_key)
+        if cached is not None and cached[1] == (stat.st_ino, stat.st_size):
+            return cached[0]
+        self._close_map(source_key)
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[source_key] = (mapped, (stat.st_ino, stat.st_size))
+        return mapped
+
+    def _close_map(self, source_key: str) -> None:
+        cached = self._maps.pop(source_key, None)
+        if cached is not None:
+            cached[0].close()
+
+    def clear(self) -> None:
+        """Remove all stored chunk texts."""
+        with self._lock:
+            for key in list(self._maps):
+                self._close_map(key)
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM sources")
+            self._db.commit()
+            for path in self.blocks_dir.glob("*.blk"):
+                path.unlink()
+
+    def close(self) -> None:
+        """Close memory maps and the index database."""
+        with self._lock:
+            for key in list(self._maps):
+                self._close_map(key)
+            self._db.close()
+    
+    def size_bytes(self) -> int:
+        """Total on-disk size of the block files."""
+        return sum(p.stat().st_size for p in self.blocks_dir.glob("*.blk"))
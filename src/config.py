@@ -8,11 +8,13 @@ BASE_DIR = Path(__file__).parent.parent
 DOCS_DIR = BASE_DIR / "docs"
 CHROMA_DB_DIR = BASE_DIR / "chroma_db"
 CONFIG_DIR = BASE_DIR / "config"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(BASE_DIR / "profiles")))
 
 # Create directories if they don't exist
 DOCS_DIR.mkdir(exist_ok=True)
 CHROMA_DB_DIR.mkdir(exist_ok=True)
 CONFIG_DIR.mkdir(exist_ok=True)
+PROFILE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Embedding model
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
@@ -20,12 +22,22 @@ EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 # ChromaDB settings
 CHROMA_COLLECTION_NAME = "rag_kb"
 
+# Multi-tenancy: requests select a tenant with the X-Tenant header (or ?tenant=).
+# The default tenant uses the collection above; every other tenant gets its own
+# collection under TENANTS_DIR and its uploaded files under TENANT_DOCS_DIR.
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+TENANTS_DIR = CHROMA_DB_DIR / "tenants"
+TENANT_DOCS_DIR = BASE_DIR / "tenant_docs"
+MAX_OPEN_TENANTS = int(os.getenv("MAX_OPEN_TENANTS", "32"))  # Open tenant stores kept in the LRU
+
 # LLM Provider Selection (ollama or huggingface)
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "huggingface")  # Default to Hugging Face for deployment
 
 # Ollama settings (if using Ollama)
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+# How long Ollama keeps the model (and a session's cached prompt prefix) loaded
+OLLAMA_SESSION_KEEP_ALIVE = os.getenv("OLLAMA_SESSION_KEEP_ALIVE", "30m")
 
 # Hugging Face settings (if using Hugging Face)
 HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2")
@@ -35,12 +47,141 @@ HF_API_KEY = os.getenv("HF_API_KEY", "")  # Get from https://huggingface.co/sett
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
+# Small-to-big retrieval: embed and search small child chunks, then send the
+# LLM their CHUNK_SIZE parent windows. Changing this requires re-ingesting.
+HIERARCHICAL_CHUNKING = os.getenv("HIERARCHICAL_CHUNKING", "false").lower() == "true"
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "128"))  # Words per child chunk
+CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "16"))
+
+# Uploads are hashed, written to disk and (for TXT/MD) chunked in one pass
+# while the request body arrives. Up to UPLOAD_BUFFER_KB of the body is held
+# in memory before it is processed; reading pauses until then (backpressure).
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_BUFFER_BYTES = int(os.getenv("UPLOAD_BUFFER_KB", "1024")) * 1024
+
+# Extracted-text cache (PDF text keyed by content hash, reused when rechunking)
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+TEXT_CACHE_DIR = Path(os.getenv("TEXT_CACHE_DIR", str(BASE_DIR / "text_cache")))
+
+# Chunk text store settings (texts are kept outside ChromaDB)
+CHUNK_STORE_BLOCK_CHUNKS = int(os.getenv("CHUNK_STORE_BLOCK_CHUNKS", "8"))  # Chunks per compressed block
+CHUNK_STORE_COMPRESSION_LEVEL = int(os.getenv("CHUNK_STORE_COMPRESSION_LEVEL", "6"))  # zlib level
+
+# Chat sessions (session_id on /api/query). Follow-ups only send chunks the
+# model has not seen yet; Ollama continues from its returned token context,
+# other backends get the last SESSION_HISTORY_TURNS turns resent.
+SESSION_DB_PATH = BASE_DIR / "sessions" / "sessions.sqlite3"
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "4"))
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("SESSION_MAX_CONTEXT_TOKENS", "6000"))
+
 # Retrieval settings
 TOP_K = 5
 
+# Search mode: "dense" (embeddings only), "lexical" (BM25 only) or "hybrid"
+# (both, fused with reciprocal rank fusion). In lexical and hybrid mode,
+# identifier-like queries such as error codes or config keys try BM25 first.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "dense")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # Candidates per retriever before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Query terms found in more than this fraction of chunks are skipped (if other terms remain)
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))
+
+# Filtered searches resolve source/file_type/page/ingest-date filters to a
+# candidate set with the in-memory metadata index first; sets up to this size are
+# searched exactly by brute force instead of through the HNSW index.
+FILTER_BRUTE_FORCE_MAX = int(os.getenv("FILTER_BRUTE_FORCE_MAX", "2000"))
+
+# Rerank stage: retrieve RERANK_CANDIDATES chunks, rerank them and pass only
+# top_k to the LLM. "mmr" balances relevance and diversity over the stored
+# embeddings; "cross-encoder" scores (question, chunk) pairs with RERANK_MODEL.
+# Fewer candidates are reranked (or none) when the estimated time would
+# exceed RERANK_BUDGET_MS (0 = no cap).
+RERANK_MODE = os.getenv("RERANK_MODE", "none")  # none, mmr or cross-encoder
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "2048"))
+
+# Compressed vector index: "none" (Chroma HNSW), "float16", "int8" or "binary".
+# Compressed codes are scanned in RAM and the shortlist (top_k * rerank factor)
+# is reranked exactly on full-precision vectors memory-mapped from disk.
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none")
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "0")) or None  # Default per mode: 2 / 4 / 10
+
+# Speculative retrieval while the user types (/api/prefetch). The final query
+# reuses prefetched results for the same question, or re-ranks the prefetched
+# candidates when its embedding is at least PREFETCH_SIMILARITY (cosine) close.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "8"))
+PREFETCH_CANDIDATES = int(os.getenv("PREFETCH_CANDIDATES", "20"))
+PREFETCH_SIMILARITY = float(os.getenv("PREFETCH_SIMILARITY", "0.9"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "1024"))
+
+# Query log: /api/query appends one NDJSON record per query (question,
+# filters, top_k, retrieved chunk IDs, stage timings) from a background
+# thread. Segments rotate at QUERY_LOG_SEGMENT_MB and are gzipped; only the
+# newest QUERY_LOG_MAX_SEGMENTS gzipped segments are kept (open ones are never
+# pruned). replay_queries.py replays the log.
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+QUERY_LOG_DIR = Path(os.getenv("QUERY_LOG_DIR", str(BASE_DIR / "query_log")))
+QUERY_LOG_SEGMENT_BYTES = int(float(os.getenv("QUERY_LOG_SEGMENT_MB", "16")) * 1024 * 1024)
+QUERY_LOG_MAX_SEGMENTS = int(os.getenv("QUERY_LOG_MAX_SEGMENTS", "50"))
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))  # Records beyond this are dropped
+# Startup warming: the QUERY_LOG_WARM_QUERIES most frequent questions of the
+# last QUERY_LOG_WARM_HOURS are retrieved into the retrieval cache, where they
+# stay for QUERY_LOG_WARM_TTL_SECONDS (0 disables warming)
+QUERY_LOG_WARM_QUERIES = int(os.getenv("QUERY_LOG_WARM_QUERIES", "100"))
+QUERY_LOG_WARM_HOURS = float(os.getenv("QUERY_LOG_WARM_HOURS", "24"))
+QUERY_LOG_WARM_TTL_SECONDS = float(os.getenv("QUERY_LOG_WARM_TTL_SECONDS", "900"))
+
+# HNSW index parameters (unset = Chroma defaults). M and construction_ef only
+# apply when a collection is created; search_ef can also be overridden per query.
+# Use tune_hnsw.py to pick values for a target recall.
+HNSW_M = int(os.getenv("HNSW_M", "0")) or None
+HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", "0")) or None
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "0")) or None
+
 # API settings
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 # Railway provides PORT env var, fallback to 8000
 API_PORT = int(os.getenv("PORT", os.getenv("API_PORT", "8000")))
 
+# HTTP layer: the web UI is served from STATIC_DIR, precompressed at startup;
+# API responses of at least API_COMPRESSION_MIN_BYTES are gzipped on the fly
+# when the client accepts it
+STATIC_DIR = BASE_DIR / "static"
+API_COMPRESSION_MIN_BYTES = int(os.getenv("API_COMPRESSION_MIN_BYTES", "1000"))
+
+# Deployment mode: with QUERY_WORKERS > 1, main.py starts one writer process
+# (ingestion/deletes) and N read-only query workers sharing the API port
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "1"))
+SERVER_ROLE = os.getenv("SERVER_ROLE", "single")  # single, writer or reader (set by main.py)
+WRITER_HOST = os.getenv("WRITER_HOST", "127.0.0.1")
+WRITER_PORT = int(os.getenv("WRITER_PORT", str(API_PORT + 1)))
+WRITER_URL = os.getenv("WRITER_URL", f"http://{WRITER_HOST}:{WRITER_PORT}")
+
+# Sharding: partition chunks across N collections by source hash. Set
+# VECTOR_SHARD_ADDRESSES (host:port,...) to use shards served by separate
+# processes (python -m src.sharded_store serve ...)
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+VECTOR_SHARD_ADDRESSES = [a for a in os.getenv("VECTOR_SHARD_ADDRESSES", "").split(",") if a.strip()]
+# Shard connections unpickle what they receive, so anyone holding the key can
+# run code in the shard process: there is no default, set a long random secret
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", "")
+
+# Index snapshots: loaded at startup when the index is empty
+SNAPSHOT_PATH = Path(os.getenv("SNAPSHOT_PATH", str(BASE_DIR / "snapshots" / "knowledge_base.snap")))
+SNAPSHOT_AUTOLOAD = os.getenv("SNAPSHOT_AUTOLOAD", "true").lower() == "true"
 
+# Profiling settings
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")  # Required for on-demand profiling
+PROFILE_DEFAULT_MODE = os.getenv("PROFILE_DEFAULT_MODE", "cprofile")  # cprofile or sample
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fraction of requests always profiled
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
@@ -0,0 +1,123 @@
+"""Single-writer / multi-reader deployment.
+
+The parent process loads the embedding model once, then forks:
+
+- one writer process that owns all index writes (ingest, delete), listening
+  on WRITER_HOST:WRITER_PORT
+- QUERY_WORKERS read-only query workers sharing the public API socket;
+  they forward writes to the writer and reopen the index when the writer
+  bumps its generation file
+
+Forking after the model is loaded lets every worker share the weights
+copy-on-write instead of loading its own copy.
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+
+import src.config as config
+
+
+def _serve(role: str, sockets=None, host: str = None, port: int = None) -> None:
+    """Run the API app in this (child) process with the given role."""
+    os.environ["SERVER_ROLE"] = role
+    config.SERVER_ROLE = role
+    # Importing the app builds the RAG pipeline, so it must happen after the role is set
+    from src.api import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="info"))
+    server.run(sockets=sockets)
+
+
+def _spawn(role: str, sock: socket.socket = None) -> int:
+    """Fork a writer or reader process and return its PID."""
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    exit_code = 0
+    try:
+        if role == "writer":
+            _serve(role, host=config.WRITER_HOST, port=config.WRITER_PORT)
+        else:
+            _serve(role, sockets=[sock])
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def _wait_for_writer(timeout: float = 120.0) -> None:
+    """Block until the writer accepts connections (it creates the collection)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((config.WRITER_HOST, config.WRITER_PORT), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    print(f"Warning: writer did not start listening within {timeout:.0f}s")
+
+
+def run(query_workers: int = None) -> None:
+    """Start the writer and query workers and supervise them."""
+    query_workers = query_workers or config.QUERY_WORKERS
+
+    # Preload shared state before forking, then freeze it so the garbage
+    # collector does not touch (and un-share) those pages in the children
+    from src.vector_store import get_embedding_model
+    get_embedding_model()
+    if config.RERANK_MODE == "cross-encoder":
+        from src.reranker import get_cross_encoder
+        get_cross_encoder()
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((config.API_HOST, config.API_PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {_spawn("writer"): "writer"}
+    _wait_for_writer()
+    for _ in range(query_workers):
+        children[_spawn("reader", sock)] = "reader"
+    print(f"Started 1 writer and {query_workers} query worker(s)")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Restart any worker that dies until we are asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        role = children.pop(pid, None)
+        if role is None or stopping:
+            continue
+        print(f"{role} process {pid} exited with status {status}, restarting")
+        children[_spawn(role, sock)] = role
@@ -1,36 +1,69 @@
 """Document ingestion and chunking."""
+import bisect
 import hashlib
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import PyPDF2
+from src.text_cache import ExtractedTextCache, file_hash, normalize_page
+
+# Bump when PDF extraction or page normalization changes so cached text is invalidated
+EXTRACTOR_VERSION = f"pypdf2_{PyPDF2.__version__}_n1"
+
+TEXT_SUFFIXES = (".txt", ".md")
 
 
 class DocumentChunker:
     """Handles document ingestion and chunking."""
     
-    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50):
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50,
+                 text_cache: Optional[ExtractedTextCache] = None,
+                 child_chunk_size: int = 0, child_chunk_overlap: int = 0):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.text_cache = text_cache
+        # A child size of 0 disables hierarchical (small-to-big) chunking
+        if child_chunk_size and not 0 <= child_chunk_overlap < child_chunk_size:
+            raise ValueError("Child chunk overlap must be smaller than the child chunk size")
+        self.child_chunk_size = child_chunk_size
+        self.child_chunk_overlap = child_chunk_overlap
     
-    def load_document(self, file_path: Path) -> str:
+    def load_document(self, file_path: Path, content_hash: Optional[str] = None) -> str:
         """Load document content from file."""
         suffix = file_path.suffix.lower()
         
         if suffix == ".pdf":
-            return self._load_pdf(file_path)
-        elif suffix in [".txt", ".md"]:
+            return self._load_pdf(file_path, content_hash)
+        elif suffix in TEXT_SUFFIXES:
             return self._load_text(file_path)
         else:
             raise ValueError(f"Unsupported file type: {suffix}")
     
-    def _load_pdf(self, file_path: Path) -> str:
-        """Extract text from PDF file."""
-        text = []
+    def _load_pdf(self, file_path: Path, content_hash: Optional[str] = None) -> str:
+        """Extract text from PDF file, using the extracted-text cache if enabled."""
+        return "\n".join(self.load_pdf_pages(file_path, content_hash))
+    
+    def load_pdf_pages(self, file_path: Path, content_hash: Optional[str] = None) -> List[str]:
+        """Return normalized page texts of a PDF, from cache when possible.
+        
+        Pass `content_hash` (SHA-256 of the file) when it is already known to
+        avoid reading the file an extra time.
+        """
+        if self.text_cache is not None:
+            content_hash = content_hash or file_hash(file_path)
+            pages = self.text_cache.get(content_hash)
+            if pages is not None:
+                return pages
+        
+        pages = []
         with open(file_path, "rb") as f:
             pdf_reader = PyPDF2.PdfReader(f)
             for page in pdf_reader.pages:
-                text.append(page.extract_text())
-        return "\n".join(text)
+                pages.append(normalize_page(page.extract_text()))
+        
+        if self.text_cache is not None:
+            self.text_cache.put(content_hash, pages)
+        return pages
     
     def _load_text(self, file_path: Path) -> str:
         """Load text from plain text or markdown file."""
@@ -69,18 +102,152 @@ class DocumentChunker:
         
         return chunks
     
-    def _generate_chunk_id(self, text: str, source: str, chunk_index: int) -> str:
-        """Generate unique ID for chunk."""
-        content = f"{source}:{chunk_index}:{text[:100]}"
+    def _generate_chunk_id(self, text: str, source: str, chunk_index: int, level: str = "") -> str:
+        """Generate unique ID for chunk.
+        
+        The full text is hashed so an unchanged ID means unchanged content,
+        which lets re-ingestion skip re-embedding. Hierarchical chunks also
+        hash their level, so a parent never reuses the ID of the identical
+        flat chunk (which is indexed, while a parent is not).
+        """
+        content = f"{source}:{chunk_index}:{text}"
+        if level:
+            content = f"{level}:{content}"
         return hashlib.md5(content.encode()).hexdigest()
     
-    def process_file(self, file_path: Path) -> List[Dict[str, Any]]:
-        """Process a file and return chunks."""
-        text = self.load_document(file_path)
-        metadata = {
+    def add_child_chunks(self, parents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return parent chunks plus the small child chunks that get embedded.
+        
+        Children are `child_chunk_size`-word windows over the document's words
+        (reassembled from the overlapping parents). Each belongs to the parent
+        containing its middle word, which follows from word offsets alone, and
+        records that parent's ID and index. Parents are marked with
+        chunk_level "parent": they are stored for the prompt but not indexed.
+        Without a child size the chunks are returned unchanged.
+        """
+        if not self.child_chunk_size or not parents:
+            return parents
+        step = self.chunk_size - self.chunk_overlap
+        words = parents[0]["text"].split()
+        for parent in parents[1:]:
+            words.extend(parent["text"].split()[self.chunk_overlap:])
+        for parent in parents:
+            metadata = parent["metadata"]
+            parent["id"] = self._generate_chunk_id(parent["text"], metadata.get("source", ""),
+                                                   metadata["chunk_index"], level="parent")
+            metadata.update(chunk_level="parent", word_start=metadata["chunk_index"] * step)
+        
+        children = []
+        start = 0
+        while True:
+            child_words = words[start:start + self.child_chunk_size]
+            middle = start + len(child_words) // 2
+            parent = parents[min(middle // step, len(parents) - 1)]
+            child_text = " ".join(child_words)
+            children.append({
+                # Keyed by the parent's ID, so a child is re-indexed when its parent changes
+                "id": self._generate_chunk_id(child_text, parent["id"], len(children), level="child"),
+                "text": child_text,
+                "metadata": {
+                    **parent["metadata"],
+                    "chunk_level": "child",
+                    "chunk_index": len(children),
+                    "word_start": start,
+                    "parent_id": parent["id"],
+                    "parent_index": parent["metadata"]["chunk_index"]
+                }
+            })
+            if start + self.child_chunk_size >= len(words):
+                break
+            start += self.child_chunk_size - self.child_chunk_overlap
+        return parents + children
+    
+    def file_metadata(self, file_path: Path) -> Dict[str, Any]:
+        """Metadata shared by all chunks of a file."""
+        return {
             "source": str(file_path.name),
             "file_path": str(file_path),
-            "file_type": file_path.suffix.lower()
+            "file_type": file_path.suffix.lower(),
+            "ingested_at": int(time.time())
         }
-        return self.chunk_text(text, metadata)
+    
+    def process_file(self, file_path: Path, content_hash: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Process a file and return chunks."""
+        if file_path.suffix.lower() == ".pdf":
+            pages = self.load_pdf_pages(file_path, content_hash)
+            chunks = self.add_child_chunks(self.chunk_text("\n".join(pages), self.file_metadata(file_path)))
+            self._add_page_ranges(chunks, pages)
+            return chunks
+        text = self.load_document(file_path, content_hash)
+        return self.add_child_chunks(self.chunk_text(text, self.file_metadata(file_path)))
+    
+    def _add_page_ranges(self, chunks: List[Dict[str, Any]], pages: List[str]) -> None:
+        """Record the 1-based first and last PDF page each chunk's words come from."""
+        page_starts = []
+        words = 0
+        for page in pages:
+            page_starts.append(words)
+            words += len(page.split())
+        step = self.chunk_size - self.chunk_overlap
+        for chunk in chunks:
+            metadata = chunk["metadata"]
+            first_word = metadata.get("word_start", metadata["chunk_index"] * step)
+            size = self.child_chunk_size if metadata.get("chunk_level") == "child" else self.chunk_size
+            last_word = min(first_word + size, words) - 1
+            metadata["page_start"] = bisect.bisect_right(page_starts, first_word)
+            metadata["page_end"] = bisect.bisect_right(page_starts, last_word)
+
+
+class StreamingTextChunker:
+    """Incremental `DocumentChunker.chunk_text` for text that arrives in pieces.
+    
+    Produces the same chunks (and chunk IDs) as chunking the whole text at
+    once, while holding only the words of the current window.
+    """
+    
+    def __init__(self, chunker: DocumentChunker, metadata: Dict[str, Any]):
+        self.chunker = chunker
+        self.metadata = metadata
+        self.chunks: List[Dict[str, Any]] = []
+        self._words: List[str] = []
+        self._carry = ""  # Trailing word that may continue in the next piece
+    
+    def feed(self, text: str) -> None:
+        """Add the next piece of text, emitting every chunk that is complete."""
+        text = self._carry + text
+        words = text.split()
+        self._carry = words.pop() if words and not text[-1].isspace() else ""
+        self._words.extend(words)
+        self._emit_full_windows()
+    
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush the last window and return all chunks."""
+        if self._carry:
+            self._words.append(self._carry)
+            self._carry = ""
+        self._emit_full_windows()
+        if self._words:
+            self._add_chunk(self._words)
+            self._words = []
+        return self.chunker.add_child_chunks(self.chunks)
+    
+    def _emit_full_windows(self) -> None:
+        # A window is final once words beyond it exist, as in chunk_text
+        size = self.chunker.chunk_size
+        step = self.chunker.chunk_size - self.chunker.chunk_overlap
+        start = 0
+        while len(self._words) - start > size:
+            self._add_chunk(self._words[start:start + size])
+            start += step
+        if start:
+            del self._words[:start]
+    
+    def _add_chunk(self, words: List[str]) -> None:
+        chunk_index = len(self.chunks)
+        chunk_text = " ".join(words)
+        self.chunks.append({
+            "id": self.chunker._generate_chunk_id(chunk_text, self.metadata.get("source", ""), chunk_index),
+            "text": chunk_text,
+            "metadata": {**self.metadata, "chunk_index": chunk_index}
+        })
 
@@ -0,0 +1,431 @@
+"""BM25 inverted index for lexical and hybrid retrieval.
+
+Embedding search is weak on exact identifiers (error codes, SKUs, config
+keys). This index keeps a persistent BM25 inverted index next to the vector
+store so such queries can be answered lexically, or fused with the dense
+results using reciprocal rank fusion.
+
+Postings are stored per term in SQLite as zlib-compressed varint runs of
+(doc gap, term frequency, doc length), so a query only reads and decodes the
+postings of its own terms. Each indexed batch appends one postings block per
+term; trailing blocks of similar size are merged (like a binary counter), so
+a term has O(log n) blocks and adding never rewrites a term's full postings.
+A per-document term list makes deletes exact.
+
+Queries skip stopwords, and terms found in more than BM25_MAX_DF_RATIO of the
+chunks when other query terms remain; their postings are the largest to
+decode and barely move the ranking.
+"""
+import heapq
+import math
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import src.config as config
+
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+
+# Words plus identifier-style runs joined by . - : / # (e.g. "err-1042", "db.pool_size")
+_TOKEN_RE = re.compile(r"\w+(?:[.\-:/#]\w+)*")
+_PART_RE = re.compile(r"[.\-:/#_]+")
+_IDENTIFIER_RE = re.compile(r"^\w+(?:[.\-:/#]\w+)*$")
+MAX_TOKEN_LENGTH = 64
+# Very common terms are only skipped once they occur in at least this many chunks
+HIGH_DF_MIN_DOCS = 1000
+
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had
+has have how i if in into is it its may more most no not of on or other our should so some such
+than that the their them then there these they this those to was we were what when where which
+who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; identifiers are kept whole and also split into their parts."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()[:MAX_TOKEN_LENGTH]
+        tokens.append(token)
+        parts = [part for part in _PART_RE.split(token) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier_query(query: str) -> bool:
+    """True for quoted phrases and single identifier-like tokens (codes, keys, SKUs)."""
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] == '"':
+        return True
+    if not _IDENTIFIER_RE.match(query):
+        return False
+    # Plain words go through dense search; identifiers have digits, separators or inner capitals
+    return (any(c.isdigit() for c in query) or bool(_PART_RE.search(query))
+            or any(c.isupper() for c in query[1:]))
+
+
+def _encode_postings(postings: List[Tuple[int, int, int]]) -> bytes:
+    """Encode sorted (doc_num, tf, doc_length) postings as compressed delta varints."""
+    out = bytearray()
+    previous = 0
+    for doc_num, tf, length in postings:
+        for value in (doc_num - previous, tf, length):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = doc_num
+    return zlib.compress(bytes(out), 6)
+
+
+def _decode_postings(blob: bytes) -> List[Tuple[int, int, int]]:
+    """Inverse of `_encode_postings`."""
+    data = zlib.decompress(blob)
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    postings = []
+    doc_num = 0
+    for i in range(0, len(values), 3):
+        doc_num += values[i]
+        postings.append((doc_num, values[i + 1], values[i + 2]))
+    return postings
+
+
+class LexicalIndex:
+    """Persistent BM25 inverted index over chunk texts."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "index.sqlite3"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        # WAL lets reader processes search while a writer commits
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_num INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_id TEXT UNIQUE NOT NULL,
+                source TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                terms BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_by_source ON docs (source);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings_blocks (
+                block_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                term TEXT NOT NULL,
+                df INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS postings_blocks_by_term ON postings_blocks (term, block_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._migrate_postings()
+
+    def _migrate_postings(self) -> None:
+        """Move postings of older indexes (one blob per term) into blocks."""
+        if not self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'postings'"
+        ).fetchone():
+            return
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO terms (term, df) SELECT term, df FROM postings")
+            self._db.execute("INSERT INTO postings_blocks (term, df, data) SELECT term, df, data FROM postings")
+            self._db.execute("DROP TABLE postings")
+
+    def _select_in(self, query: str, values: List[Any]) -> Iterable[tuple]:
+        """Run `query` (with one `{}` for the IN list) over `values` in batches."""
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            yield from self._db.execute(query.format(",".join("?" * len(batch))), batch)
+
+    def _fetch_postings(self, terms: Iterable[str]) -> Dict[str, List[Tuple[int, int, int]]]:
+        result: Dict[str, List[Tuple[int, int, int]]] = {}
+        # Blocks hold increasing doc numbers, so concatenating them in order keeps postings sorted
+        for term, data in self._select_in(
+            "SELECT term, data FROM postings_blocks WHERE term IN ({}) ORDER BY term, block_id", list(terms)
+        ):
+            result.setdefault(term, []).extend(_decode_postings(data))
+        return result
+
+    def _append_postings(self, postings: Dict[str, List[Tuple[int, int, int]]]) -> None:
+        """Append one block per term and merge the trailing blocks that grew alike."""
+        self._db.executemany(
+            "INSERT INTO postings_blocks (term, df, data) VALUES (?, ?, ?)",
+            [(term, len(entries), _encode_postings(entries)) for term, entries in postings.items()]
+        )
+        self._db.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            [(term, len(entries)) for term, entries in postings.items()]
+        )
+        blocks: Dict[str, List[Tuple[int, int]]] = {}
+        for term, block_id, df in self._select_in(
+            "SELECT term, block_id, df FROM postings_blocks WHERE term IN ({}) ORDER BY term, block_id",
+            list(postings)
+        ):
+            blocks.setdefault(term, []).append((block_id, df))
+        for term_blocks in blocks.values():
+            # Merge while the block before the tail is at most twice the tail's size
+            merge = 1
+            tail_df = term_blocks[-1][1]
+            while merge < len(term_blocks) and term_blocks[-merge - 1][1] <= 2 * tail_df:
+                merge += 1
+                tail_df += term_blocks[-merge][1]
+            if merge > 1:
+                self._merge_blocks([block_id for block_id, _ in term_blocks[-merge:]])
+
+    def _merge_blocks(self, block_ids: List[int]) -> None:
+        entries = []
+        for (data,) in self._select_in(
+            "SELECT data FROM postings_blocks WHERE block_id IN ({}) ORDER BY block_id", block_ids
+        ):
+            entries.extend(_decode_postings(data))
+        self._db.execute("UPDATE postings_blocks SET df = ?, data = ? WHERE block_id = ?",
+                         (len(entries), _encode_postings(entries), block_ids[0]))
+        self._db.executemany("DELETE FROM postings_blocks WHERE block_id = ?", [(b,) for b in block_ids[1:]])
+
+    def _add_stats(self, docs: int, length: int) -> None:
+        self._db.executemany(
+            "INSERT INTO stats (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            [("docs", docs), ("length", length)]
+        )
+
+    def add(self, chunks: List[Dict[str, Any]]) -> None:
+        """Index chunk texts (chunks already indexed are skipped)."""
+        if not chunks:
+            return
+        with self._lock:
+            existing = self._existing_ids([chunk["id"] for chunk in chunks])
+            new_postings: Dict[str, List[Tuple[int, int, int]]] = {}
+            added = total_length = 0
+            for chunk in chunks:
+                if chunk["id"] in existing:
+                    continue
+                existing.add(chunk["id"])
+                tokens = tokenize(chunk["text"])
+                frequencies: Dict[str, int] = {}
+                for token in tokens:
+                    frequencies[token] = frequencies.get(token, 0) + 1
+                cursor = self._db.execute(
+                    "INSERT INTO docs (chunk_id, source, length, terms) VALUES (?, ?, ?, ?)",
+                    (chunk["id"], chunk["metadata"].get("source", ""), len(tokens),
+                     zlib.compress("\n".join(frequencies).encode("utf-8")))
+                )
+                for term, tf in frequencies.items():
+                    new_postings.setdefault(term, []).append((cursor.lastrowid, tf, len(tokens)))
+                added += 1
+                total_length += len(tokens)
+
+            # New doc numbers are always larger, so the new blocks go after the existing ones
+            self._append_postings(new_postings)
+            self._add_stats(added, total_length)
+            self._db.commit()
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        """Remove chunks from the index. Returns the number removed."""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return 0
+        with self._lock:
+            rows = []
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(
+                    f"SELECT doc_num, length, terms FROM docs WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall())
+            if not rows:
+                return 0
+
+            removed_by_term: Dict[str, set] = {}
+            for doc_num, _, terms in rows:
+                for term in zlib.decompress(terms).decode("utf-8").split("\n"):
+                    removed_by_term.setdefault(term, set()).add(doc_num)
+            updates, deletes, df_changes = [], [], []
+            for block_id, term, data in self._select_in(
+                "SELECT block_id, term, data FROM postings_blocks WHERE term IN ({})", list(removed_by_term)
+            ):
+                removed = removed_by_term[term]
+                entries = _decode_postings(data)
+                kept = [entry for entry in entries if entry[0] not in removed]
+                if len(kept) == len(entries):
+                    continue
+                if kept:
+                    updates.append((len(kept), _encode_postings(kept), block_id))
+                else:
+                    deletes.append((block_id,))
+                df_changes.append((len(kept) - len(entries), term))
+            self._db.executemany("UPDATE postings_blocks SET df = ?, data = ? WHERE block_id = ?", updates)
+            self._db.executemany("DELETE FROM postings_blocks WHERE block_id = ?", deletes)
+            self._db.executemany("UPDATE terms SET df = df + ? WHERE term = ?", df_changes)
+            self._db.execute("DELETE FROM terms WHERE df <= 0")
+            self._db.executemany("DELETE FROM docs WHERE doc_num = ?", [(row[0],) for row in rows])
+            self._add_stats(-len(rows), -sum(row[1] for row in rows))
+            self._db.commit()
+        return len(rows)
+
+    def _existing_ids(self, chunk_ids: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(row[0] for row in self._db.execute(
+                f"SELECT chunk_id FROM docs WHERE chunk_id IN ({placeholders})", batch
+            ))
+        return existing
+
+    def search(self, query: str, top_k: int, source_filter: Optional[List[str]] = None,
+               allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk_id, BM25 score) pairs for a query.
+        
+        `allowed_ids` restricts results to those chunk IDs (resolved filters).
+        """
+        terms = set(tokenize(query.strip().strip('"'))) - STOPWORDS
+        if not terms:
+            return []
+        k1, b = config.BM25_K1, config.BM25_B
+        with self._lock:
+            stats = dict(self._db.execute("SELECT key, value FROM stats").fetchall())
+            num_docs = stats.get("docs", 0)
+            if not num_docs:
+                return []
+            avg_length = max(stats.get("length", 0) / num_docs, 1.0)
+            dfs = dict(self._select_in("SELECT term, df FROM terms WHERE term IN ({})", list(terms)))
+            if not dfs:
+                return []
+            max_df = max(config.BM25_MAX_DF_RATIO * num_docs, HIGH_DF_MIN_DOCS)
+            selective = [term for term, df in dfs.items() if df <= max_df]
+            postings = self._fetch_postings(selective or [min(dfs, key=dfs.get)])
+
+            allowed = None
+            if source_filter:
+                placeholders = ",".join("?" * len(source_filter))
+                allowed = {row[0] for row in self._db.execute(
+                    f"SELECT doc_num FROM docs WHERE source IN ({placeholders})", list(source_filter)
+                )}
+
+            scores: Dict[int, float] = {}
+            for term, entries in postings.items():
+                df = dfs[term]
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for doc_num, tf, length in entries:
+                    if allowed is not None and doc_num not in allowed:
+                        continue
+                    norm = tf + k1 * (1 - b + b * length / avg_length)
+                    scores[doc_num] = scores.get(doc_num, 0.0) + idf * tf * (k1 + 1) / norm
+
+            if allowed_ids is None:
+                best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+                return self._resolve_chunk_ids(best)
+            # Walk the ranking in batches until enough allowed chunks are found
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for start in range(0, len(ranked), 500):
+                batch = self._resolve_chunk_ids(ranked[start:start + 500])
+                results.extend(hit for hit in batch if hit[0] in allowed_ids)
+                if len(results) >= top_k:
+                    break
+            return results[:top_k]
+    
+    def _resolve_chunk_ids(self, hits: List[Tuple[int, float]]) -> List[Tuple[str, float]]:
+        """Map (doc_num, score) pairs to (chunk_id, score), keeping their order."""
+        if not hits:
+            return []
+        placeholders = ",".join("?" * len(hits))
+        chunk_ids = dict(self._db.execute(
+            f"SELECT doc_num, chunk_id FROM docs WHERE doc_num IN ({placeholders})",
+            [doc_num for doc_num, _ in hits]
+        ).fetchall())
+        return [(chunk_ids[doc_num], score) for doc_num, score in hits if doc_num in chunk_ids]
+
+    def count(self) -> int:
+        """Return the number of indexed chunks."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def clear(self) -> None:
+        """Remove everything from the index."""
+        with self._lock:
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM terms")
+            self._db.execute("DELETE FROM postings_blocks")
+            self._db.execute("DELETE FROM stats")
+            self._db.commit()
+
+    def close(self) -> None:
+        """Close the index database."""
+        with self._lock:
+            self._db.close()
+
+    def size_bytes(self) -> int:
+        """On-disk size of the index (including the WAL)."""
+        return sum(p.stat().st_size for p in self.directory.glob("index.sqlite3*"))
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int,
+                           k: int = None) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists; each doc scores sum(1 / (k + rank))."""
+    k = k or config.RRF_K
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            entry = fused.get(doc["id"])
+            if entry is None:
+                entry = fused[doc["id"]] = {**doc, "score": 0.0}
+            elif entry.get("distance") is None:
+                entry["distance"] = doc.get("distance")
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda doc: doc["score"], reverse=True)[:top_k]
+
+
+def hybrid_search(store, query: str, top_k: int, source_filter: Optional[List[str]] = None,
+                  ef_search: Optional[int] = None, mode: str = None,
+                  query_embedding: Optional[List[float]] = None,
+                  metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Dense, lexical or hybrid (RRF) search against a vector store.
+
+    Identifier-like queries are answered from the lexical index alone when it
+    has matches, without running the embedding model. A precomputed
+    `query_embedding` skips embedding the query.
+    """
+    mode = mode or config.SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}' (expected one of {', '.join(SEARCH_MODES)})")
+
+    filters = {"source_filter": source_filter, "metadata_filter": metadata_filter}
+    if mode != "dense" and is_identifier_query(query):
+        docs = store.lexical_search(query, top_k=top_k, **filters)
+        if docs or mode == "lexical":
+            return docs
+    elif mode == "lexical":
+        return store.lexical_search(query, top_k=top_k, **filters)
+
+    if query_embedding is None:
+        query_embedding = store.embed_query(query)
+    if mode == "dense":
+        return store.search_by_embedding(query_embedding, top_k=top_k, ef_search=ef_search, **filters)
+
+    candidates = max(top_k, config.HYBRID_CANDIDATES)
+    dense = store.search_by_embedding(query_embedding, top_k=candidates, ef_search=ef_search, **filters)
+    lexical = store.lexical_search(query, top_k=candidates, **filters)
+    return reciprocal_rank_fusion([dense, lexical], top_k)
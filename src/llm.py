@@ -1,7 +1,10 @@
 """LLM integration with Ollama."""
 import requests
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from src.metrics import LLM_REQUESTS_TOTAL, LLM_DURATION
+from src.prompts import build_prompt
 import src.config as config
 
 
@@ -16,19 +19,7 @@ class OllamaLLM:
     def generate(self, prompt: str, context: List[str] = None) -> str:
         """Generate response from LLM."""
         # Build context-aware prompt
-        if context:
-            context_text = "\n\n".join([
-                f"[Document {i+1}]: {doc}" 
-                for i, doc in enumerate(context)
-            ])
-            full_prompt = f"""Context from knowledge base:
-{context_text}
-
-Question: {prompt}
-
-Answer the question based on the context provided above. If the answer cannot be found in the context, say so. Cite which document(s) you used in your answer."""
-        else:
-            full_prompt = prompt
+        full_prompt = build_prompt(prompt, context)
         
         # Make request to Ollama
         payload = {
@@ -36,19 +27,48 @@ Answer the question based on the context provided above. If the answer cannot be
             "prompt": full_prompt,
             "stream": False
         }
+        return self._request(payload).get("response", "")
+    
+    def generate_continuation(self, prompt: str,
+                              conversation: Optional[List[int]] = None) -> Tuple[str, List[int]]:
+        """Generate a response that continues an earlier exchange.
         
+        `conversation` is the token context Ollama returned for the previous
+        turn; the prompt only needs the new part of the conversation, and the
+        model (kept loaded via keep_alive) skips re-processing the prefix.
+        Returns the response and the context to pass on the next turn.
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": config.OLLAMA_SESSION_KEEP_ALIVE
+        }
+        if conversation:
+            payload["context"] = conversation
+        result = self._request(payload)
+        return result.get("response", ""), result.get("context") or []
+    
+    def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST to /api/generate and return the decoded response."""
+        start = time.perf_counter()
         try:
             response = requests.post(self.api_url, json=payload, timeout=120)
             response.raise_for_status()
             result = response.json()
-            return result.get("response", "")
+            LLM_REQUESTS_TOTAL.inc(provider="ollama", status="success")
+            return result
         except requests.exceptions.ConnectionError:
+            LLM_REQUESTS_TOTAL.inc(provider="ollama", status="error")
             raise ConnectionError(
                 f"Could not connect to Ollama at {self.base_url}. "
                 f"Please make sure Ollama is running and the model {self.model} is available."
             )
         except requests.exceptions.RequestException as e:
+            LLM_REQUESTS_TOTAL.inc(provider="ollama", status="error")
             raise Exception(f"Error calling Ollama API: {e}")
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - start, provider="ollama")
     
     def check_available(self) -> bool:
         """Check if Ollama is available."""
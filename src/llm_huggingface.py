@@ -1,7 +1,10 @@
 """LLM integration using Hugging Face Inference API."""
 import requests
 import os
-from typing import List, Optional
+import time
+from typing import List, Optional, Sequence, Tuple
+from src.metrics import LLM_REQUESTS_TOTAL, LLM_DURATION
+from src.prompts import build_prompt
 import src.config as config
 
 
@@ -15,22 +18,15 @@ class HuggingFaceLLM:
         if self.api_key:
             self.headers["Authorization"] = f"Bearer {self.api_key}"
     
-    def generate(self, prompt: str, context: List[str] = None) -> str:
-        """Generate response from LLM."""
+    def generate(self, prompt: str, context: List[str] = None,
+                 history: Optional[Sequence[Tuple[str, str]]] = None) -> str:
+        """Generate response from LLM.
+        
+        `history` holds recent (question, answer) turns of a chat session; the
+        Inference API is stateless, so they are resent in the prompt.
+        """
         # Build context-aware prompt
-        if context:
-            context_text = "\n\n".join([
-                f"[Document {i+1}]: {doc}" 
-                for i, doc in enumerate(context)
-            ])
-            full_prompt = f"""Context from knowledge base:
-{context_text}
-
-Question: {prompt}
-
-Answer the question based on the context provided above. If the answer cannot be found in the context, say so. Cite which document(s) you used in your answer."""
-        else:
-            full_prompt = prompt
+        full_prompt = build_prompt(prompt, context, history)
         
         # Make request to Hugging Face API
         payload = {
@@ -42,6 +38,7 @@ Answer the question based on the context provided above. If the answer cannot be
             }
         }
         
+        start = time.perf_counter()
         try:
             response = requests.post(
                 self.api_url,
@@ -53,7 +50,6 @@ Answer the question based on the context provided above. If the answer cannot be
             # Handle model loading (503 status)
             if response.status_code == 503:
                 # Model is loading, wait and retry
-                import time
                 time.sleep(10)
                 response = requests.post(
                     self.api_url,
@@ -64,6 +60,7 @@ Answer the question based on the context provided above. If the answer cannot be
             
             response.raise_for_status()
             result = response.json()
+            LLM_REQUESTS_TOTAL.inc(provider="huggingface", status="success")
             
             # Extract generated text (HF API returns different formats)
             if isinstance(result, list) and len(result) > 0:
@@ -77,6 +74,7 @@ Answer the question based on the context provided above. If the answer cannot be
                 return str(result)
                 
         except requests.exceptions.HTTPError as e:
+            LLM_REQUESTS_TOTAL.inc(provider="huggingface", status="error")
             if e.response.status_code == 503:
                 raise Exception(
                     "Hugging Face model is loading. Please wait a moment and try again. "
@@ -84,7 +82,10 @@ Answer the question based on the context provided above. If the answer cannot be
                 )
             raise Exception(f"Error calling Hugging Face API: {e}")
         except requests.exceptions.RequestException as e:
+            LLM_REQUESTS_TOTAL.inc(provider="huggingface", status="error")
             raise Exception(f"Error calling Hugging Face API: {e}")
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - start, provider="huggingface")
     
     def is_model_available(self) -> bool:
         """Check if Hugging Face API is available."""
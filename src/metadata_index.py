@@ -0,0 +1,364 @@
+"""Metadata filter index.
+
+Every stored chunk gets a dense row number. Sources have many distinct
+values, so each source keeps a sorted array of its rows; file types are few,
+and each keeps a packed bitmap (one bit per row). The range fields
+(page_start/page_end, ingested_at) have one column per row. A filter is
+resolved to the set of matching live rows with a few vectorized operations,
+without querying Chroma, so the search path knows the candidate set and its
+size before any vector search runs.
+
+Rows are persisted in rows.sqlite3 so reader processes load them
+incrementally. Replaced or deleted chunks are tombstoned and the tombstones
+logged, so a refresh only reads new rows and new tombstones. The table is
+rewritten once most rows are dead.
+
+Filters are plain dicts, normalized by `normalize_metadata_filter`:
+
+    file_type          list of suffixes, e.g. [".pdf"]
+    page_from/page_to  chunks overlapping this 1-based page range (PDFs only)
+    ingested_after/ingested_before
+                       Unix timestamps bounding the chunk's ingest time
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+import src.config as config
+
+FILTER_KEYS = ("file_type", "page_from", "page_to", "ingested_after", "ingested_before")
+MISSING = -1
+
+
+
+def normalize_metadata_filter(metadata_filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Drop empty conditions and canonicalize values; None if nothing is filtered."""
+    if not metadata_filter:
+        return None
+    unknown = set(metadata_filter) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown metadata filter field(s): {', '.join(sorted(unknown))}")
+    normalized = {}
+    if metadata_filter.get("file_type"):
+        normalized["file_type"] = sorted({
+            ft.lower() if ft.startswith(".") else f".{ft.lower()}" for ft in metadata_filter["file_type"]
+        })
+    for key in ("page_from", "page_to"):
+        if metadata_filter.get(key) is not None:
+            normalized[key] = int(metadata_filter[key])
+    for key in ("ingested_after", "ingested_before"):
+        if metadata_filter.get(key) is not None:
+            normalized[key] = float(metadata_filter[key])
+    return normalized or None
+
+
+def filter_key(metadata_filter: Optional[Dict[str, Any]]) -> tuple:
+    """Hashable form of a normalized filter (for cache keys)."""
+    return tuple(sorted(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in (metadata_filter or {}).items()
+    ))
+
+
+def chroma_where(source_filter: Optional[List[str]] = None,
+                 metadata_filter: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Equivalent Chroma where-clause, for filtered HNSW queries."""
+    metadata_filter = metadata_filter or {}
+    clauses = []
+    if source_filter:
+        clauses.append({"source": {"$in": list(source_filter)}})
+    if metadata_filter.get("file_type"):
+        clauses.append({"file_type": {"$in": metadata_filter["file_type"]}})
+    if metadata_filter.get("page_from") is not None:
+        clauses.append({"page_end": {"$gte": metadata_filter["page_from"]}})
+    if metadata_filter.get("page_to") is not None:
+        clauses.append({"page_start": {"$lte": metadata_filter["page_to"]}})
+    if metadata_filter.get("ingested_after") is not None:
+        clauses.append({"ingested_at": {"$gte": metadata_filter["ingested_after"]}})
+    if metadata_filter.get("ingested_before") is not None:
+        clauses.append({"ingested_at": {"$lte": metadata_filter["ingested_before"]}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _set_bits(bitmap: np.ndarray, rows: np.ndarray) -> None:
+    np.bitwise_or.at(bitmap, rows >> 3, (128 >> (rows & 7)).astype(np.uint8))
+
+
+def _clear_bits(bitmap: np.ndarray, rows: np.ndarray) -> None:
+    np.bitwise_and.at(bitmap, rows >> 3, ~(128 >> (rows & 7)).astype(np.uint8))
+
+
+def _test_bits(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return (bitmap[rows >> 3] & (128 >> (rows & 7)).astype(np.uint8)) != 0
+
+
+class MetadataIndex:
+    """Per-source row arrays, per-file-type bitmaps and range columns over chunk metadata."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.directory / "rows.sqlite3"), check_same_thread=False)
+        # WAL lets reader processes load rows while a writer commits
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                page_start INTEGER NOT NULL,
+                page_end INTEGER NOT NULL,
+                ingested_at REAL NOT NULL,
+                live INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS rows_by_chunk ON rows (chunk_id);
+            CREATE TABLE IF NOT EXISTS tombstones (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                row INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._reset()
+        self.refresh()
+
+    def _reset(self) -> None:
+        """Drop all in-memory state (reloaded by `refresh`)."""
+        self._epoch = None
+        self._loaded_rows = 0
+        self._tombstone_seq = 0
+        self._capacity = 0
+        self._ids: List[Optional[str]] = []
+        self._source_rows: Dict[str, np.ndarray] = {}
+        self._file_types: Dict[str, np.ndarray] = {}
+        self._page_start = np.zeros(0, dtype=np.int32)
+        self._page_end = np.zeros(0, dtype=np.int32)
+        self._ingested_at = np.zeros(0, dtype=np.float64)
+        self._live = np.zeros(0, dtype=np.uint8)
+        self._live_count = 0
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _grow(self, rows: int) -> None:
+        """Make room for `rows` rows in every bitmap and column (capacity doubles)."""
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        nbytes = (capacity + 7) // 8
+
+        def extend(array: np.ndarray, size: int, fill) -> np.ndarray:
+            return np.concatenate([array, np.full(size - len(array), fill, dtype=array.dtype)])
+
+        self._file_types = {value: extend(bitmap, nbytes, 0) for value, bitmap in self._file_types.items()}
+        self._live = extend(self._live, nbytes, 0)
+        self._page_start = extend(self._page_start, capacity, MISSING)
+        self._page_end = extend(self._page_end, capacity, MISSING)
+        self._ingested_at = extend(self._ingested_at, capacity, MISSING)
+        self._capacity = capacity
+
+    def refresh(self) -> None:
+        """Load rows appended (or tombstoned) since the last refresh, e.g. by another process."""
+        with self._lock:
+            epoch = self._meta("epoch")
+            if epoch != self._epoch:
+                # The table was compacted (or cleared); row numbers changed
+                self._reset()
+                self._epoch = epoch
+                # Loaded rows carry their current live flag; only later tombstones matter
+                self._tombstone_seq = self._db.execute("SELECT MAX(seq) FROM tombstones").fetchone()[0] or 0
+            max_row = self._db.execute("SELECT MAX(row) FROM rows").fetchone()[0]
+            total = max_row + 1 if max_row is not None else 0
+            if total > self._loaded_rows:
+                self._load_rows(self._loaded_rows, total)
+
+            dead = self._db.execute(
+                "SELECT seq, row FROM tombstones WHERE seq > ? ORDER BY seq", (self._tombstone_seq,)
+            ).fetchall()
+            if dead:
+                self._tombstone_seq = dead[-1][0]
+                rows = np.unique(np.fromiter((row for _, row in dead), dtype=np.int64))
+                rows = rows[rows < self._loaded_rows]
+                self._live_count -= int(_test_bits(self._live, rows).sum())
+                _clear_bits(self._live, rows)
+
+    def _load_rows(self, start: int, total: int) -> None:
+        new = self._db.execute(
+            "SELECT row, chunk_id, source, file_type, page_start, page_end, ingested_at, live "
+            "FROM rows WHERE row >= ? AND row < ? ORDER BY row", (start, total)
+        ).fetchall()
+        self._grow(total)
+        self._ids.extend([None] * (total - start))
+        by_source: Dict[str, List[int]] = {}
+        by_file_type: Dict[str, List[int]] = {}
+        live_rows = []
+        for row, chunk_id, source, file_type, first_page, last_page, ingested, live in new:
+            self._ids[row] = chunk_id
+            by_source.setdefault(source, []).append(row)
+            by_file_type.setdefault(file_type, []).append(row)
+            self._page_start[row] = first_page
+            self._page_end[row] = last_page
+            self._ingested_at[row] = ingested
+            if live:
+                live_rows.append(row)
+        # New rows are numbered after all loaded ones, so appending keeps the arrays sorted
+        for source, rows in by_source.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            existing = self._source_rows.get(source)
+            self._source_rows[source] = rows if existing is None else np.concatenate([existing, rows])
+        nbytes = (self._capacity + 7) // 8
+        for file_type, rows in by_file_type.items():
+            bitmap = self._file_types.get(file_type)
+            if bitmap is None:
+                bitmap = self._file_types[file_type] = np.zeros(nbytes, dtype=np.uint8)
+            _set_bits(bitmap, np.asarray(rows, dtype=np.int64))
+        _set_bits(self._live, np.asarray(live_rows, dtype=np.int64))
+        self._live_count += len(live_rows)
+        self._loaded_rows = total
+
+    def add(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Index chunk metadata; earlier rows of the same chunk IDs are tombstoned."""
+        if not ids:
+            return
+        with self._lock:
+            if self._meta("epoch") is None:
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', '0')")
+            self._tombstone(ids)
+            max_row = self._db.execute("SELECT MAX(row) FROM rows").fetchone()[0]
+            start = max_row + 1 if max_row is not None else 0
+            self._db.executemany(
+                "INSERT INTO rows (row, chunk_id, source, file_type, page_start, page_end, ingested_at, live) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                [
+                    (start + i, chunk_id, metadata.get("source", ""), metadata.get("file_type", ""),
+                     int(metadata.get("page_start", MISSING)), int(metadata.get("page_end", MISSING)),
+                     float(metadata.get("ingested_at", MISSING)))
+                    for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas))
+                ]
+            )
+            self._db.commit()
+        self.refresh()
+
+    def _tombstone(self, ids: List[str]) -> int:
+        removed = 0
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._db.execute(
+                f"INSERT INTO tombstones (row) SELECT row FROM rows WHERE live = 1 AND chunk_id IN ({placeholders})",
+                batch
+            )
+            removed += self._db.execute(
+                f"UPDATE rows SET live = 0 WHERE live = 1 AND chunk_id IN ({placeholders})", batch
+            ).rowcount
+        return removed
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Tombstone chunks by ID; compacts once most rows are dead."""
+        ids = list(ids)
+        if not ids:
+            return 0
+        with self._lock:
+            removed = self._tombstone(ids)
+            self._db.commit()
+        self.refresh()
+        live = self.count()
+        if self._loaded_rows - live > max(10000, live):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        """Renumber live rows densely, dropping tombstones."""
+        with self._lock:
+            live_rows = self._db.execute(
+                "SELECT chunk_id, source, file_type, page_start, page_end, ingested_at "
+                "FROM rows WHERE live = 1 ORDER BY row"
+            ).fetchall()
+            self._db.execute("DELETE FROM rows")
+            self._db.execute("DELETE FROM tombstones")
+            self._db.executemany(
+                "INSERT INTO rows (row, chunk_id, source, file_type, page_start, page_end, ingested_at, live) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                [(i, *values) for i, values in enumerate(live_rows)]
+            )
+            epoch = int(self._meta("epoch") or 0) + 1
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (str(epoch),))
+            self._db.commit()
+        self.refresh()
+
+    def clear(self) -> None:
+        """Remove all rows."""
+        with self._lock:
+            self._db.execute("DELETE FROM rows")
+            self._db.execute("DELETE FROM tombstones")
+            self._db.execute("DELETE FROM meta")
+            self._db.commit()
+            self._reset()
+
+    def close(self) -> None:
+        """Drop the in-memory bitmaps and close the row database."""
+        with self._lock:
+            self._reset()
+            self._db.close()
+
+    def count(self) -> int:
+        """Number of live chunks."""
+        return self._live_count
+
+    def match(self, source_filter: Optional[List[str]] = None,
+              metadata_filter: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Rows of the live chunks matching all filter conditions."""
+        metadata_filter = metadata_filter or {}
+        with self._lock:
+            if source_filter:
+                # Only the filtered sources' rows are checked, not every row
+                arrays = [self._source_rows[s] for s in source_filter if s in self._source_rows]
+                rows = np.unique(np.concatenate(arrays)) if arrays else np.zeros(0, dtype=np.int64)
+                rows = rows[_test_bits(self._live, rows)]
+            else:
+                rows = np.flatnonzero(np.unpackbits(self._live, count=self._loaded_rows))
+            if metadata_filter.get("file_type"):
+                union = np.zeros_like(self._live)
+                for file_type in metadata_filter["file_type"]:
+                    bitmap = self._file_types.get(file_type)
+                    if bitmap is not None:
+                        union |= bitmap
+                rows = rows[_test_bits(union, rows)]
+            if metadata_filter.get("page_from") is not None:
+                rows = rows[self._page_end[rows] >= metadata_filter["page_from"]]
+            if metadata_filter.get("page_to") is not None:
+                page_start = self._page_start[rows]
+                rows = rows[(page_start != MISSING) & (page_start <= metadata_filter["page_to"])]
+            if metadata_filter.get("ingested_after") is not None:
+                rows = rows[self._ingested_at[rows] >= metadata_filter["ingested_after"]]
+            if metadata_filter.get("ingested_before") is not None:
+                ingested_at = self._ingested_at[rows]
+                rows = rows[(ingested_at != MISSING) & (ingested_at <= metadata_filter["ingested_before"])]
+        return rows
+
+    def chunk_ids(self, rows: np.ndarray) -> List[str]:
+        """Chunk IDs of rows returned by `match`."""
+        ids = self._ids
+        return [ids[row] for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """Chunks, distinct values per field and memory use."""
+        value_bytes = (sum(rows.nbytes for rows in self._source_rows.values())
+                       + sum(bitmap.nbytes for bitmap in self._file_types.values()))
+        column_bytes = self._page_start.nbytes + self._page_end.nbytes + self._ingested_at.nbytes
+        return {
+            "chunks": self.count(),
+            "values": {"source": len(self._source_rows), "file_type": len(self._file_types)},
+            "memory_bytes": value_bytes + column_bytes + self._live.nbytes,
+            "brute_force_max": config.FILTER_BRUTE_FORCE_MAX
+        }
@@ -0,0 +1,200 @@
+"""Lightweight metrics and per-request stage timings.
+
+Counters and histograms are kept in-process and rendered in the Prometheus
+text exposition format by `/metrics`. Stage timers also record into a
+per-request timings dict (via a context variable) so the API can return a
+latency breakdown for a single request.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Default latency buckets in seconds (embedding and search are ms-scale,
+# LLM calls can take tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+# Parallel work of one request (shard fan-out) records into the same dict
+_timings_lock = threading.Lock()
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...],
+                   extra: Optional[Dict[str, str]] = None) -> str:
+    """Format label pairs as a Prometheus label set."""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels."""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the counter."""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        """Render the counter in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], Dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation."""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        """Render the histogram in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    labels = _format_labels(self.label_names, key, {"le": repr(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, description, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "rag_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",)
+)
+QUERIES_TOTAL = registry.counter(
+    "rag_queries_total", "Queries handled by the RAG pipeline.", ("status",)
+)
+INGEST_TOTAL = registry.counter(
+    "rag_ingest_documents_total", "Documents ingested by the RAG pipeline.", ("status",)
+)
+CHUNKS_INGESTED_TOTAL = registry.counter(
+    "rag_chunks_ingested_total", "Chunks added to the vector store."
+)
+RETRIEVED_DOCS = registry.histogram(
+    "rag_retrieved_documents", "Chunks returned per vector search.",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+RETRIEVAL_CACHE_TOTAL = registry.counter(
+    "rag_retrieval_cache_total", "Query retrievals by cache result (hit, similar, miss).", ("result",)
+)
+RERANK_TOTAL = registry.counter(
+    "rag_rerank_total", "Rerank stage outcomes (reranked, trimmed, cached, skipped).", ("result",)
+)
+PREFETCH_TOTAL = registry.counter(
+    "rag_prefetch_requests_total", "Prefetch requests by outcome.", ("status",)
+)
+QUERY_LOG_TOTAL = registry.counter(
+    "rag_query_log_records_total", "Query log records by outcome (written, dropped, error).", ("status",)
+)
+LLM_REQUESTS_TOTAL = registry.counter(
+    "rag_llm_requests_total", "Requests made to the LLM backend.", ("provider", "status")
+)
+LLM_DURATION = registry.histogram(
+    "rag_llm_request_duration_seconds", "LLM backend request latency.", ("provider",)
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a pipeline stage into the histogram and the current request timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            with _timings_lock:
+                timings[stage] = timings.get(stage, 0.0) + elapsed * 1000
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Begin collecting stage timings (in ms) for the current request."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def get_request_timings() -> Dict[str, float]:
+    """Return a copy of the stage timings collected for the current request."""
+    timings = _request_timings.get()
+    return {stage: round(ms, 3) for stage, ms in (timings or {}).items()}
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Format stage timings (ms) as a Server-Timing header value."""
+    return ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in timings.items())
@@ -0,0 +1,170 @@
+"""On-demand and sampled per-request profiling.
+
+A request is profiled when it carries an `X-Profile` header or `profile`
+query parameter (with a valid admin token, only accepted in the
+`X-Admin-Token` header), or when it is picked by the always-on
+`PROFILE_SAMPLE_RATE`. Two modes are supported:
+
+- `cprofile`: deterministic cProfile, stored as a `.pstats` file
+- `sample`: low-overhead stack sampling of the handling thread, stored as
+  collapsed stacks (`.collapsed`, flamegraph.pl / speedscope compatible)
+"""
+import cProfile
+import hmac
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import src.config as config
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_EXTENSIONS = {"cprofile": ".pstats", "sample": ".collapsed"}
+
+
+class ProfilingError(Exception):
+    """Raised when a profiling request is invalid or not authorized."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StackSampler:
+    """Periodically samples the stack of a single thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}:{code.co_firstlineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: Path) -> None:
+        """Write samples in collapsed-stack format."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """Profile of a single request."""
+
+    def __init__(self, mode: Optional[str] = None, name: str = "request"):
+        self.mode = mode
+        self.name = name
+        self.profile_id: Optional[str] = None
+        self.path: Optional[Path] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.mode == "sample":
+            self._sampler = StackSampler(threading.get_ident(), config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if not self.enabled:
+            return
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{uuid.uuid4().hex[:8]}"
+        self.path = config.PROFILE_DIR / f"{self.profile_id}{PROFILE_EXTENSIONS[self.mode]}"
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(str(self.path))
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.dump(self.path)
+        _prune_profiles()
+
+
+def _check_token(token: Optional[str]) -> None:
+    """Validate the admin token for on-demand profiling."""
+    if not config.PROFILE_ADMIN_TOKEN:
+        raise ProfilingError("Profiling is disabled (PROFILE_ADMIN_TOKEN not set)", status_code=403)
+    if not token or not hmac.compare_digest(token, config.PROFILE_ADMIN_TOKEN):
+        raise ProfilingError("Invalid admin token", status_code=403)
+
+
+def resolve_mode(requested: Optional[str], token: Optional[str]) -> Optional[str]:
+    """Decide whether (and how) to profile a request.
+
+    Args:
+        requested: Mode from the `X-Profile` header / `profile` parameter, if any
+        token: Admin token from the `X-Admin-Token` header
+    """
+    if requested:
+        _check_token(token)
+        mode = requested.lower()
+        if mode in ("1", "true", "yes"):
+            mode = config.PROFILE_DEFAULT_MODE
+        if mode not in PROFILE_MODES:
+            raise ProfilingError(f"Unknown profile mode: {requested}. Use one of {', '.join(PROFILE_MODES)}.")
+        return mode
+
+    # Always-on sampling of a fraction of requests
+    if config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+@contextmanager
+def profile_request(mode: Optional[str], name: str):
+    """Profile the enclosed block with the given mode (no-op when None)."""
+    session = ProfileSession(mode, name)
+    session.start()
+    try:
+        yield session
+    finally:
+        session.stop()
+
+
+def get_profile_path(profile_id: str, token: Optional[str]) -> Path:
+    """Look up a stored profile by ID."""
+    _check_token(token)
+    for extension in PROFILE_EXTENSIONS.values():
+        path = config.PROFILE_DIR / f"{profile_id}{extension}"
+        # Guard against path traversal in the ID
+        if path.parent == config.PROFILE_DIR and path.exists():
+            return path
+    raise ProfilingError(f"Profile not found: {profile_id}", status_code=404)
+
+
+def _prune_profiles() -> None:
+    """Keep only the most recent PROFILE_MAX_FILES profiles."""
+    files = sorted(
+        (p for p in config.PROFILE_DIR.iterdir() if p.suffix in PROFILE_EXTENSIONS.values()),
+        key=lambda p: p.stat().st_mtime
+    )
+    for path in files[:-config.PROFILE_MAX_FILES]:
+        path.unlink(missing_ok=True)
@@ -0,0 +1,45 @@
+"""Prompt templates shared by the LLM backends."""
+from typing import List, Sequence, Tuple
+
+ANSWER_INSTRUCTIONS = (
+    "Answer the question based on the context provided above. If the answer cannot be found in the "
+    "context, say so. Cite which document(s) you used in your answer."
+)
+
+
+def format_documents(documents: List[str], start: int = 1) -> str:
+    """Number documents as [Document i], continuing from `start`."""
+    return "\n\n".join(f"[Document {start + i}]: {doc}" for i, doc in enumerate(documents))
+
+
+def format_history(history: Sequence[Tuple[str, str]]) -> str:
+    """Render earlier (question, answer) turns of a conversation."""
+    return "\n\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in history)
+
+
+def build_prompt(question: str, context: List[str] = None,
+                 history: Sequence[Tuple[str, str]] = None) -> str:
+    """Full prompt with retrieved documents and, in a session, the recent turns."""
+    if not context and not history:
+        return question
+    parts = []
+    if context:
+        parts.append(f"Context from knowledge base:\n{format_documents(context)}")
+    if history:
+        parts.append(f"Conversation so far:\n{format_history(history)}")
+    parts.append(f"Question: {question}")
+    parts.append(ANSWER_INSTRUCTIONS)
+    return "\n\n".join(parts)
+
+
+def build_followup_prompt(question: str, new_context: List[str], start: int) -> str:
+    """Prompt appended to an existing conversation: only new documents and the question."""
+    parts = []
+    if new_context:
+        parts.append(f"Additional context from knowledge base:\n{format_documents(new_context, start)}")
+    parts.append(f"Follow-up question: {question}")
+    parts.append(
+        "Answer the follow-up question based on all documents provided in this conversation. If the "
+        "answer cannot be found in them, say so. Cite which document(s) you used in your answer."
+    )
+    return "\n\n".join(parts)
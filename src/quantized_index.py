@@ -0,0 +1,417 @@
+"""Compressed in-memory vector index with exact rerank.
+
+Keeps only compressed codes of the stored embeddings in RAM - float16,
+scalar int8 (per-dimension scale) or binary (one bit per dimension above
+its mean, Hamming distance) -
+and scans them to build a shortlist of `top_k * rerank_factor` candidates.
+The shortlist is then re-scored exactly against full-precision float32
+vectors that live in a memory-mapped file on disk, so only the rows that are
+actually reranked are paged in.
+
+Layout under the index directory:
+
+    vectors.f32      normalized float32 vectors, one row per stored vector
+    rows.sqlite3     row -> chunk ID / source / live flag, and index meta
+
+Replaced or deleted vectors are tombstoned and dropped by `compact()`.
+
+The int8 scale and binary center are calibrated on the stored vectors and
+saved in the meta table, so every process encodes the same way. The writer
+recalibrates when the index has doubled since the last calibration or (int8)
+new vectors exceed the calibrated range; processes re-encode their codes
+when they see a new calibration.
+"""
+import json
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import src.config as config
+
+COMPRESSION_MODES = ("none", "float16", "int8", "binary")
+DEFAULT_RERANK_FACTORS = {"float16": 2, "int8": 4, "binary": 10}
+SCAN_BLOCK_ROWS = 65536
+# int8 values up to this factor beyond the calibrated range are clipped
+# rather than triggering a recalibration
+CALIBRATION_SLACK = 1.1
+
+# Bit counts for every byte value, for Hamming distances on packed sign bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class QuantizedVectorIndex:
+    """Compressed codes in RAM, full-precision vectors on disk."""
+
+    def __init__(self, directory: Path, mode: str, rerank_factor: int = None):
+        if mode not in COMPRESSION_MODES or mode == "none":
+            raise ValueError(f"Unknown vector compression '{mode}' (expected float16, int8 or binary)")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.rerank_factor = rerank_factor or config.VECTOR_RERANK_FACTOR or DEFAULT_RERANK_FACTORS[mode]
+        self.vectors_path = self.directory / "vectors.f32"
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.directory / "rows.sqlite3"), check_same_thread=False)
+        # WAL lets reader processes load rows while a writer commits
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                live INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS rows_by_chunk ON rows (chunk_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._recall_cache: Tuple[int, Optional[Dict[str, Any]]] = (-1, None)
+        self._reset()
+        self.refresh()
+
+    def _reset(self) -> None:
+        """Drop all in-memory state (reloaded by `refresh`)."""
+        self.dim = None
+        self._epoch = None
+        self._loaded_rows = 0
+        self._ids: List[Optional[str]] = []
+        self._rows_by_id: Dict[str, int] = {}
+        self._source_codes: Dict[str, int] = {}
+        self._sources = np.zeros(0, dtype=np.int32)
+        self._live = np.zeros(0, dtype=bool)
+        self._codes = None
+        self._scale = None
+        self._center = None
+        self._calibration = None
+        self._full = None
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _file_rows(self) -> int:
+        if not self.dim or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (4 * self.dim)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.mode == "float16":
+            return vectors.astype(np.float16)
+        if self.mode == "int8":
+            return np.clip(np.rint(vectors / self._scale), -127, 127).astype(np.int8)
+        return np.packbits(vectors > self._center, axis=-1)
+
+    def _approx_scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Similarity of the query to each code row (higher is closer)."""
+        if self.mode == "binary":
+            query_bits = self._encode(query)
+            scores = np.empty(len(codes), dtype=np.float32)
+            for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+                block = codes[start:start + SCAN_BLOCK_ROWS]
+                distances = _POPCOUNT[block ^ query_bits].sum(axis=1, dtype=np.int32)
+                scores[start:start + len(block)] = -distances
+            return scores
+        weights = query * self._scale if self.mode == "int8" else query
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights
+        return scores
+
+    def _calibrate(self, vectors: np.ndarray) -> np.ndarray:
+        """Calibration values of a set of vectors: int8 scale or binary center."""
+        if self.mode == "int8":
+            # Per-dimension scale from the data; values beyond it are clipped
+            return np.maximum(np.abs(vectors).max(axis=0), 1e-6) / 127.0
+        # Thresholding at the per-dimension mean keeps bits informative
+        # for embeddings that are not centered at zero
+        return vectors.mean(axis=0)
+
+    def _set_calibration(self, values: np.ndarray) -> None:
+        if self.mode == "int8":
+            self._scale = values
+        else:
+            self._center = values
+
+    def _maybe_recalibrate(self, vectors: np.ndarray, total_rows: int) -> None:
+        """Save a new calibration over all stored rows if the current one no longer fits.
+
+        Called by the writer, holding the lock, with the vectors just appended.
+        """
+        if self.mode == "float16":
+            return
+        calibration, calibrated_rows = self._meta("calibration"), int(self._meta("calibration_rows") or 0)
+        stale = calibration is None or total_rows >= 2 * calibrated_rows
+        if not stale and self.mode == "int8":
+            calibrated_max = np.asarray(json.loads(calibration), dtype=np.float32) * 127.0
+            stale = bool((np.abs(vectors).max(axis=0) > CALIBRATION_SLACK * calibrated_max).any())
+        if not stale:
+            return
+        full = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(total_rows, self.dim))
+        if self.mode == "int8":
+            values = np.zeros(self.dim, dtype=np.float32)
+            for start in range(0, total_rows, SCAN_BLOCK_ROWS):
+                values = np.maximum(values, self._calibrate(np.asarray(full[start:start + SCAN_BLOCK_ROWS])))
+        else:
+            values = np.zeros(self.dim, dtype=np.float64)
+            for start in range(0, total_rows, SCAN_BLOCK_ROWS):
+                values += np.asarray(full[start:start + SCAN_BLOCK_ROWS], dtype=np.float64).sum(axis=0)
+            values /= total_rows
+        del full
+        self._set_meta("calibration", json.dumps([float(x) for x in values]))
+        self._set_meta("calibration_rows", total_rows)
+
+    def refresh(self) -> None:
+        """Load rows appended (or tombstoned) since the last refresh, e.g. by another process."""
+        with self._lock:
+            epoch = self._meta("epoch")
+            if epoch != self._epoch:
+                # The file was compacted (or cleared); row numbers changed
+                self._reset()
+                self._epoch = epoch
+            dim = self._meta("dim")
+            if dim is None:
+                return
+            self.dim = int(dim)
+            calibration = self._meta("calibration")
+            if calibration is not None and calibration != self._calibration:
+                # Saved by the writer (possibly another process): re-encode what is loaded
+                self._calibration = calibration
+                self._set_calibration(np.asarray(json.loads(calibration), dtype=np.float32))
+                if self._codes is not None:
+                    self._codes = np.concatenate([
+                        self._encode(np.asarray(self._full[start:start + SCAN_BLOCK_ROWS]))
+                        for start in range(0, self._loaded_rows, SCAN_BLOCK_ROWS)
+                    ])
+            # Only load rows whose index entries are committed
+            max_row = self._db.execute("SELECT MAX(row) FROM rows").fetchone()[0]
+            file_rows = min(self._file_rows(), max_row + 1 if max_row is not None else 0)
+            if file_rows > self._loaded_rows:
+                full = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(file_rows, self.dim))
+                new = np.asarray(full[self._loaded_rows:file_rows])
+                if self.mode != "float16" and self._scale is None and self._center is None:
+                    # Index written before calibrations were saved: calibrate in memory
+                    self._set_calibration(self._calibrate(new))
+                codes = self._encode(new)
+                self._codes = codes if self._codes is None else np.concatenate([self._codes, codes])
+
+                rows = {row: (chunk_id, source) for row, chunk_id, source in self._db.execute(
+                    "SELECT row, chunk_id, source FROM rows WHERE row >= ? AND row < ?",
+                    (self._loaded_rows, file_rows)
+                )}
+                sources = np.full(file_rows - self._loaded_rows, -1, dtype=np.int32)
+                for row in range(self._loaded_rows, file_rows):
+                    chunk_id, source = rows.get(row, (None, None))
+                    self._ids.append(chunk_id)
+                    if chunk_id is not None:
+                        self._rows_by_id[chunk_id] = row
+                    if source is not None:
+                        sources[row - self._loaded_rows] = self._source_codes.setdefault(
+                            source, len(self._source_codes)
+                        )
+                self._sources = np.concatenate([self._sources, sources])
+                self._full = full
+                self._loaded_rows = file_rows
+
+            live = np.zeros(self._loaded_rows, dtype=bool)
+            live_rows = [row for (row,) in self._db.execute(
+                "SELECT row FROM rows WHERE live = 1 AND row < ?", (self._loaded_rows,)
+            )]
+            live[live_rows] = True
+            self._live = live
+
+    def add(self, ids: List[str], sources: List[str], embeddings: List[List[float]]) -> None:
+        """Append vectors; earlier vectors stored under the same IDs are tombstoned."""
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self._meta("dim") is None:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+                self._set_meta("epoch", 0)
+                self._db.commit()
+            self._tombstone(ids)
+            start = self._file_rows()
+            # Vectors are written before their rows are committed, so readers
+            # never see a row without its vector
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype("<f4").tobytes())
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (row, chunk_id, source, live) VALUES (?, ?, ?, 1)",
+                [(start + i, chunk_id, source) for i, (chunk_id, source) in enumerate(zip(ids, sources))]
+            )
+            self._maybe_recalibrate(vectors, start + len(ids))
+            self._db.commit()
+        self.refresh()
+
+    def _tombstone(self, ids: List[str]) -> int:
+        removed = 0
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            removed += self._db.execute(
+                f"UPDATE rows SET live = 0 WHERE live = 1 AND chunk_id IN ({placeholders})", batch
+            ).rowcount
+        return removed
+
+    def remove(self, ids: List[str]) -> int:
+        """Tombstone vectors by chunk ID; compacts once most rows are dead."""
+        if not ids:
+            return 0
+        with self._lock:
+            removed = self._tombstone(list(ids))
+            self._db.commit()
+        self.refresh()
+        live = self.count()
+        if len(self._live) - live > max(10000, live):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        """Rewrite the vector file without tombstoned rows."""
+        with self._lock:
+            if self.dim is None:
+                return
+            live_rows = self._db.execute(
+                "SELECT row, chunk_id, source FROM rows WHERE live = 1 ORDER BY row"
+            ).fetchall()
+            full = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                             shape=(self._file_rows(), self.dim))
+            tmp_path = self.vectors_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(live_rows), SCAN_BLOCK_ROWS):
+                    block = [row for row, _, _ in live_rows[start:start + SCAN_BLOCK_ROWS]]
+                    f.write(np.asarray(full[block], dtype="<f4").tobytes())
+            del full
+            tmp_path.replace(self.vectors_path)
+            self._db.execute("DELETE FROM rows")
+            self._db.executemany(
+                "INSERT INTO rows (row, chunk_id, source, live) VALUES (?, ?, ?, 1)",
+                [(i, chunk_id, source) for i, (_, chunk_id, source) in enumerate(live_rows)]
+            )
+            self._set_meta("epoch", int(self._meta("epoch") or 0) + 1)
+            self._db.commit()
+        self.refresh()
+
+    def clear(self) -> None:
+        """Remove all vectors."""
+        with self._lock:
+            self._db.execute("DELETE FROM rows")
+            self._db.execute("DELETE FROM meta")
+            self._db.commit()
+            self.vectors_path.unlink(missing_ok=True)
+            self._reset()
+
+    def close(self) -> None:
+        """Drop the in-memory codes and close the row database."""
+        with self._lock:
+            self._reset()
+            self._db.close()
+
+    def count(self) -> int:
+        """Number of live vectors."""
+        return int(self._live.sum())
+
+    def search(self, query_embedding: List[float], top_k: int, source_filter: Optional[List[str]] = None,
+               candidate_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk_id, cosine distance) pairs, optionally among `candidate_ids` only."""
+        with self._lock:
+            codes, live, sources, ids, full = self._codes, self._live, self._sources, self._ids, self._full
+            source_codes, rows_by_id = self._source_codes, self._rows_by_id
+        if codes is None or not live.any():
+            return []
+        query = _normalize(np.asarray([query_embedding], dtype=np.float32))[0]
+
+        mask = live
+        if source_filter:
+            wanted = [source_codes[s] for s in source_filter if s in source_codes]
+            mask = live & np.isin(sources, wanted)
+        if candidate_ids is not None:
+            allowed = np.zeros(len(live), dtype=bool)
+            allowed[[rows_by_id[i] for i in candidate_ids if rows_by_id.get(i, len(live)) < len(live)]] = True
+            mask = mask & allowed
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        if len(candidates) == len(codes):
+            scores = self._approx_scores(query, codes)
+        else:
+            scores = self._approx_scores(query, codes[candidates])
+
+        shortlist_size = min(len(candidates), top_k * self.rerank_factor)
+        shortlist = np.argpartition(-scores, shortlist_size - 1)[:shortlist_size]
+        rows = np.sort(candidates[shortlist])
+
+        # Exact rerank on full-precision vectors paged in from disk
+        exact = np.asarray(full[rows]) @ query
+        order = np.argsort(-exact)[:top_k]
+        return [(ids[rows[i]], float(1.0 - exact[i])) for i in order]
+
+    def estimate_recall(self, top_k: int = None, num_queries: int = 20,
+                        sample_rows: int = 20000, seed: int = 0) -> Optional[Dict[str, Any]]:
+        """Estimate recall@k of compressed search + rerank against exact search.
+
+        Uses perturbed stored vectors as queries over a sample of at most
+        `sample_rows` rows. Cached until the number of vectors changes.
+        """
+        top_k = top_k or config.TOP_K
+        count = self.count()
+        if self._recall_cache[0] == count:
+            return self._recall_cache[1]
+        live_rows = np.flatnonzero(self._live)
+        if len(live_rows) <= top_k:
+            return None
+
+        rng = random.Random(seed)
+        rows = np.sort(np.array(rng.sample(list(live_rows), min(sample_rows, len(live_rows)))))
+        vectors = np.asarray(self._full[rows])
+        codes = self._codes[rows]
+        picks = rng.sample(range(len(rows)), min(num_queries, len(rows)))
+        noise = np.random.default_rng(seed).normal(scale=0.05, size=(len(picks), self.dim)).astype(np.float32)
+        queries = _normalize(vectors[picks] + noise)
+
+        shortlist_size = min(len(rows), top_k * self.rerank_factor)
+        recalls = []
+        for query in queries:
+            exact_scores = vectors @ query
+            expected = set(np.argpartition(-exact_scores, top_k - 1)[:top_k])
+            shortlist = np.argpartition(-self._approx_scores(query, codes), shortlist_size - 1)[:shortlist_size]
+            found = shortlist[np.argsort(-exact_scores[shortlist])[:top_k]]
+            recalls.append(len(expected & set(found)) / top_k)
+
+        result = {"k": top_k, "recall": round(sum(recalls) / len(recalls), 4),
+                  "queries": len(queries), "sample_rows": len(rows)}
+        self._recall_cache = (count, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory usage per chunk and estimated recall."""
+        rows = len(self._ids)
+        code_bytes = self._codes.nbytes if self._codes is not None else 0
+        memory_bytes = code_bytes + self._live.nbytes + self._sources.nbytes
+        return {
+            "mode": self.mode,
+            "dimension": self.dim,
+            "rerank_factor": self.rerank_factor,
+            "vectors": self.count(),
+            "bytes_per_chunk": round(memory_bytes / rows, 1) if rows else 0,
+            "full_precision_bytes_per_chunk": 4 * self.dim if self.dim else 0,
+            "memory_bytes": memory_bytes,
+            "disk_bytes": self.vectors_path.stat().st_size if self.vectors_path.exists() else 0,
+            "recall_estimate": self.estimate_recall()
+        }
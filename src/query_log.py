@@ -0,0 +1,188 @@
+"""Append-only query log.
+
+`/api/query` appends one compact NDJSON record per query: tenant, question,
+retrieval settings (top_k, filters, search mode), the retrieved chunk IDs and
+the stage timings. Records are queued and written by a background thread, so
+logging costs the request a dict and a queue put; when the queue is full the
+record is dropped rather than blocking the request.
+
+Each process writes its own segment files, named by creation time and PID
+(`queries-20240101-120000-1234.ndjson`), so writer and query workers never
+share a file. Segments rotate at QUERY_LOG_SEGMENT_BYTES and are gzipped;
+the gzipped segments closed longest ago beyond QUERY_LOG_MAX_SEGMENTS are
+deleted. Open `.ndjson` segments (possibly another process's) are never
+pruned, and a segment only gets its `.gz` name once it is fully written.
+
+The log feeds startup cache warming (`most_frequent`) and realistic load
+tests (`replay_queries.py`).
+"""
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import src.config as config
+from src.metrics import QUERY_LOG_TOTAL
+from src.retrieval_cache import normalize_question
+
+SEGMENT_PREFIX = "queries-"
+SEGMENT_SUFFIXES = (".ndjson", ".ndjson.gz")
+
+# Record fields that select the retrieval results; records agreeing on all of
+# them (and the normalized question) are the same query for warming
+SETTINGS_FIELDS = ("tenant", "top_k", "source_filter", "filters", "search_mode", "ef_search")
+
+
+class QueryLog:
+    """Rotating NDJSON query log written by a background thread."""
+
+    def __init__(self, directory: Path = None, segment_bytes: int = None,
+                 max_segments: int = None, queue_size: int = None):
+        self.directory = Path(directory or config.QUERY_LOG_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes or config.QUERY_LOG_SEGMENT_BYTES
+        self.max_segments = max_segments or config.QUERY_LOG_MAX_SEGMENTS
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(
+            maxsize=queue_size or config.QUERY_LOG_QUEUE_SIZE
+        )
+        self._file = None
+        self._path: Optional[Path] = None
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Queue a record (stamped with the current time); False if it was dropped."""
+        try:
+            self._queue.put_nowait({"ts": round(time.time(), 3), **record})
+            return True
+        except queue.Full:
+            QUERY_LOG_TOTAL.inc(status="dropped")
+            return False
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            # Write everything queued in one go and flush once per batch
+            batch = [record]
+            stop = False
+            while True:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            try:
+                self._write(batch)
+                QUERY_LOG_TOTAL.inc(len(batch), status="written")
+            except Exception as e:
+                QUERY_LOG_TOTAL.inc(len(batch), status="error")
+                print(f"Warning: could not write query log: {e}")
+            if stop:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if self._file is None:
+            self._path = self.directory / f"{SEGMENT_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.ndjson"
+            self._file = open(self._path, "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n" for r in batch))
+        self._file.flush()
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        """Close the current segment, gzip it and drop the oldest closed segments."""
+        self._file.close()
+        self._file = None
+        tmp_path = f"{self._path}.gz.tmp"
+        with open(self._path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, f"{self._path}.gz")
+        self._path.unlink()
+        closed = []
+        for path in segment_paths(self.directory):
+            if path.suffix == ".gz":
+                try:
+                    closed.append((path.stat().st_mtime, path.name, path))
+                except FileNotFoundError:
+                    # Pruned by another process meanwhile
+                    continue
+        # Names carry the creation time; a long-lived segment closes much later
+        closed.sort()
+        for _, _, path in closed[:-self.max_segments]:
+            path.unlink(missing_ok=True)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out queued records and stop the writer thread."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+def segment_paths(directory: Path = None) -> List[Path]:
+    """Log segments, oldest first."""
+    directory = Path(directory or config.QUERY_LOG_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(
+        (p for p in directory.iterdir() if p.name.startswith(SEGMENT_PREFIX) and p.name.endswith(SEGMENT_SUFFIXES)),
+        key=lambda p: p.name
+    )
+
+
+def read_records(directory: Path = None, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Yield logged records, oldest segment first, optionally only those after `since`.
+
+    Lines that do not parse (e.g. a record cut off by a crash) are skipped.
+    """
+    for path in segment_paths(directory):
+        opener = gzip.open if path.suffix == ".gz" else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or record.get("ts", 0) >= since:
+                        yield record
+        except (OSError, EOFError):
+            # Segments can be pruned or still be written by another process
+            continue
+
+
+def query_key(record: Dict[str, Any]) -> str:
+    """Identity of a logged query: normalized question plus retrieval settings."""
+    settings = {field: record.get(field) for field in SETTINGS_FIELDS}
+    return json.dumps([normalize_question(record.get("question", "")), settings], sort_keys=True)
+
+
+def most_frequent(records: Iterable[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """The `limit` most frequently asked queries, most frequent first.
+
+    Each result is the latest record of its query with a `count` field.
+    """
+    counts: Counter = Counter()
+    latest: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        if not record.get("question"):
+            continue
+        key = query_key(record)
+        counts[key] += 1
+        latest[key] = record
+    return [{**latest[key], "count": count} for key, count in counts.most_common(limit)]
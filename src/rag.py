@@ -1,8 +1,26 @@
 """RAG pipeline implementation."""
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
-from src.ingestion import DocumentChunker
+from src.ingestion import DocumentChunker, EXTRACTOR_VERSION
+from src.text_cache import ExtractedTextCache
 from src.vector_store import VectorStore
+from src.sharded_store import ShardedVectorStore
+from src.snapshot import load_snapshot_if_empty
+from src.lexical_index import is_identifier_query, reciprocal_rank_fusion
+from src.retrieval_cache import RetrievalCache, normalize_question, rerank_candidates
+from src.sessions import ChatSession, SessionStore
+from src.metadata_index import filter_key, normalize_metadata_filter
+from src.query_log import QueryLog, most_frequent, read_records
+from src.reranker import Reranker
+from src.prompts import build_prompt, build_followup_prompt
+from src.tenants import (
+    TenantError, TenantStores, resolve_tenant, tenant_collection_name, tenant_directory, tenant_docs_dir
+)
+from src.metrics import (
+    stage_timer, start_request_timings, get_request_timings, QUERIES_TOTAL, INGEST_TOTAL,
+    RETRIEVAL_CACHE_TOTAL, PREFETCH_TOTAL
+)
 import src.config as config
 
 # Import LLM based on provider
@@ -16,50 +34,148 @@ class RAGPipeline:
     """Main RAG pipeline."""
     
     def __init__(self):
+        text_cache = ExtractedTextCache(extractor_version=EXTRACTOR_VERSION) if config.TEXT_CACHE_ENABLED else None
         self.chunker = DocumentChunker(
             chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP
+            chunk_overlap=config.CHUNK_OVERLAP,
+            text_cache=text_cache,
+            child_chunk_size=config.CHILD_CHUNK_SIZE if config.HIERARCHICAL_CHUNKING else 0,
+            child_chunk_overlap=config.CHILD_CHUNK_OVERLAP
         )
-        self.vector_store = VectorStore()
+        # Query workers in multi-worker mode never write to the index
+        self.read_only = config.SERVER_ROLE == "reader"
+        # Per-tenant stores are opened lazily and kept in a bounded LRU
+        self.tenants = TenantStores(self._open_store)
+        self.vector_store = self.tenants.default
+        # Results of prefetched and recent questions, reused by query()
+        self.retrieval_cache = RetrievalCache()
+        # Optional second stage narrowing a wide candidate set down to top_k
+        self.reranker = Reranker()
+        self.sessions = SessionStore()
+        # Asked questions, for startup warming and load replay (writers get no queries)
+        self.query_log = QueryLog() if config.QUERY_LOG_ENABLED and config.SERVER_ROLE != "writer" else None
+        # A fresh deployment starts from the prebuilt snapshot instead of reindexing
+        if config.SNAPSHOT_AUTOLOAD and not self.read_only:
+            load_snapshot_if_empty(self.vector_store)
         # Initialize LLM based on provider
         self.llm = LLM()
     
-    def ingest_document(self, file_path: Path) -> Dict[str, Any]:
-        """Ingest a document into the knowledge base."""
+    def _open_store(self, tenant: str):
+        """Open the vector store of one tenant."""
+        directory = tenant_directory(tenant)
+        collection_name = tenant_collection_name(tenant)
+        if config.VECTOR_SHARDS > 1 or config.VECTOR_SHARD_ADDRESSES:
+            if config.VECTOR_SHARD_ADDRESSES and tenant != config.DEFAULT_TENANT:
+                raise TenantError("Only the default tenant is available with remote shard processes")
+            return ShardedVectorStore(read_only=self.read_only, base_dir=directory, collection_name=collection_name)
+        return VectorStore(persist_directory=directory, read_only=self.read_only, collection_name=collection_name)
+    
+    def store_for(self, tenant: Optional[str] = None, create: bool = False):
+        """Lease the vector store of a tenant (the default tenant if None) for a `with` block."""
+        return self.tenants.lease(tenant, create=create)
+    
+    def ingest_document(self, file_path: Path, tenant: Optional[str] = None,
+                        chunks: Optional[List[Dict[str, Any]]] = None,
+                        content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Ingest a document into the knowledge base.
+        
+        Re-ingesting a source replaces its previous chunks; unchanged chunks
+        are kept without re-embedding. Streaming uploads pass the chunks they
+        already produced (text formats) or the file's SHA-256 (PDFs).
+        """
+        start_request_timings()
         try:
-            chunks = self.chunker.process_file(file_path)
-            self.vector_store.add_documents(chunks)
+            with stage_timer("document_processing"):
+                if chunks is None:
+                    chunks = self.chunker.process_file(file_path, content_hash=content_hash)
+            with self.store_for(tenant, create=True) as vector_store:
+                changes = vector_store.replace_source(file_path.name, chunks)
+            self.retrieval_cache.invalidate(resolve_tenant(tenant))
+            INGEST_TOTAL.inc(status="success")
             return {
                 "status": "success",
                 "file": str(file_path),
-                "chunks": len(chunks)
+                "chunks": len(chunks),
+                **changes,
+                "timings": get_request_timings()
             }
         except Exception as e:
+            INGEST_TOTAL.inc(status="error")
             return {
                 "status": "error",
                 "file": str(file_path),
-                "error": str(e)
+                "error": str(e),
+                "timings": get_request_timings()
             }
     
-    def query(self, question: str, top_k: int = None, source_filter: Optional[List[str]] = None) -> Dict[str, Any]:
+    def delete_document(self, source: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Remove a document's chunks from the knowledge base and its uploaded file."""
+        with self.store_for(tenant) as vector_store:
+            removed = vector_store.delete_source(source)
+        self.retrieval_cache.invalidate(resolve_tenant(tenant))
+        file_path = tenant_docs_dir(resolve_tenant(tenant)) / Path(source).name
+        file_deleted = file_path.exists()
+        if file_deleted:
+            file_path.unlink()
+        return {
+            "status": "success",
+            "source": source,
+            "removed": removed,
+            "file_deleted": file_deleted
+        }
+    
+    def query(self, question: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+              ef_search: Optional[int] = None, search_mode: Optional[str] = None,
+              tenant: Optional[str] = None, session_id: Optional[str] = None,
+              new_session: bool = False, metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Query the RAG system.
         
         Args:
             question: The question to ask
             top_k: Number of document chunks to retrieve
             source_filter: Optional list of source file names to filter by (e.g., ["myfile.pdf"])
+            ef_search: Optional HNSW ef_search override (higher = better recall, slower)
+            search_mode: Optional "dense", "lexical" or "hybrid" override
+            tenant: Knowledge base to search (default tenant if None)
+            session_id: Continue this chat session (SessionError if unknown or expired)
+            new_session: Start a chat session with this question
+            metadata_filter: Optional file_type / page_from / page_to /
+                ingested_after / ingested_before filter
         """
         top_k = top_k or config.TOP_K
+        metadata_filter = normalize_metadata_filter(metadata_filter)
+        start_request_timings()
         
-        # Retrieve relevant documents
-        retrieved_docs = self.vector_store.search(question, top_k=top_k, source_filter=source_filter)
+        session = None
+        if session_id:
+            session = self.sessions.get(session_id, resolve_tenant(tenant))
+        elif new_session:
+            session = self.sessions.create(resolve_tenant(tenant))
+        session_fields = {"session_id": session.session_id} if session else {}
         
-        if not retrieved_docs:
+        # Retrieve relevant documents: wide when a rerank stage narrows them down
+        # (identifier lookups are exact BM25 matches and are not reranked)
+        retrieve_k = top_k if is_identifier_query(question) else self.reranker.candidates(top_k)
+        with self.store_for(tenant) as vector_store:
+            retrieved_docs, query_embedding = self._retrieve(question, retrieve_k, source_filter, ef_search,
+                                                             search_mode, tenant, metadata_filter)
+            if retrieve_k > top_k:
+                retrieved_docs = self.reranker.rerank(question, retrieved_docs, top_k, vector_store,
+                                                      query_embedding)
+            # Small-to-big: child chunks were searched, the LLM reads their parent windows
+            # (a no-op for chunks ingested without HIERARCHICAL_CHUNKING)
+            retrieved_docs = vector_store.expand_to_parents(retrieved_docs)
+
+        # A follow-up can still be answered from documents shown earlier in the session
+        if not retrieved_docs and not (session and session.turns):
+            QUERIES_TOTAL.inc(status="no_results")
             return {
                 "question": question,
                 "answer": "No relevant documents found in the knowledge base.",
                 "sources": [],
-                "retrieved_docs": []
+                "retrieved_docs": [],
+                **session_fields,
+                "timings": get_request_timings()
             }
         
         # Extract context texts
@@ -67,25 +183,195 @@ class RAGPipeline:
         
         # Generate answer using LLM
         try:
-            answer = self.llm.generate(question, context=context_texts)
+            with stage_timer("llm_generation"):
+                if session is not None:
+                    answer = self._generate_in_session(session, question, retrieved_docs)
+                else:
+                    answer = self.llm.generate(question, context=context_texts)
         except Exception as e:
+            QUERIES_TOTAL.inc(status="llm_error")
             return {
                 "question": question,
                 "answer": f"Error generating answer: {str(e)}",
                 "sources": self._extract_sources(retrieved_docs),
-                "retrieved_docs": retrieved_docs
+                "retrieved_docs": retrieved_docs,
+                **session_fields,
+                "timings": get_request_timings()
             }
         
         # Extract sources
         sources = self._extract_sources(retrieved_docs)
+        QUERIES_TOTAL.inc(status="success")
         
         return {
             "question": question,
             "answer": answer,
             "sources": sources,
-            "retrieved_docs": retrieved_docs
+            "retrieved_docs": retrieved_docs,
+            **session_fields,
+            "timings": get_request_timings()
         }
     
+    def _generate_in_session(self, session: ChatSession, question: str,
+                             retrieved_docs: List[Dict[str, Any]]) -> str:
+        """Answer a turn of a chat session, sending the LLM only chunks it has not seen."""
+        if hasattr(self.llm, "generate_continuation"):
+            conversation = session.llm_context
+            seen = set(session.chunk_ids)
+            new_docs = [doc for doc in retrieved_docs if doc["id"] not in seen]
+            if conversation and len(conversation) <= config.SESSION_MAX_CONTEXT_TOKENS:
+                prompt = build_followup_prompt(question, [doc["text"] for doc in new_docs],
+                                               start=len(session.chunk_ids) + 1)
+            else:
+                # First turn, or the conversation outgrew its budget: start a new
+                # context from this turn's documents and the recent turns
+                conversation = None
+                new_docs = retrieved_docs
+                session.chunk_ids = []
+                prompt = build_prompt(question, [doc["text"] for doc in new_docs], session.history())
+            answer, session.llm_context = self.llm.generate_continuation(prompt, conversation)
+            session.chunk_ids.extend(doc["id"] for doc in new_docs)
+        else:
+            # Stateless backends get this turn's documents and a trimmed history
+            answer = self.llm.generate(question, context=[doc["text"] for doc in retrieved_docs],
+                                       history=session.history())
+            session.chunk_ids = [doc["id"] for doc in retrieved_docs]
+        session.add_turn(question, answer)
+        self.sessions.save(session)
+        return answer
+    
+    def end_session(self, session_id: str, tenant: Optional[str] = None) -> bool:
+        """Delete a chat session."""
+        return self.sessions.delete(session_id, resolve_tenant(tenant))
+    
+    def _retrieval_scope(self, source_filter: Optional[List[str]], ef_search: Optional[int],
+                         search_mode: Optional[str], tenant: Optional[str],
+                         metadata_filter: Optional[Dict[str, Any]] = None) -> tuple:
+        """Settings under which cached retrieval results are interchangeable."""
+        return (resolve_tenant(tenant), tuple(sorted(source_filter or [])),
+                search_mode or config.SEARCH_MODE, ef_search, filter_key(metadata_filter))
+    
+    def _retrieve(self, question: str, top_k: int, source_filter: Optional[List[str]],
+                  ef_search: Optional[int], search_mode: Optional[str], tenant: Optional[str],
+                  metadata_filter: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Any]:
+        """Search a tenant's store, reusing cached or prefetched results when possible.
+        
+        Returns the docs and the question's embedding, if one was computed or cached.
+        """
+        with self.store_for(tenant) as vector_store:
+            if not config.PREFETCH_ENABLED:
+                docs = vector_store.search(question, top_k=top_k, source_filter=source_filter,
+                                           ef_search=ef_search, mode=search_mode, metadata_filter=metadata_filter)
+                return docs, None
+        
+            scope = self._retrieval_scope(source_filter, ef_search, search_mode, tenant, metadata_filter)
+            # Query workers only see index changes made by the writer through its generation file
+            if self.read_only and vector_store.refresh_if_stale():
+                self.retrieval_cache.invalidate(scope[0])
+            entry = self.retrieval_cache.get(scope, question)
+            if entry is not None and entry["limit"] >= top_k:
+                RETRIEVAL_CACHE_TOTAL.inc(result="hit")
+                return entry["docs"][:top_k], entry["embedding"]
+        
+            mode = scope[2]
+            query_embedding = None
+            if mode != "lexical" and not is_identifier_query(question):
+                query_embedding = vector_store.embed_query(question)
+                similar = self.retrieval_cache.find_similar(scope, query_embedding)
+                if similar is not None and similar["limit"] >= top_k:
+                    RETRIEVAL_CACHE_TOTAL.inc(result="similar")
+                    with stage_timer("vector_search"):
+                        if mode == "dense":
+                            return rerank_candidates(similar, query_embedding, top_k), query_embedding
+                        candidates = max(top_k, config.HYBRID_CANDIDATES)
+                        dense = rerank_candidates(similar, query_embedding, candidates)
+                        lexical = vector_store.lexical_search(question, top_k=candidates, source_filter=source_filter,
+                                                              metadata_filter=metadata_filter)
+                        return reciprocal_rank_fusion([dense, lexical], top_k), query_embedding
+        
+            RETRIEVAL_CACHE_TOTAL.inc(result="miss")
+            docs = vector_store.search(question, top_k=top_k, source_filter=source_filter, ef_search=ef_search,
+                                       mode=search_mode, query_embedding=query_embedding,
+                                       metadata_filter=metadata_filter)
+            self.retrieval_cache.put(scope, question, query_embedding, docs, limit=top_k)
+            return docs, query_embedding
+    
+    def prefetch(self, question: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+                 ef_search: Optional[int] = None, search_mode: Optional[str] = None,
+                 tenant: Optional[str] = None, metadata_filter: Optional[Dict[str, Any]] = None,
+                 ttl_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Speculatively retrieve candidates for a partially typed question.
+        
+        Embeds the partial question, retrieves PREFETCH_CANDIDATES chunks with
+        their embeddings and caches them (for `ttl_seconds`, default
+        PREFETCH_TTL_SECONDS), so the final query can reuse them.
+        """
+        top_k = top_k or config.TOP_K
+        metadata_filter = normalize_metadata_filter(metadata_filter)
+        if not config.PREFETCH_ENABLED:
+            return {"status": "disabled"}
+        if len(normalize_question(question)) < config.PREFETCH_MIN_CHARS:
+            PREFETCH_TOTAL.inc(status="skipped")
+            return {"status": "skipped"}
+        
+        with self.store_for(tenant) as vector_store:
+            scope = self._retrieval_scope(source_filter, ef_search, search_mode, tenant, metadata_filter)
+            if self.read_only and vector_store.refresh_if_stale():
+                self.retrieval_cache.invalidate(scope[0])
+            limit = max(self.reranker.candidates(top_k), config.PREFETCH_CANDIDATES)
+            entry = self.retrieval_cache.get(scope, question)
+            if entry is not None and entry["limit"] >= limit:
+                PREFETCH_TOTAL.inc(status="cached")
+                return {"status": "cached", "candidates": len(entry["docs"])}
+        
+            query_embedding = None
+            if scope[2] != "lexical" and not is_identifier_query(question):
+                query_embedding = vector_store.embed_query(question)
+            docs = vector_store.search(question, top_k=limit, source_filter=source_filter, ef_search=ef_search,
+                                       mode=search_mode, query_embedding=query_embedding,
+                                       metadata_filter=metadata_filter)
+            doc_embeddings = None
+            if query_embedding is not None and docs:
+                by_id = vector_store.get_embeddings([doc["id"] for doc in docs])
+                if all(doc["id"] in by_id for doc in docs):
+                    doc_embeddings = [by_id[doc["id"]] for doc in docs]
+            self.retrieval_cache.put(scope, question, query_embedding, docs, limit=limit, doc_embeddings=doc_embeddings,
+                                     ttl_seconds=ttl_seconds)
+            PREFETCH_TOTAL.inc(status="prefetched")
+            return {"status": "prefetched", "candidates": len(docs)}
+    
+    def warm_from_log(self, limit: int = None, hours: float = None) -> Dict[str, Any]:
+        """Prefetch the most frequent recently logged questions into the retrieval cache.
+        
+        Besides the cached results this loads each queried tenant's store and
+        its lazily loaded indexes before real traffic arrives.
+        """
+        limit = limit if limit is not None else config.QUERY_LOG_WARM_QUERIES
+        hours = hours if hours is not None else config.QUERY_LOG_WARM_HOURS
+        if limit <= 0 or not config.PREFETCH_ENABLED:
+            return {"queries": 0, "warmed": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        queries = most_frequent(read_records(since=time.time() - hours * 3600), limit)
+        warmed = 0
+        for record in queries:
+            try:
+                result = self.prefetch(
+                    record["question"],
+                    top_k=record.get("top_k"),
+                    source_filter=record.get("source_filter"),
+                    ef_search=record.get("ef_search"),
+                    search_mode=record.get("search_mode"),
+                    tenant=record.get("tenant"),
+                    metadata_filter=record.get("filters"),
+                    ttl_seconds=config.QUERY_LOG_WARM_TTL_SECONDS
+                )
+            except Exception as e:
+                # Tenants can be gone and filters invalid by now
+                print(f"Warning: could not warm query {record['question']!r}: {e}")
+                continue
+            warmed += result["status"] in ("prefetched", "cached")
+        return {"queries": len(queries), "warmed": warmed, "seconds": round(time.perf_counter() - start, 3)}
+    
     def _extract_sources(self, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         """Extract source information from retrieved documents."""
         sources = []
@@ -102,7 +388,8 @@ class RAGPipeline:
         
         return sources
     
-    def get_stats(self) -> Dict[str, Any]:
-        """Get statistics about the knowledge base."""
-        return self.vector_store.get_collection_info()
+    def get_stats(self, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Get statistics about a tenant's knowledge base."""
+        with self.store_for(tenant) as vector_store:
+            return {"tenant": resolve_tenant(tenant), **vector_store.get_collection_info()}
 
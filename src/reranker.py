@@ -0,0 +1,200 @@
+"""Second-stage reranking: retrieve wide, pass only the best few to the LLM.
+
+With RERANK_MODE set, the pipeline retrieves RERANK_CANDIDATES chunks and
+reranks them here, so top_k can stay small (and the prompt short) without
+losing the good chunks the first stage ranked lower:
+
+- `mmr`: maximal marginal relevance over the stored embeddings; it trades
+  similarity to the question against redundancy with chunks already picked
+- `cross-encoder`: scores (question, chunk) pairs in batches with a local
+  sentence-transformers CrossEncoder (RERANK_MODEL)
+
+Results are cached by question and candidate IDs. Chunk IDs are content
+hashes, so a cached order stays valid until the candidates change.
+
+The stage keeps a running estimate of its cost per candidate. When reranking
+all candidates would exceed RERANK_BUDGET_MS, only the leading candidates
+that fit are reranked. When not even top_k fit, reranking is skipped. The
+estimate halves every COST_HALF_LIFE_SECONDS without a new measurement, so
+one slow call (a GC pause, a busy CPU) does not disable the stage for good.
+The first run warms the model up and is not measured. Cross-encoder scoring
+also stops at the budget by the clock; candidates left unscored keep their
+first-stage order after the scored ones.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import CrossEncoder
+
+import src.config as config
+from src.metrics import stage_timer, RERANK_TOTAL
+from src.retrieval_cache import normalize_question
+
+RERANK_MODES = ("none", "mmr", "cross-encoder")
+# Age after which a cost estimate counts half (seconds)
+COST_HALF_LIFE_SECONDS = 30.0
+
+# Cross-encoders are loaded once per process, like the embedding models
+_cross_encoders: Dict[str, CrossEncoder] = {}
+
+
+def get_cross_encoder(model_name: str = None) -> CrossEncoder:
+    """Return the process-wide cross-encoder, loading it on first use."""
+    model_name = model_name or config.RERANK_MODEL
+    if model_name not in _cross_encoders:
+        _cross_encoders[model_name] = CrossEncoder(model_name)
+    return _cross_encoders[model_name]
+
+
+def mmr_order(query: np.ndarray, vectors: np.ndarray, top_k: int,
+              diversity_lambda: float) -> List[Tuple[int, float]]:
+    """(index, cosine relevance) of `top_k` rows picked by maximal marginal relevance."""
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    relevance = vectors @ query
+    # Highest similarity of each candidate to any chunk picked so far
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    order = []
+    for _ in range(min(top_k, len(vectors))):
+        penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+        scores = diversity_lambda * relevance - (1.0 - diversity_lambda) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        order.append((best, float(relevance[best])))
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return order
+
+
+class Reranker:
+    """Reranks candidate chunks with MMR or a cross-encoder, within a latency budget."""
+
+    def __init__(self, mode: str = None, budget_ms: float = None, cache_size: int = None):
+        self.mode = mode or config.RERANK_MODE
+        if self.mode not in RERANK_MODES:
+            raise ValueError(f"Unknown RERANK_MODE: {self.mode}. Use one of {', '.join(RERANK_MODES)}.")
+        self.budget_ms = budget_ms if budget_ms is not None else config.RERANK_BUDGET_MS
+        self.cache_size = cache_size or config.RERANK_CACHE_SIZE
+        self._cache: "OrderedDict[tuple, List[Any]]" = OrderedDict()
+        # Running average of the rerank cost per candidate (ms), and when it was last measured
+        self._ms_per_candidate: Optional[float] = None
+        self._measured_at = 0.0
+        self._warmed_up = False
+        self._lock = threading.Lock()
+        if self.mode == "cross-encoder":
+            get_cross_encoder()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    def candidates(self, top_k: int) -> int:
+        """How many chunks the first stage should retrieve for a final `top_k`."""
+        return max(top_k, config.RERANK_CANDIDATES) if self.enabled else top_k
+
+    def _affordable(self, count: int) -> int:
+        """Number of candidates that can be reranked within the budget."""
+        with self._lock:
+            per_candidate = self._estimated_cost()
+        if per_candidate is None or self.budget_ms <= 0:
+            return count
+        return min(count, int(self.budget_ms / max(per_candidate, 1e-6)))
+
+    def _estimated_cost(self) -> Optional[float]:
+        """Cost per candidate (ms), decayed by the age of the last measurement; needs the lock."""
+        if self._ms_per_candidate is None:
+            return None
+        age = time.monotonic() - self._measured_at
+        return self._ms_per_candidate * 0.5 ** (age / COST_HALF_LIFE_SECONDS)
+
+    def _record_cost(self, elapsed_ms: float, count: int) -> None:
+        per_candidate = elapsed_ms / max(count, 1)
+        with self._lock:
+            if not self._warmed_up:
+                # The first call includes one-time model and kernel warm-up
+                self._warmed_up = True
+                return
+            previous = self._estimated_cost()
+            if previous is None:
+                self._ms_per_candidate = per_candidate
+            else:
+                self._ms_per_candidate = 0.8 * previous + 0.2 * per_candidate
+            self._measured_at = time.monotonic()
+
+    def rerank(self, question: str, docs: List[Dict[str, Any]], top_k: int, vector_store,
+               query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Return the best `top_k` of the candidate docs.
+
+        Args:
+            question: The user's question
+            docs: First-stage candidates, best first
+            top_k: Number of docs to keep
+            vector_store: Store holding the candidates' embeddings (for MMR)
+            query_embedding: Embedding of the question, if already computed
+        """
+        if not self.enabled or len(docs) <= 1:
+            return docs[:top_k]
+
+        key = (self.mode, normalize_question(question), top_k, tuple(doc["id"] for doc in docs))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            RERANK_TOTAL.inc(result="cached")
+            return [{**docs[i], "rerank_score": score} for i, score in cached]
+
+        count = self._affordable(len(docs))
+        if count <= top_k:
+            RERANK_TOTAL.inc(result="skipped")
+            return docs[:top_k]
+
+        start = time.perf_counter()
+        with stage_timer("rerank"):
+            ranked, scored = self._rank(question, docs[:count], top_k, vector_store, query_embedding, start)
+        self._record_cost((time.perf_counter() - start) * 1000, scored)
+        if ranked is None:
+            RERANK_TOTAL.inc(result="skipped")
+            return docs[:top_k]
+        RERANK_TOTAL.inc(result="reranked" if scored == len(docs) else "trimmed")
+
+        if scored == len(docs):
+            with self._lock:
+                self._cache[key] = ranked
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [{**docs[i], "rerank_score": score} for i, score in ranked]
+
+    def _rank(self, question: str, docs: List[Dict[str, Any]], top_k: int, vector_store,
+              query_embedding: Optional[List[float]], start: float) -> Tuple[Optional[List[Any]], int]:
+        """(index, score) pairs of the best `top_k` docs (None if they cannot be scored), and the number scored."""
+        if self.mode == "cross-encoder":
+            model = get_cross_encoder()
+            pairs = [(question, doc["text"]) for doc in docs]
+            deadline = start + self.budget_ms / 1000 if self.budget_ms > 0 else None
+            scores: List[float] = []
+            for batch_start in range(0, len(pairs), config.RERANK_BATCH_SIZE):
+                batch = pairs[batch_start:batch_start + config.RERANK_BATCH_SIZE]
+                batch_scores = model.predict(batch, batch_size=len(batch), show_progress_bar=False)
+                scores.extend(float(x) for x in batch_scores)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+            order = np.argsort(-np.asarray(scores))[:top_k]
+            ranked = [(int(i), round(scores[i], 6)) for i in order]
+            # Candidates the budget left unscored follow in first-stage order
+            ranked += [(i, None) for i in range(len(scores), len(docs))][:top_k - len(ranked)]
+            return ranked, len(scores)
+
+        by_id = vector_store.get_embeddings([doc["id"] for doc in docs])
+        if not all(doc["id"] in by_id for doc in docs):
+            return None, len(docs)
+        if query_embedding is None:
+            query_embedding = vector_store.embed_query(question)
+        vectors = np.asarray([by_id[doc["id"]] for doc in docs], dtype=np.float32)
+        order = mmr_order(np.asarray(query_embedding, dtype=np.float32), vectors, top_k,
+                          config.RERANK_MMR_LAMBDA)
+        return [(i, round(relevance, 6)) for i, relevance in order], len(docs)
@@ -0,0 +1,112 @@
+"""Retrieval cache for repeated and prefetched questions.
+
+The web UI sends the partial question to `/api/prefetch` while the user is
+still typing. Prefetching embeds it, retrieves a wider candidate set and
+stores both here. When the final question arrives:
+
+- an identical question (after normalization) reuses the cached results
+  without embedding or searching again
+- a question whose embedding is close to a prefetched one re-ranks the
+  prefetched candidates instead of running a new vector search
+
+Entries expire after PREFETCH_TTL_SECONDS (entries warmed from the query
+log can live longer) and are dropped when the tenant's documents change.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import src.config as config
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question used as cache key."""
+    return _WHITESPACE_RE.sub(" ", question).strip().lower().rstrip("?!. ")
+
+
+class RetrievalCache:
+    """Thread-safe LRU of retrieval results with TTL.
+
+    Entries are grouped by scope (tenant, filters, search mode, ...), since
+    results are only reusable under identical retrieval settings.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or config.PREFETCH_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.PREFETCH_TTL_SECONDS
+        self._entries: "OrderedDict[Tuple[tuple, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() > entry["expires"]
+
+    def put(self, scope: tuple, question: str, embedding: Optional[List[float]], docs: List[Dict[str, Any]],
+            limit: int, doc_embeddings: Optional[List[List[float]]] = None,
+            ttl_seconds: Optional[float] = None) -> None:
+        """Cache the results of a search for up to `limit` docs (and optionally their embeddings)."""
+        key = (scope, normalize_question(question))
+        entry = {
+            "expires": time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds),
+            "limit": limit,
+            "embedding": np.asarray(embedding, dtype=np.float32) if embedding is not None else None,
+            "docs": docs,
+            "doc_embeddings": np.asarray(doc_embeddings, dtype=np.float32) if doc_embeddings else None
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, scope: tuple, question: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for exactly this (normalized) question."""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def find_similar(self, scope: tuple, embedding: List[float],
+                     min_similarity: float = None) -> Optional[Dict[str, Any]]:
+        """Return the most similar prefetched entry in a scope, if close enough."""
+        min_similarity = min_similarity if min_similarity is not None else config.PREFETCH_SIMILARITY
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        best, best_similarity = None, min_similarity
+        with self._lock:
+            entries = [entry for (entry_scope, _), entry in self._entries.items()
+                       if entry_scope == scope and entry["doc_embeddings"] is not None
+                       and not self._expired(entry)]
+        for entry in entries:
+            vector = entry["embedding"]
+            similarity = float(vector @ query) / max(float(np.linalg.norm(vector)), 1e-12)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        return best
+
+    def invalidate(self, tenant: str) -> None:
+        """Drop all entries of a tenant (scopes start with the tenant)."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0][0] == tenant]:
+                del self._entries[key]
+
+
+def rerank_candidates(entry: Dict[str, Any], embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+    """Order prefetched candidates by cosine distance to a new query embedding."""
+    query = np.asarray(embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    vectors = entry["doc_embeddings"]
+    similarities = (vectors @ query) / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+    order = np.argsort(-similarities)[:top_k]
+    return [{**entry["docs"][i], "distance": float(1.0 - similarities[i])} for i in order]
@@ -0,0 +1,126 @@
+"""Multi-turn chat sessions.
+
+A session remembers, per conversation, the chunks already shown to the LLM,
+the recent (question, answer) turns and, with Ollama, the token context the
+model returned for the last turn. Follow-up questions then send only newly
+retrieved chunks: Ollama continues from the returned context (its cached
+prompt prefix is not processed again), while stateless backends get a
+trimmed window of recent turns resent.
+
+Sessions live in a small SQLite database so every worker process of a
+multi-worker deployment sees them. They expire SESSION_TTL_SECONDS after
+their last use. Concurrent turns on the same session are not serialized;
+the last one to finish wins.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import src.config as config
+
+
+class SessionError(ValueError):
+    """Raised for unknown or expired sessions."""
+
+    def __init__(self, message: str, status_code: int = 404):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChatSession:
+    """State of one conversation."""
+
+    def __init__(self, session_id: str, tenant: str, turns: List[Tuple[str, str]] = None,
+                 chunk_ids: List[str] = None, llm_context: List[int] = None):
+        self.session_id = session_id
+        self.tenant = tenant
+        self.turns = [tuple(turn) for turn in turns or []]
+        self.chunk_ids = list(chunk_ids or [])  # In the order they were numbered for the LLM
+        self.llm_context = list(llm_context or [])
+
+    def history(self) -> List[Tuple[str, str]]:
+        """Most recent turns, at most SESSION_HISTORY_TURNS."""
+        return self.turns[-config.SESSION_HISTORY_TURNS:] if config.SESSION_HISTORY_TURNS > 0 else []
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.turns.append((question, answer))
+        self.turns = self.history()
+
+    def to_json(self) -> str:
+        return json.dumps({"turns": self.turns, "chunk_ids": self.chunk_ids, "llm_context": self.llm_context})
+
+
+class SessionStore:
+    """SQLite-backed chat sessions with TTL eviction."""
+
+    def __init__(self, path: Path = None, ttl_seconds: int = None):
+        self.path = Path(path or config.SESSION_DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.SESSION_TTL_SECONDS
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        # WAL lets worker processes read sessions while another one saves
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                tenant TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                state TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+        """)
+
+    def create(self, tenant: str) -> ChatSession:
+        """Start a new session (and drop expired ones)."""
+        session = ChatSession(uuid.uuid4().hex, tenant)
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE last_used < ?", (time.time() - self.ttl_seconds,))
+            self._db.execute(
+                "INSERT INTO sessions (id, tenant, last_used, state) VALUES (?, ?, ?, ?)",
+                (session.session_id, tenant, time.time(), session.to_json())
+            )
+            self._db.commit()
+        return session
+
+    def get(self, session_id: str, tenant: str) -> ChatSession:
+        """Load a live session of a tenant; raises SessionError (404) otherwise."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tenant, last_used, state FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or row[0] != tenant or time.time() - row[1] > self.ttl_seconds:
+            raise SessionError(f"Unknown or expired session: {session_id}")
+        state: Dict[str, Any] = json.loads(row[2])
+        return ChatSession(session_id, tenant, **state)
+
+    def save(self, session: ChatSession) -> None:
+        """Persist a session after a turn and refresh its TTL."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, tenant, last_used, state) VALUES (?, ?, ?, ?)",
+                (session.session_id, session.tenant, time.time(), session.to_json())
+            )
+            self._db.commit()
+
+    def delete(self, session_id: str, tenant: str) -> bool:
+        """End a session; returns whether it existed."""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sessions WHERE id = ? AND tenant = ?", (session_id, tenant))
+            self._db.commit()
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        """Number of live sessions."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_used >= ?", (time.time() - self.ttl_seconds,)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
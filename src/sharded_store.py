@@ -0,0 +1,343 @@
+"""Sharded vector store with scatter-gather search.
+
+Chunks are partitioned across N shards by a hash of their source, so all
+chunks of one document live on one shard. Each shard is a regular
+`VectorStore` with its own persist directory, either opened in this process
+or served by a separate local shard process (see `serve_shard`). Searches
+embed the query once, fan out to the relevant shards in parallel and merge
+the per-shard top-k by distance.
+
+Run a shard in its own process (SHARD_AUTHKEY must be set; the shard binds
+to 127.0.0.1 unless --host says otherwise):
+    SHARD_AUTHKEY=<secret> python -m src.sharded_store serve --shard 0 --port 7100
+"""
+import argparse
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.lexical_index import hybrid_search
+from src.metrics import stage_timer, RETRIEVED_DOCS
+from src.vector_store import VectorStore, get_embedding_model, merge_into_parents
+import src.config as config
+
+# Methods a shard process exposes to clients
+SHARD_METHODS = (
+    "add_documents", "replace_source", "delete_source", "search_by_embedding", "lexical_search",
+    "get_embeddings", "get_chunk_texts", "refresh_if_stale",
+    "get_collection_info", "delete_collection", "import_chunks", "export_batch",
+    "import_parents", "export_parent_batch"
+)
+
+
+def shard_authkey() -> bytes:
+    """The shared secret of shard connections; refuses to run without one."""
+    if not config.SHARD_AUTHKEY:
+        raise ValueError("SHARD_AUTHKEY must be set to use shard processes")
+    return config.SHARD_AUTHKEY.encode("utf-8")
+
+
+def shard_for_source(source: str, num_shards: int) -> int:
+    """Return the shard index that owns a source."""
+    return int(hashlib.sha1(source.encode("utf-8")).hexdigest()[:8], 16) % num_shards
+
+
+def shard_directory(num_shards: int, shard: int, base_dir: Path = None) -> Path:
+    """Persist directory of one shard in an N-shard layout."""
+    return Path(base_dir or config.CHROMA_DB_DIR) / f"shards_{num_shards}" / f"shard_{shard:02d}"
+
+
+class LocalShard:
+    """A shard opened in this process."""
+
+    def __init__(self, store: VectorStore):
+        self.store = store
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        return getattr(self.store, method)(*args, **kwargs)
+
+
+class RemoteShard:
+    """A shard served by a separate local process."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.address, authkey=self.authkey)
+            try:
+                self._conn.send((method, args, kwargs))
+                ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                # Shard process restarted; reconnect on next call
+                self._conn = None
+                raise
+        if not ok:
+            raise RuntimeError(f"Shard {self.address[0]}:{self.address[1]} error in {method}: {result}")
+        return result
+
+
+class ShardedVectorStore:
+    """Vector store partitioned across shards by source hash.
+
+    Exposes the same interface as `VectorStore`.
+    """
+
+    def __init__(self, num_shards: int = None, shard_addresses: Optional[List[str]] = None,
+                 base_dir: Path = None, read_only: bool = False, collection_name: str = None):
+        self.embedding_model = get_embedding_model()
+        self.collection_name = collection_name or config.CHROMA_COLLECTION_NAME
+        addresses = shard_addresses if shard_addresses is not None else config.VECTOR_SHARD_ADDRESSES
+        if addresses:
+            authkey = shard_authkey()
+            self.shards = [RemoteShard(_parse_address(a), authkey) for a in addresses]
+        else:
+            num_shards = num_shards or config.VECTOR_SHARDS
+            self.shards = [
+                LocalShard(VectorStore(persist_directory=shard_directory(num_shards, i, base_dir),
+                                       read_only=read_only, collection_name=collection_name))
+                for i in range(num_shards)
+            ]
+        self.num_shards = len(self.shards)
+        self._executor = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="shard")
+
+    def _shard(self, source: str):
+        return self.shards[shard_for_source(source, self.num_shards)]
+
+    def _submit(self, shard: int, method: str, *args, **kwargs):
+        """Call a method on a shard in the pool, within the caller's context.
+
+        Each call runs in its own copy of the context, so local shards record
+        their stage timings into the current request's timings.
+        """
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self.shards[shard].call, method, *args, **kwargs)
+
+    def _scatter(self, shard_indexes: List[int], method: str, *args, **kwargs) -> List[Any]:
+        """Call a method on several shards in parallel."""
+        futures = [self._submit(i, method, *args, **kwargs) for i in shard_indexes]
+        return [future.result() for future in futures]
+
+    def add_documents(self, chunks: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Route chunks to their shards and upsert them."""
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            shard = shard_for_source(chunk["metadata"].get("source", ""), self.num_shards)
+            by_shard.setdefault(shard, []).append(chunk)
+        totals = {"added": 0, "unchanged": 0}
+        for shard, shard_chunks in by_shard.items():
+            result = self.shards[shard].call("add_documents", shard_chunks)
+            for key in totals:
+                totals[key] += result.get(key, 0)
+        return totals
+
+    def replace_source(self, source: str, chunks: List[Dict[str, Any]]) -> Dict[str, int]:
+        return self._shard(source).call("replace_source", source, chunks)
+
+    def delete_source(self, source: str) -> int:
+        return self._shard(source).call("delete_source", source)
+
+    def import_chunks(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+        """Route chunks with precomputed embeddings to their shards."""
+        by_shard: Dict[int, Tuple[list, list]] = {}
+        for chunk, embedding in zip(chunks, embeddings):
+            shard = shard_for_source(chunk["metadata"].get("source", ""), self.num_shards)
+            shard_chunks, shard_embeddings = by_shard.setdefault(shard, ([], []))
+            shard_chunks.append(chunk)
+            shard_embeddings.append(embedding)
+        for shard, (shard_chunks, shard_embeddings) in by_shard.items():
+            self.shards[shard].call("import_chunks", shard_chunks, shard_embeddings)
+
+    def import_parents(self, parents: List[Dict[str, Any]]) -> None:
+        """Route parent chunks to their shards."""
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for parent in parents:
+            shard = shard_for_source(parent["metadata"].get("source", ""), self.num_shards)
+            by_shard.setdefault(shard, []).append(parent)
+        for shard, shard_parents in by_shard.items():
+            self.shards[shard].call("import_parents", shard_parents)
+
+    def embed_query(self, query: str) -> List[float]:
+        with stage_timer("query_embedding"):
+            return self.embedding_model.encode([query], show_progress_bar=False).tolist()[0]
+
+    def search(self, query: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+               ef_search: Optional[int] = None, mode: str = None,
+               query_embedding: Optional[List[float]] = None,
+               metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search all relevant shards and merge (or fuse) the results."""
+        return hybrid_search(self, query, top_k or config.TOP_K, source_filter=source_filter,
+                             ef_search=ef_search, mode=mode, query_embedding=query_embedding,
+                             metadata_filter=metadata_filter)
+
+    def _target_shards(self, source_filter: Optional[List[str]]) -> List[int]:
+        if source_filter:
+            # Only shards that own a filtered source can match
+            return sorted({shard_for_source(s, self.num_shards) for s in source_filter})
+        return list(range(self.num_shards))
+
+    def refresh_if_stale(self) -> bool:
+        """Reload every shard the writer changed since it was opened; True if any was stale."""
+        return any(self._scatter(list(range(self.num_shards)), "refresh_if_stale"))
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Collect stored embeddings of chunk IDs from all shards."""
+        embeddings = {}
+        for shard_embeddings in self._scatter(list(range(self.num_shards)), "get_embeddings", ids):
+            embeddings.update(shard_embeddings)
+        return embeddings
+
+    def expand_to_parents(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace child chunk hits by their parents, fetched from the owning shards in parallel."""
+        by_shard: Dict[int, List[str]] = {}
+        for doc in docs:
+            parent_id = doc["metadata"].get("parent_id")
+            if parent_id:
+                shard = shard_for_source(doc["metadata"].get("source", ""), self.num_shards)
+                by_shard.setdefault(shard, []).append(parent_id)
+        if not by_shard:
+            return docs
+        with stage_timer("parent_fetch"):
+            futures = [self._submit(shard, "get_chunk_texts", list(dict.fromkeys(ids)))
+                       for shard, ids in by_shard.items()]
+            parent_texts = {}
+            for future in futures:
+                parent_texts.update(future.result())
+        return merge_into_parents(docs, parent_texts)
+
+    def lexical_search(self, query: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+                       metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """BM25 search on all relevant shards, merged by score (shard-local IDF)."""
+        top_k = top_k or config.TOP_K
+        with stage_timer("lexical_search_fanout"):
+            results = self._scatter(self._target_shards(source_filter), "lexical_search", query,
+                                    top_k=top_k, source_filter=source_filter, metadata_filter=metadata_filter)
+        merged = [doc for shard_docs in results for doc in shard_docs]
+        merged.sort(key=lambda doc: doc["score"], reverse=True)
+        return merged[:top_k]
+
+    def search_by_embedding(self, query_embedding: List[float], top_k: int = None,
+                            source_filter: Optional[List[str]] = None,
+                            ef_search: Optional[int] = None,
+                            metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        top_k = top_k or config.TOP_K
+        with stage_timer("vector_search_fanout"):
+            results = self._scatter(self._target_shards(source_filter), "search_by_embedding", query_embedding,
+                                    top_k=top_k, source_filter=source_filter, ef_search=ef_search,
+                                    metadata_filter=metadata_filter)
+        merged = [doc for shard_docs in results for doc in shard_docs]
+        merged.sort(key=lambda doc: doc["distance"] if doc["distance"] is not None else float("inf"))
+        retrieved_docs = merged[:top_k]
+        RETRIEVED_DOCS.observe(len(retrieved_docs))
+        return retrieved_docs
+
+    def export_chunks(self, batch_size: int = 1000):
+        """Yield all chunks and embeddings from every shard, in batches."""
+        for shard in self.shards:
+            offset = 0
+            while True:
+                chunks, embeddings = shard.call("export_batch", offset, batch_size)
+                if not chunks:
+                    break
+                yield chunks, embeddings
+                offset += len(chunks)
+
+    def export_parents(self, batch_size: int = 100):
+        """Yield the parent chunks of every shard, in batches of sources."""
+        for shard in self.shards:
+            offset = 0
+            while True:
+                parents, scanned = shard.call("export_parent_batch", offset, batch_size)
+                if not scanned:
+                    break
+                if parents:
+                    yield parents
+                offset += scanned
+
+    def get_collection_info(self) -> Dict[str, Any]:
+        infos = self._scatter(list(range(self.num_shards)), "get_collection_info")
+        sources = set()
+        for info in infos:
+            sources.update(info["sources"])
+        return {
+            "count": sum(info["count"] for info in infos),
+            "collection_name": self.collection_name,
+            "sources": sorted(sources),
+            "chunk_store_bytes": sum(info.get("chunk_store_bytes", 0) for info in infos),
+            "lexical_index_bytes": sum(info.get("lexical_index_bytes", 0) for info in infos),
+            "hnsw": infos[0].get("hnsw") if infos else None,
+            "vector_compression": [info.get("vector_compression") for info in infos],
+            "metadata_index": [info.get("metadata_index") for info in infos],
+            "shards": [info["count"] for info in infos]
+        }
+
+    def delete_collection(self) -> None:
+        self._scatter(list(range(self.num_shards)), "delete_collection")
+
+    def close(self) -> None:
+        """Close in-process shards (remote shard processes keep running)."""
+        for shard in self.shards:
+            if isinstance(shard, LocalShard):
+                shard.store.close()
+        self._executor.shutdown(wait=False)
+
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve_shard(shard: int, num_shards: int, port: int, host: str = "127.0.0.1", base_dir: Path = None) -> None:
+    """Serve one shard's VectorStore to clients over a local socket."""
+    authkey = shard_authkey()
+    store = LocalShard(VectorStore(persist_directory=shard_directory(num_shards, shard, base_dir)))
+    listener = Listener((host, port), authkey=authkey)
+    print(f"Serving shard {shard}/{num_shards} on {host}:{port}")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if method not in SHARD_METHODS:
+                    conn.send((False, f"Unknown method: {method}"))
+                    continue
+                try:
+                    conn.send((True, store.call(method, *args, **kwargs)))
+                except Exception as e:
+                    conn.send((False, str(e)))
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def main():
+    """Run a shard server process."""
+    parser = argparse.ArgumentParser(description="Serve one vector store shard.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--shard", type=int, required=True)
+    serve_parser.add_argument("--num-shards", type=int, default=config.VECTOR_SHARDS)
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+    try:
+        serve_shard(args.shard, args.num_shards, args.port, host=args.host)
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Knowledge base snapshots for fast cold starts.
+
+A snapshot is a single file holding every chunk's vector, metadata and text
+plus a manifest, so a fresh container can load a prebuilt index instead of
+re-embedding `docs/`. Parent chunks of hierarchical chunking (text only, no
+vectors) are kept in their own section. Layout:
+
+    MAGIC (8 bytes) | manifest length (uint32 LE) | manifest JSON | padding
+    | embeddings (float32, count x dim, 64-byte aligned)
+    | ids | metadatas | texts | parents   (zlib-compressed JSON)
+
+The manifest records the format version, embedding model and dimension,
+chunking config and a SHA-256 per section. Loading memory-maps the file and
+reads the embedding matrix in place.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+import src.config as config
+
+MAGIC = b"RAGSNAP1"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is invalid or incompatible."""
+
+
+def _expected_manifest() -> Dict[str, Any]:
+    """Settings a snapshot must match to be loaded."""
+    return {
+        "embedding_model": config.EMBEDDING_MODEL,
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+        # Absent (None) in snapshots of flat chunking
+        "child_chunk_size": config.CHILD_CHUNK_SIZE if config.HIERARCHICAL_CHUNKING else None,
+        "child_chunk_overlap": config.CHILD_CHUNK_OVERLAP if config.HIERARCHICAL_CHUNKING else None
+    }
+
+
+def export_snapshot(vector_store, path: Path, batch_size: int = 1000) -> Dict[str, Any]:
+    """Write all chunks of a vector store to a snapshot file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    ids, metadatas, texts = [], [], []
+    dim = None
+    # Stream embeddings to a temp file so large indexes are not held twice in memory
+    with tempfile.TemporaryFile(dir=path.parent) as vectors:
+        vector_digest = hashlib.sha256()
+        for chunks, embeddings in vector_store.export_chunks(batch_size=batch_size):
+            block = np.asarray(embeddings, dtype="<f4")
+            dim = dim or block.shape[1]
+            data = block.tobytes()
+            vectors.write(data)
+            vector_digest.update(data)
+            for chunk in chunks:
+                ids.append(chunk["id"])
+                metadatas.append(chunk["metadata"])
+                texts.append(chunk["text"])
+        parents = [parent for batch in vector_store.export_parents() for parent in batch]
+
+        sections = {
+            "ids": zlib.compress(json.dumps(ids).encode("utf-8"), 6),
+            "metadatas": zlib.compress(json.dumps(metadatas).encode("utf-8"), 6),
+            "texts": zlib.compress(json.dumps(texts).encode("utf-8"), 6),
+            "parents": zlib.compress(json.dumps(parents).encode("utf-8"), 6)
+        }
+        vector_bytes = vectors.tell()
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "collection_name": config.CHROMA_COLLECTION_NAME,
+            "count": len(ids),
+            "parent_count": len(parents),
+            "embedding_dim": dim or 0,
+            **_expected_manifest(),
+            "sections": {}
+        }
+        # Section offsets are relative to the (aligned) start of the data area
+        offset = 0
+        manifest["sections"]["embeddings"] = {
+            "offset": offset, "length": vector_bytes, "sha256": vector_digest.hexdigest()
+        }
+        offset += vector_bytes
+        for name, payload in sections.items():
+            manifest["sections"][name] = {
+                "offset": offset, "length": len(payload), "sha256": hashlib.sha256(payload).hexdigest()
+            }
+            offset += len(payload)
+
+        manifest_bytes = json.dumps(manifest, sort_keys=True).encode("utf-8")
+        header_len = len(MAGIC) + 4 + len(manifest_bytes)
+        padding = (-header_len) % ALIGNMENT
+
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(manifest_bytes)))
+            f.write(manifest_bytes)
+            f.write(b"\0" * padding)
+            vectors.seek(0)
+            for block in iter(lambda: vectors.read(1024 * 1024), b""):
+                f.write(block)
+            for payload in sections.values():
+                f.write(payload)
+        os.replace(tmp_path, path)
+
+    return manifest
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise SnapshotError(f"{self.path} is not a snapshot file")
+        (manifest_len,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.manifest = json.loads(self._map[start:start + manifest_len].decode("utf-8"))
+        header_len = start + manifest_len
+        self.data_offset = header_len + (-header_len) % ALIGNMENT
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def _section(self, name: str) -> memoryview:
+        section = self.manifest["sections"][name]
+        start = self.data_offset + section["offset"]
+        return memoryview(self._map)[start:start + section["length"]]
+
+    def check_compatible(self) -> None:
+        """Raise SnapshotError if the snapshot was built with different settings."""
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise SnapshotError(
+                f"Unsupported snapshot format {self.manifest.get('format_version')} (expected {FORMAT_VERSION})"
+            )
+        for key, expected in _expected_manifest().items():
+            if self.manifest.get(key) != expected:
+                raise SnapshotError(
+                    f"Snapshot {key}={self.manifest.get(key)!r} does not match current config {expected!r}"
+                )
+
+    def verify(self) -> None:
+        """Raise SnapshotError if any section checksum does not match."""
+        for name, section in self.manifest["sections"].items():
+            if hashlib.sha256(self._section(name)).hexdigest() != section["sha256"]:
+                raise SnapshotError(f"Checksum mismatch in snapshot section '{name}'")
+
+    def embeddings(self) -> np.ndarray:
+        """Embedding matrix backed directly by the memory map."""
+        count, dim = self.manifest["count"], self.manifest["embedding_dim"]
+        return np.frombuffer(self._section("embeddings"), dtype="<f4").reshape(count, dim)
+
+    def load_json(self, name: str) -> Any:
+        return json.loads(zlib.decompress(self._section(name)).decode("utf-8"))
+
+
+def import_snapshot(vector_store, path: Path, verify: bool = True, force: bool = False,
+                    batch_size: int = 1000) -> Dict[str, Any]:
+    """Load a snapshot into a vector store (without re-embedding)."""
+    snapshot = Snapshot(path)
+    try:
+        if not force:
+            snapshot.check_compatible()
+        if verify:
+            snapshot.verify()
+
+        # Parents first, so every child's parent can be resolved once it is searchable
+        if "parents" in snapshot.manifest["sections"]:
+            parents = snapshot.load_json("parents")
+            for start in range(0, len(parents), batch_size):
+                vector_store.import_parents(parents[start:start + batch_size])
+
+        embeddings = snapshot.embeddings()
+        ids = snapshot.load_json("ids")
+        metadatas = snapshot.load_json("metadatas")
+        texts = snapshot.load_json("texts")
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            chunks = [
+                {"id": chunk_id, "text": text, "metadata": metadata}
+                for chunk_id, text, metadata in zip(ids[start:end], texts[start:end], metadatas[start:end])
+            ]
+            vector_store.import_chunks(chunks, embeddings[start:end].tolist())
+        return snapshot.manifest
+    finally:
+        # Drop our view of the map before closing it
+        embeddings = None
+        snapshot.close()
+
+
+def load_snapshot_if_empty(vector_store, path: Optional[Path] = None) -> bool:
+    """Import the configured snapshot at startup if the index is empty."""
+    path = Path(path or config.SNAPSHOT_PATH)
+    if not path.exists() or vector_store.get_collection_info()["count"] > 0:
+        return False
+    try:
+        manifest = import_snapshot(vector_store, path)
+    except SnapshotError as e:
+        print(f"Not loading snapshot {path}: {e}")
+        return False
+    print(f"Loaded {manifest['count']} chunks from snapshot {path} (created {manifest['created_at']})")
+    return True
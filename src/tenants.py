@@ -0,0 +1,143 @@
+"""Tenant-scoped knowledge bases.
+
+Each tenant has its own vector store (collection, chunk store and indexes)
+in its own directory, so one process can serve many customers while sharing
+a single embedding model. Open stores are kept in a bounded LRU: a tenant's
+store is opened on first use and closed again when it becomes the least
+recently used one beyond MAX_OPEN_TENANTS, which keeps memory bounded no
+matter how many mostly idle tenants exist. Requests lease the store they
+use, and a leased store is never closed; the LRU can briefly exceed its
+bound while every candidate is in use.
+"""
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import src.config as config
+
+TENANT_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,47}$")
+
+
+class TenantError(ValueError):
+    """Raised for invalid or unknown tenants."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def resolve_tenant(tenant: Optional[str]) -> str:
+    """Validate a tenant name; an empty name means the default tenant."""
+    tenant = (tenant or config.DEFAULT_TENANT).strip().lower()
+    if tenant != config.DEFAULT_TENANT and not TENANT_NAME_RE.match(tenant):
+        raise TenantError(
+            "Invalid tenant name (use 1-48 lowercase letters, digits, '-' or '_', starting with a letter or digit)"
+        )
+    return tenant
+
+
+def tenant_directory(tenant: str) -> Path:
+    """Persist directory of a tenant's vector store."""
+    if tenant == config.DEFAULT_TENANT:
+        return config.CHROMA_DB_DIR
+    return config.TENANTS_DIR / tenant
+
+
+def tenant_collection_name(tenant: str) -> str:
+    """Collection name of a tenant."""
+    if tenant == config.DEFAULT_TENANT:
+        return config.CHROMA_COLLECTION_NAME
+    return f"{config.CHROMA_COLLECTION_NAME}_{tenant}"
+
+
+def tenant_docs_dir(tenant: str) -> Path:
+    """Directory holding a tenant's uploaded files."""
+    if tenant == config.DEFAULT_TENANT:
+        return config.DOCS_DIR
+    return config.TENANT_DOCS_DIR / tenant
+
+
+def tenant_exists(tenant: str) -> bool:
+    return tenant == config.DEFAULT_TENANT or tenant_directory(tenant).is_dir()
+
+
+def list_tenants() -> List[str]:
+    """All tenants with a knowledge base on disk."""
+    tenants = [config.DEFAULT_TENANT]
+    if config.TENANTS_DIR.is_dir():
+        tenants.extend(sorted(p.name for p in config.TENANTS_DIR.iterdir() if p.is_dir()))
+    return tenants
+
+
+class TenantStores:
+    """Bounded LRU of open per-tenant vector stores.
+
+    The default tenant's store is opened eagerly and never evicted.
+    """
+
+    def __init__(self, open_store: Callable[[str], Any], max_open: int = None):
+        self._open_store = open_store
+        self.max_open = max(1, max_open or config.MAX_OPEN_TENANTS)
+        self._stores: "OrderedDict[str, Any]" = OrderedDict()
+        # Number of holders of each tenant's store
+        self._leases: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with self.lease(config.DEFAULT_TENANT) as store:
+            self.default = store
+
+    @contextmanager
+    def lease(self, tenant: Optional[str] = None, create: bool = False) -> Iterator[Any]:
+        """Use a tenant's store, which stays open until the block exits.
+
+        Unknown tenants raise TenantError (404) unless `create` is set.
+        """
+        tenant = resolve_tenant(tenant)
+        store = self.acquire(tenant, create=create)
+        try:
+            yield store
+        finally:
+            self.release(tenant)
+
+    def acquire(self, tenant: Optional[str] = None, create: bool = False) -> Any:
+        """Lease a tenant's store, opening it (and evicting idle LRU ones) if needed.
+
+        Every acquire must be paired with a `release` of the same tenant.
+        """
+        tenant = resolve_tenant(tenant)
+        with self._lock:
+            store = self._stores.get(tenant)
+            if store is not None:
+                self._stores.move_to_end(tenant)
+            else:
+                if not create and not tenant_exists(tenant):
+                    raise TenantError(f"Unknown tenant: {tenant}", status_code=404)
+                store = self._open_store(tenant)
+                self._stores[tenant] = store
+            self._leases[tenant] = self._leases.get(tenant, 0) + 1
+            self._evict()
+            return store
+
+    def release(self, tenant: Optional[str] = None) -> None:
+        """End a lease; the store is closed once it is idle and beyond the bound."""
+        tenant = resolve_tenant(tenant)
+        with self._lock:
+            self._leases[tenant] -= 1
+            if not self._leases[tenant]:
+                del self._leases[tenant]
+            self._evict()
+
+    def _evict(self) -> None:
+        idle = [t for t in self._stores if t != config.DEFAULT_TENANT and t not in self._leases]
+        for tenant in idle[:max(0, len(self._stores) - self.max_open)]:
+            store = self._stores.pop(tenant)
+            close = getattr(store, "close", None)
+            if close is not None:
+                close()
+
+    def open_tenants(self) -> List[str]:
+        """Tenants with an open store, least recently used first."""
+        with self._lock:
+            return list(self._stores)
@@ -0,0 +1,132 @@
+"""Persistent cache of extracted document text.
+
+PDF extraction is the slowest part of ingestion, so extracted page text is
+cached on disk keyed by the SHA-256 of the file content and the extractor
+version. Changing chunk size, overlap or the chunking strategy then reuses
+the cached text instead of reparsing every PDF.
+
+Entries are zlib-compressed JSON lists of whitespace-normalized page text,
+stored under `<dir>/<hash[:2]>/<hash>-<version>.json.z`.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import src.config as config
+
+ENTRY_SUFFIX = ".json.z"
+
+
+def file_hash(file_path: Path) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_page(text: str) -> str:
+    """Collapse whitespace; chunking is word-based so this is lossless for it."""
+    return " ".join((text or "").split())
+
+
+class ExtractedTextCache:
+    """On-disk cache of normalized page text keyed by content hash."""
+
+    def __init__(self, directory: Path = None, extractor_version: str = ""):
+        self.directory = Path(directory or config.TEXT_CACHE_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.extractor_version = extractor_version
+
+    def _entry_path(self, content_hash: str) -> Path:
+        return self.directory / content_hash[:2] / f"{content_hash}-{self.extractor_version}{ENTRY_SUFFIX}"
+
+    def get(self, content_hash: str) -> Optional[List[str]]:
+        """Return cached pages for a content hash, or None on a miss."""
+        path = self._entry_path(content_hash)
+        try:
+            with open(path, "rb") as f:
+                pages = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        except (FileNotFoundError, zlib.error, ValueError):
+            return None
+        # Touch so garbage collection can evict least recently used entries
+        os.utime(path, None)
+        return pages
+
+    def put(self, content_hash: str, pages: List[str]) -> None:
+        """Store normalized pages for a content hash."""
+        path = self._entry_path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A unique temp file per writer, so concurrent puts of the same hash never share one
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp",
+                                         delete=False) as f:
+            tmp_path = f.name
+            try:
+                f.write(zlib.compress(json.dumps(pages).encode("utf-8"), 6))
+            except BaseException:
+                f.close()
+                os.unlink(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    def entries(self) -> List[Path]:
+        """List all cache entry files."""
+        return list(self.directory.glob(f"*/*{ENTRY_SUFFIX}"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count and total size of the cache."""
+        entries = self.entries()
+        return {
+            "directory": str(self.directory),
+            "extractor_version": self.extractor_version,
+            "entries": len(entries),
+            "bytes": sum(p.stat().st_size for p in entries)
+        }
+
+    def gc(self, keep_hashes: Optional[Iterable[str]] = None, max_age_days: Optional[float] = None,
+           max_bytes: Optional[int] = None) -> Dict[str, int]:
+        """Remove stale cache entries.
+
+        Args:
+            keep_hashes: If given, entries for any other content hash are removed
+            max_age_days: Remove entries not used for this many days
+            max_bytes: Evict least recently used entries until the cache fits
+        """
+        keep = set(keep_hashes) if keep_hashes is not None else None
+        now = time.time()
+        removed = 0
+        freed = 0
+        survivors = []
+
+        for path in self.entries():
+            content_hash, _, version = path.name[:-len(ENTRY_SUFFIX)].partition("-")
+            stat = path.stat()
+            stale = (
+                version != self.extractor_version
+                or (keep is not None and content_hash not in keep)
+                or (max_age_days is not None and now - stat.st_mtime > max_age_days * 86400)
+            )
+            if stale:
+                path.unlink()
+                removed += 1
+                freed += stat.st_size
+            else:
+                survivors.append((stat.st_mtime, stat.st_size, path))
+
+        if max_bytes is not None:
+            total = sum(size for _, size, _ in survivors)
+            for _, size, path in sorted(survivors):
+                if total <= max_bytes:
+                    break
+                path.unlink()
+                total -= size
+                removed += 1
+                freed += size
+
+        return {"removed": removed, "freed_bytes": freed}
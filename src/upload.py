@@ -0,0 +1,103 @@
+"""Streaming document uploads.
+
+Uploads are written straight into the tenant's docs directory while they
+arrive. Each block is hashed (SHA-256, the extracted-text cache key),
+appended to a temporary file next to the destination and, for TXT/MD,
+decoded and chunked incrementally. When the body ends the temporary file
+is renamed into place and the chunks are ready, so the bytes are handled
+once instead of being copied to a temp file, moved and read back.
+
+Blocks are buffered up to UPLOAD_BUFFER_BYTES and then processed in a
+worker thread; the request body is not read further until that finishes,
+which propagates backpressure to the client.
+"""
+import codecs
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from src.ingestion import TEXT_SUFFIXES, DocumentChunker, StreamingTextChunker
+import src.config as config
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class UploadSink:
+    """Hashes, persists and (for text formats) chunks an upload block by block."""
+    
+    def __init__(self, destination: Path, chunker: DocumentChunker, max_bytes: int = None):
+        self.destination = destination
+        self.max_bytes = max_bytes if max_bytes is not None else config.MAX_UPLOAD_BYTES
+        self.size = 0
+        self.chunks: Optional[List[Dict[str, Any]]] = None
+        self._digest = hashlib.sha256()
+        self._tmp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._tmp_path, "wb")
+        self._decoder = None
+        self._text_chunker = None
+        if destination.suffix.lower() in TEXT_SUFFIXES:
+            self._decoder = codecs.getincrementaldecoder("utf-8")()
+            self._text_chunker = StreamingTextChunker(chunker, chunker.file_metadata(destination))
+    
+    @property
+    def content_hash(self) -> str:
+        return self._digest.hexdigest()
+    
+    def write(self, data: bytes) -> None:
+        """Process the next block of the upload."""
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+        self._digest.update(data)
+        self._file.write(data)
+        if self._text_chunker is not None:
+            self._text_chunker.feed(self._decoder.decode(data))
+    
+    def commit(self) -> "UploadSink":
+        """Finish the upload and move the file into place."""
+        if self._text_chunker is not None:
+            self._text_chunker.feed(self._decoder.decode(b"", final=True))
+            self.chunks = self._text_chunker.finish()
+        self._file.close()
+        os.replace(self._tmp_path, self.destination)
+        return self
+    
+    def abort(self) -> None:
+        """Discard a partial upload."""
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def copy_upload(source: BinaryIO, sink: UploadSink) -> UploadSink:
+    """Feed a file-like object through a sink (multipart uploads)."""
+    try:
+        for block in iter(lambda: source.read(config.UPLOAD_BUFFER_BYTES), b""):
+            sink.write(block)
+        return sink.commit()
+    except BaseException:
+        sink.abort()
+        raise
+
+
+async def receive_upload(body: AsyncIterator[bytes], sink: UploadSink) -> UploadSink:
+    """Feed a streamed request body through a sink as it arrives."""
+    buffer = bytearray()
+    try:
+        async for block in body:
+            buffer += block
+            if len(buffer) >= config.UPLOAD_BUFFER_BYTES:
+                await run_in_threadpool(sink.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(sink.write, bytes(buffer))
+        return await run_in_threadpool(sink.commit)
+    except BaseException:
+        sink.abort()
+        raise
@@ -1,19 +1,154 @@
 """Vector store using ChromaDB."""
 import chromadb
 from chromadb.config import Settings
+import os
+import threading
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from src.chunk_store import ChunkStore
+from src.lexical_index import LexicalIndex, hybrid_search
+from src.metadata_index import MetadataIndex, chroma_where
+from src.quantized_index import QuantizedVectorIndex
+from src.metrics import stage_timer, CHUNKS_INGESTED_TOTAL, RETRIEVED_DOCS
 import src.config as config
 
+# Embedding models are loaded once per process and shared by all stores.
+# Loading before forking workers lets them share the weights copy-on-write.
+_embedding_models: Dict[str, SentenceTransformer] = {}
+
+
+def get_embedding_model(model_name: str = None) -> SentenceTransformer:
+    """Return the process-wide embedding model, loading it on first use."""
+    model_name = model_name or config.EMBEDDING_MODEL
+    if model_name not in _embedding_models:
+        _embedding_models[model_name] = SentenceTransformer(model_name)
+    return _embedding_models[model_name]
+
+
+def hnsw_metadata(m: int = None, construction_ef: int = None, search_ef: int = None) -> Dict[str, Any]:
+    """Collection metadata with HNSW index parameters (configured defaults if not given)."""
+    metadata = {"hnsw:space": "cosine"}
+    params = {
+        "hnsw:M": m or config.HNSW_M,
+        "hnsw:construction_ef": construction_ef or config.HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": search_ef or config.HNSW_SEARCH_EF
+    }
+    # Unset parameters keep Chroma's defaults
+    metadata.update({key: value for key, value in params.items() if value})
+    return metadata
+
+
+def get_hnsw_params(collection) -> Dict[str, Any]:
+    """Return the HNSW parameters a collection was built with."""
+    try:
+        hnsw = collection.configuration["hnsw"] or {}
+        return {
+            "M": hnsw.get("max_neighbors"),
+            "construction_ef": hnsw.get("ef_construction"),
+            "search_ef": hnsw.get("ef_search")
+        }
+    except (AttributeError, KeyError, TypeError):
+        # Older Chroma versions only expose the creation metadata
+        metadata = collection.metadata or {}
+        return {
+            "M": metadata.get("hnsw:M"),
+            "construction_ef": metadata.get("hnsw:construction_ef"),
+            "search_ef": metadata.get("hnsw:search_ef")
+        }
+
+
+def set_search_ef(collection, search_ef: int) -> None:
+    """Change a collection's HNSW ef_search (M and ef_construction are fixed at creation)."""
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except TypeError:
+        # Older Chroma versions take it as metadata
+        collection.modify(metadata={**(collection.metadata or {}), "hnsw:search_ef": search_ef})
+
+
+def is_parent_chunk(chunk: Dict[str, Any]) -> bool:
+    """Parent chunks of hierarchical chunking are stored for the prompt but never indexed."""
+    return chunk["metadata"].get("chunk_level") == "parent"
+
+
+# Metadata describing a child chunk rather than its parent
+CHILD_FIELDS = ("chunk_level", "chunk_index", "word_start", "parent_id", "parent_index")
+
+
+def merge_into_parents(docs: List[Dict[str, Any]], parent_texts: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Replace child chunk hits by their parents, ranked by each parent's best child.
+    
+    A parent doc keeps the best child's scores and metadata (page range of the
+    match), with `chunk_index` pointing at the parent, and lists the IDs of its
+    matched children. Hits without a stored parent are kept as they are.
+    """
+    merged = []
+    by_parent: Dict[str, Dict[str, Any]] = {}
+    for doc in docs:
+        parent_id = doc["metadata"].get("parent_id")
+        if parent_id not in parent_texts:
+            merged.append(doc)
+        elif parent_id in by_parent:
+            by_parent[parent_id]["matched_children"].append(doc["id"])
+        else:
+            metadata = {k: v for k, v in doc["metadata"].items() if k not in CHILD_FIELDS}
+            metadata.update(chunk_level="parent", chunk_index=doc["metadata"]["parent_index"])
+            parent = {**doc, "id": parent_id, "text": parent_texts[parent_id], "metadata": metadata,
+                      "matched_children": [doc["id"]]}
+            by_parent[parent_id] = parent
+            merged.append(parent)
+    return merged
+
 
 class VectorStore:
     """Manages vector storage with ChromaDB."""
     
-    def __init__(self, persist_directory: Path = None):
+    def __init__(self, persist_directory: Path = None, read_only: bool = False, collection_name: str = None):
         self.persist_directory = persist_directory or config.CHROMA_DB_DIR
-        self.embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
+        self.collection_name = collection_name or config.CHROMA_COLLECTION_NAME
+        self.read_only = read_only
+        self.embedding_model = get_embedding_model()
+        
+        # Writers bump this file after every change; readers reopen when it moves
+        self.generation_file = Path(self.persist_directory) / "generation"
+        self._generation = self._read_generation()
+        self._refresh_lock = threading.Lock()
+        
+        self._open_collection()
         
+        # Chunk texts live in a compressed side store, not in Chroma
+        self.chunk_store = ChunkStore(
+            Path(self.persist_directory) / "chunk_store" / self.collection_name
+        )
+        
+        # BM25 index for identifier lookups and hybrid search
+        self.lexical_index = LexicalIndex(
+            Path(self.persist_directory) / "lexical_index" / self.collection_name
+        )
+        if not self.read_only and self.lexical_index.count() == 0 and self.collection.count() > 0:
+            self.rebuild_lexical_index()
+        
+        # Row sets over chunk metadata that resolve filters to candidate sets
+        self.metadata_index = MetadataIndex(
+            Path(self.persist_directory) / "metadata_index" / self.collection_name
+        )
+        if not self.read_only and self.metadata_index.count() != self.collection.count():
+            self.rebuild_metadata_index()
+        
+        # Optional compressed vector index that replaces Chroma's HNSW for dense search
+        self.vector_index = None
+        if config.VECTOR_COMPRESSION != "none":
+            self.vector_index = QuantizedVectorIndex(
+                Path(self.persist_directory) / "vector_index" / self.collection_name,
+                config.VECTOR_COMPRESSION
+            )
+            if not self.read_only and self.vector_index.count() != self.collection.count():
+                self.rebuild_vector_index()
+    
+    def _open_collection(self) -> None:
+        """Open the ChromaDB client and collection."""
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
             path=str(self.persist_directory),
@@ -22,97 +157,582 @@ class VectorStore:
         
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
-            name=config.CHROMA_COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
+            name=self.collection_name,
+            metadata=hnsw_metadata()
         )
+        
+        # ef_search can change on an existing index (it is read when the index is
+        # loaded, i.e. on first query); M and ef_construction cannot
+        params = get_hnsw_params(self.collection)
+        if config.HNSW_SEARCH_EF and params["search_ef"] != config.HNSW_SEARCH_EF and not self.read_only:
+            set_search_ef(self.collection, config.HNSW_SEARCH_EF)
+            params["search_ef"] = config.HNSW_SEARCH_EF
+        for key, wanted in (("M", config.HNSW_M), ("construction_ef", config.HNSW_CONSTRUCTION_EF)):
+            if wanted and params[key] != wanted:
+                print(f"Warning: collection was built with hnsw {key}={params[key]}, config says {wanted}; "
+                      f"rebuild the index (e.g. snapshot export/import) to apply it")
+        self.hnsw_params = params
+    
+    def _read_generation(self) -> str:
+        try:
+            return self.generation_file.read_text()
+        except FileNotFoundError:
+            return ""
+    
+    def _bump_generation(self) -> None:
+        """Signal readers in other processes that the index changed."""
+        tmp_path = self.generation_file.with_suffix(".tmp")
+        tmp_path.write_text(f"{os.getpid()}:{os.urandom(8).hex()}")
+        os.replace(tmp_path, self.generation_file)
+        self._generation = self._read_generation()
+    
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only in this process; send writes to the writer")
+    
+    def refresh_if_stale(self) -> bool:
+        """Reopen the collection if another process changed the index.
+        
+        Chroma keeps the HNSW index in memory per client, so a reader only
+        sees a writer's changes after reopening. Returns True if reopened.
+        """
+        generation = self._read_generation()
+        if generation == self._generation:
+            return False
+        with self._refresh_lock:
+            if generation == self._generation:
+                return False
+            # Closing releases this client's Chroma system (the process-wide
+            # cache is shared with other stores, so it is left alone); the new
+            # client then starts a fresh system that loads the writer's index
+            self.client.close()
+            self._open_collection()
+            if self.vector_index is not None:
+                self.vector_index.refresh()
+            self.metadata_index.refresh()
+            self._generation = generation
+        return True
     
-    def add_documents(self, chunks: List[Dict[str, Any]]) -> None:
-        """Add document chunks to vector store."""
+    def add_documents(self, chunks: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Upsert document chunks into the vector store.
+        
+        Chunk IDs are content hashes, so chunks whose ID is already stored are
+        unchanged and are skipped without re-embedding.
+        """
+        self._check_writable()
+        if not chunks:
+            return {"added": 0, "unchanged": 0}
+        
+        existing = self._indexed_ids([chunk["id"] for chunk in chunks if not is_parent_chunk(chunk)])
+        existing.update(self.chunk_store.get_many([chunk["id"] for chunk in chunks if is_parent_chunk(chunk)]))
+        new_chunks = [chunk for chunk in chunks if chunk["id"] not in existing]
+        indexed_chunks = [chunk for chunk in new_chunks if not is_parent_chunk(chunk)]
+        
+        # Store texts first so any ID visible in Chroma can be resolved
+        with stage_timer("chunk_store_write"):
+            self.chunk_store.put(new_chunks)
+        with stage_timer("lexical_index_write"):
+            self.lexical_index.add(indexed_chunks)
+        self._upsert_chunks(indexed_chunks)
+        self._bump_generation()
+        return {"added": len(new_chunks), "unchanged": len(chunks) - len(new_chunks)}
+    
+    def replace_source(self, source: str, chunks: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Replace all chunks of a source with a new set.
+        
+        Only chunks that are new are embedded; chunks that disappeared are
+        removed by ID in one batch using the per-source chunk-ID index.
+        """
+        self._check_writable()
+        old_ids = set(self._source_chunk_ids(source))
+        new_ids = {chunk["id"] for chunk in chunks}
+        # What to embed is decided by what Chroma holds rather than the chunk
+        # store, which also keeps parent chunks (never indexed): a chunk whose
+        # level changed must be indexed or unindexed although its text is stored
+        indexed_ids = self._indexed_ids(list(old_ids | new_ids))
+        indexed_chunks = [chunk for chunk in chunks
+                          if not is_parent_chunk(chunk) and chunk["id"] not in indexed_ids]
+        unindexed_ids = {chunk["id"] for chunk in chunks if is_parent_chunk(chunk)} & indexed_ids
+        stale_ids = old_ids - new_ids
+        remove_ids = list(stale_ids & indexed_ids | unindexed_ids)
+        added = len(new_ids - old_ids | {chunk["id"] for chunk in indexed_chunks} | unindexed_ids)
+        
+        with stage_timer("chunk_store_write"):
+            self.chunk_store.replace_source(source, chunks)
+        with stage_timer("lexical_index_write"):
+            self.lexical_index.remove(remove_ids)
+            self.lexical_index.add(indexed_chunks)
+        self._upsert_chunks(indexed_chunks)
+        if remove_ids:
+            with stage_timer("vector_delete"):
+                self._delete_ids(remove_ids)
+        self._bump_generation()
+        
+        return {
+            "added": added,
+            "removed": len(stale_ids),
+            "unchanged": len(chunks) - added
+        }
+    
+    def _indexed_ids(self, ids: List[str]) -> set:
+        """The subset of chunk IDs present in Chroma."""
+        found = set()
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            found.update(self.collection.get(ids=ids[start:start + batch_size], include=[])["ids"])
+        return found
+    
+    def delete_source(self, source: str) -> int:
+        """Delete all chunks of a source. Returns the number of chunks removed."""
+        self._check_writable()
+        ids = self._source_chunk_ids(source)
+        if ids:
+            with stage_timer("vector_delete"):
+                self._delete_ids(ids)
+        self.lexical_index.remove(ids)
+        self.chunk_store.delete_source(source)
+        self._bump_generation()
+        return len(ids)
+    
+    def _source_chunk_ids(self, source: str) -> List[str]:
+        """Look up chunk IDs of a source from the index (scanning only for legacy rows)."""
+        ids = self.chunk_store.get_chunk_ids(source)
+        if not ids:
+            # Rows written before the chunk store existed are not indexed
+            ids = self.collection.get(where={"source": source}, include=[])["ids"]
+        return ids
+    
+    def import_chunks(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+        """Store chunks with precomputed embeddings (no re-embedding)."""
+        self._check_writable()
+        if not chunks:
+            return
+        self.chunk_store.put(chunks)
+        self.lexical_index.add(chunks)
+        self._upsert_chunks(chunks, embeddings)
+        self._bump_generation()
+    
+    def import_parents(self, parents: List[Dict[str, Any]]) -> None:
+        """Store parent chunks (texts only; they have no embeddings)."""
+        self._check_writable()
+        if not parents:
+            return
+        self.chunk_store.put(parents)
+        self._bump_generation()
+    
+    def rebuild_lexical_index(self, batch_size: int = 1000) -> int:
+        """Rebuild the BM25 index from the stored chunks. Returns the number indexed."""
+        self._check_writable()
+        print("Building lexical index from stored chunks...")
+        self.lexical_index.clear()
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            texts = self._fetch_texts(batch["ids"])
+            self.lexical_index.add([
+                {"id": chunk_id, "text": texts.get(chunk_id, ""), "metadata": metadata}
+                for chunk_id, metadata in zip(batch["ids"], batch["metadatas"])
+            ])
+            offset += len(batch["ids"])
+        return offset
+    
+    def rebuild_metadata_index(self, batch_size: int = 1000) -> int:
+        """Rebuild the metadata filter index from Chroma. Returns the number of chunks."""
+        self._check_writable()
+        print("Building metadata filter index from stored chunks...")
+        self.metadata_index.clear()
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            self.metadata_index.add(batch["ids"], batch["metadatas"])
+            offset += len(batch["ids"])
+        return offset
+    
+    def rebuild_vector_index(self, batch_size: int = 1000) -> int:
+        """Rebuild the compressed vector index from Chroma. Returns the number of vectors."""
+        self._check_writable()
+        print(f"Building {config.VECTOR_COMPRESSION} vector index from stored embeddings...")
+        self.vector_index.clear()
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            self.vector_index.add(batch["ids"], [m.get("source", "") for m in batch["metadatas"]],
+                                  batch["embeddings"])
+            offset += len(batch["ids"])
+        return offset
+    
+    def export_batch(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], List[List[float]]]:
+        """Return one batch of stored chunks (id, text, full metadata) and their embeddings."""
+        batch = self.collection.get(include=["embeddings", "metadatas"], limit=limit, offset=offset)
+        ids = batch["ids"]
+        if not ids:
+            return [], []
+        texts = self._fetch_texts(ids)
+        file_paths = self.chunk_store.get_file_paths(m.get("source", "") for m in batch["metadatas"])
+        chunks = []
+        for chunk_id, metadata in zip(ids, batch["metadatas"]):
+            metadata = dict(metadata)
+            metadata.setdefault("file_path", file_paths.get(metadata.get("source", "")) or "")
+            chunks.append({"id": chunk_id, "text": texts.get(chunk_id, ""), "metadata": metadata})
+        return chunks, [[float(x) for x in embedding] for embedding in batch["embeddings"]]
+    
+    def export_parent_batch(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Return the parent chunks of `limit` sources (from `offset`) and the number of sources read.
+        
+        Parents live only in the chunk store: they are the stored IDs of a
+        source that Chroma does not hold.
+        """
+        sources = sorted(self.chunk_store.list_sources())[offset:offset + limit]
+        file_paths = self.chunk_store.get_file_paths(sources)
+        parents = []
+        for source in sources:
+            ids = self.chunk_store.get_chunk_ids(source)
+            indexed_ids = self._indexed_ids(ids)
+            parent_ids = [chunk_id for chunk_id in ids if chunk_id not in indexed_ids]
+            texts = self.chunk_store.get_many(parent_ids)
+            metadata = {"source": source, "file_path": file_paths.get(source) or "", "chunk_level": "parent"}
+            parents.extend({"id": chunk_id, "text": texts[chunk_id], "metadata": dict(metadata)}
+                           for chunk_id in parent_ids if chunk_id in texts)
+        return parents, len(sources)
+    
+    def export_parents(self, batch_size: int = 100) -> Iterator[List[Dict[str, Any]]]:
+        """Yield all stored parent chunks, in batches of sources."""
+        self.refresh_if_stale()
+        offset = 0
+        while True:
+            parents, scanned = self.export_parent_batch(offset, batch_size)
+            if not scanned:
+                break
+            if parents:
+                yield parents
+            offset += scanned
+    
+    def export_chunks(self, batch_size: int = 1000) -> Iterator[Tuple[List[Dict[str, Any]], List[List[float]]]]:
+        """Yield all stored chunks with their embeddings, in batches."""
+        self.refresh_if_stale()
+        offset = 0
+        while True:
+            chunks, embeddings = self.export_batch(offset, batch_size)
+            if not chunks:
+                break
+            yield chunks, embeddings
+            offset += len(chunks)
+    
+    def _upsert_chunks(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]] = None) -> None:
+        """Embed chunks (unless embeddings are given) and upsert vectors plus compact metadata into Chroma."""
         if not chunks:
             return
         
         texts = [chunk["text"] for chunk in chunks]
         ids = [chunk["id"] for chunk in chunks]
-        metadatas = [chunk["metadata"] for chunk in chunks]
+        # file_path is stored once per source in the chunk store
+        metadatas = [
+            {k: v for k, v in chunk["metadata"].items() if k != "file_path"}
+            for chunk in chunks
+        ]
         
         # Generate embeddings
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=False).tolist()
-        
-        # Add to ChromaDB
-        self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+        if embeddings is None:
+            with stage_timer("document_embedding"):
+                embeddings = self.embedding_model.encode(texts, show_progress_bar=False).tolist()
+        
+        # Upsert in batches Chroma accepts
+        batch_size = self.client.get_max_batch_size()
+        with stage_timer("vector_add"):
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                self.collection.upsert(
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+            if self.vector_index is not None:
+                self.vector_index.add(ids, [m.get("source", "") for m in metadatas], embeddings)
+        self.metadata_index.add(ids, metadatas)
+        CHUNKS_INGESTED_TOTAL.inc(len(chunks))
     
-    def search(self, query: str, top_k: int = None, source_filter: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    def _delete_ids(self, ids: List[str]) -> None:
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[start:start + batch_size])
+        if self.vector_index is not None:
+            self.vector_index.remove(ids)
+        self.metadata_index.remove(ids)
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Generate the embedding for a query."""
+        with stage_timer("query_embedding"):
+            return self.embedding_model.encode([query], show_progress_bar=False).tolist()[0]
+    
+    def search(self, query: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+               ef_search: Optional[int] = None, mode: str = None,
+               query_embedding: Optional[List[float]] = None,
+               metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Search for similar documents.
         
         Args:
             query: The search query text
             top_k: Number of results to return
             source_filter: Optional list of source file names to filter by
+            ef_search: Optional HNSW ef_search override for this query
+            mode: "dense", "lexical" or "hybrid" (default: SEARCH_MODE)
+            query_embedding: Optional precomputed embedding of the query
+            metadata_filter: Optional file_type / page / ingest-date filter
+                (see src/metadata_index.py)
+        """
+        return hybrid_search(self, query, top_k or config.TOP_K, source_filter=source_filter,
+                             ef_search=ef_search, mode=mode, query_embedding=query_embedding,
+                             metadata_filter=metadata_filter)
+    
+    def get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Return the stored embeddings of chunk IDs."""
+        if not ids:
+            return {}
+        stored = self.collection.get(ids=list(ids), include=["embeddings"])
+        return {
+            chunk_id: [float(x) for x in embedding]
+            for chunk_id, embedding in zip(stored["ids"], stored["embeddings"])
+        }
+    
+    def get_chunk_texts(self, ids: List[str]) -> Dict[str, str]:
+        """Return stored texts of chunk IDs, including parent chunks."""
+        return self.chunk_store.get_many(ids)
+    
+    def expand_to_parents(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace child chunk hits by their parent chunks, fetched in one batch."""
+        parent_ids = list(dict.fromkeys(doc["metadata"]["parent_id"] for doc in docs
+                                        if doc["metadata"].get("parent_id")))
+        if not parent_ids:
+            return docs
+        with stage_timer("parent_fetch"):
+            parent_texts = self.get_chunk_texts(parent_ids)
+        return merge_into_parents(docs, parent_texts)
+    
+    def lexical_search(self, query: str, top_k: int = None, source_filter: Optional[List[str]] = None,
+                       metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search the BM25 index; docs carry a BM25 `score` and no distance."""
+        top_k = top_k or config.TOP_K
+        self.refresh_if_stale()
+        allowed_ids = None
+        if metadata_filter:
+            with stage_timer("metadata_filter"):
+                allowed_ids = set(self.metadata_index.chunk_ids(
+                    self.metadata_index.match(source_filter, metadata_filter)
+                ))
+            if not allowed_ids:
+                return []
+        with stage_timer("lexical_search"):
+            hits = self.lexical_index.search(query, top_k, source_filter=source_filter, allowed_ids=allowed_ids)
+        if not hits:
+            return []
+        ids = [chunk_id for chunk_id, _ in hits]
+        stored = self.collection.get(ids=ids, include=["metadatas"])
+        metadata_by_id = dict(zip(stored["ids"], stored["metadatas"]))
+        # Skip hits whose vector row is gone (e.g. an index written by an older version)
+        ids = [chunk_id for chunk_id in ids if chunk_id in metadata_by_id]
+        docs = self._format_results(ids, [metadata_by_id[chunk_id] for chunk_id in ids], None)
+        scores = dict(hits)
+        for doc in docs:
+            doc["score"] = scores[doc["id"]]
+        return docs
+    
+    def search_by_embedding(self, query_embedding: List[float], top_k: int = None,
+                            source_filter: Optional[List[str]] = None,
+                            ef_search: Optional[int] = None,
+                            metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents given a precomputed query embedding.
+        
+        Filtered searches first resolve the filter to candidate chunks with
+        the metadata index. Small candidate sets are searched exactly by brute
+        force; larger ones go through the (filtered) vector index.
         """
         top_k = top_k or config.TOP_K
+        self.refresh_if_stale()
         
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode([query], show_progress_bar=False).tolist()[0]
+        candidate_ids = None
+        if source_filter or metadata_filter:
+            with stage_timer("metadata_filter"):
+                rows = self.metadata_index.match(source_filter, metadata_filter)
+            if not len(rows):
+                RETRIEVED_DOCS.observe(0)
+                return []
+            candidate_ids = self.metadata_index.chunk_ids(rows)
+            if len(rows) <= config.FILTER_BRUTE_FORCE_MAX:
+                return self._search_exact(query_embedding, top_k, candidate_ids)
         
-        # Build where filter if source_filter is provided
-        where_filter = None
-        if source_filter:
-            # ChromaDB supports filtering with $in operator
-            where_filter = {"source": {"$in": source_filter}}
+        if self.vector_index is not None:
+            return self._search_compressed(query_embedding, top_k, candidate_ids)
         
-        # Search in ChromaDB
+        # Same filter as a Chroma where-clause for the filtered HNSW query
+        where_filter = chroma_where(source_filter, metadata_filter)
+        
+        # Search in ChromaDB (texts are fetched from the chunk store afterwards).
+        # HNSW searches with ef = max(ef_search, n_results), so a per-query
+        # ef_search override is applied by fetching that many candidates.
         query_kwargs = {
             "query_embeddings": [query_embedding],
-            "n_results": top_k
+            "n_results": max(top_k, ef_search or 0),
+            "include": ["metadatas", "distances"]
         }
         if where_filter:
             query_kwargs["where"] = where_filter
         
-        results = self.collection.query(**query_kwargs)
+        with stage_timer("vector_search"):
+            results = self.collection.query(**query_kwargs)
         
         # Format results
         retrieved_docs = []
-        if results["documents"] and len(results["documents"][0]) > 0:
-            for i in range(len(results["documents"][0])):
-                retrieved_docs.append({
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i] if "distances" in results else None
-                })
+        if results["ids"] and len(results["ids"][0]) > 0:
+            retrieved_docs = self._format_results(
+                results["ids"][0][:top_k],
+                results["metadatas"][0][:top_k],
+                results["distances"][0][:top_k] if results.get("distances") else None
+            )
         
+        RETRIEVED_DOCS.observe(len(retrieved_docs))
+        return retrieved_docs
+    
+    def _search_exact(self, query_embedding: List[float], top_k: int,
+                      candidate_ids: List[str]) -> List[Dict[str, Any]]:
+        """Brute-force cosine search over a small candidate set."""
+        ids, metadatas, embeddings = [], [], []
+        with stage_timer("vector_search"):
+            batch_size = self.client.get_max_batch_size()
+            for start in range(0, len(candidate_ids), batch_size):
+                stored = self.collection.get(ids=candidate_ids[start:start + batch_size],
+                                             include=["embeddings", "metadatas"])
+                ids.extend(stored["ids"])
+                metadatas.extend(stored["metadatas"])
+                embeddings.extend(stored["embeddings"])
+            if ids:
+                vectors = np.asarray(embeddings, dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                query = np.asarray(query_embedding, dtype=np.float32)
+                query /= max(float(np.linalg.norm(query)), 1e-12)
+                similarities = vectors @ query
+                order = np.argsort(-similarities)[:top_k]
+        retrieved_docs = []
+        if ids:
+            retrieved_docs = self._format_results(
+                [ids[i] for i in order],
+                [metadatas[i] for i in order],
+                [float(1.0 - similarities[i]) for i in order]
+            )
+        RETRIEVED_DOCS.observe(len(retrieved_docs))
+        return retrieved_docs
+    
+    def _search_compressed(self, query_embedding: List[float], top_k: int,
+                           candidate_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Dense search over the compressed vector index with exact rerank."""
+        with stage_timer("vector_search"):
+            hits = self.vector_index.search(query_embedding, top_k, candidate_ids=candidate_ids)
+        retrieved_docs = []
+        if hits:
+            ids = [chunk_id for chunk_id, _ in hits]
+            stored = self.collection.get(ids=ids, include=["metadatas"])
+            metadata_by_id = dict(zip(stored["ids"], stored["metadatas"]))
+            hits = [(chunk_id, distance) for chunk_id, distance in hits if chunk_id in metadata_by_id]
+            retrieved_docs = self._format_results(
+                [chunk_id for chunk_id, _ in hits],
+                [metadata_by_id[chunk_id] for chunk_id, _ in hits],
+                [distance for _, distance in hits]
+            )
+        RETRIEVED_DOCS.observe(len(retrieved_docs))
         return retrieved_docs
     
+    def _format_results(self, ids: List[str], metadatas: List[Dict[str, Any]],
+                        distances: Optional[List[float]]) -> List[Dict[str, Any]]:
+        """Attach chunk texts and file paths to search hits."""
+        with stage_timer("chunk_fetch"):
+            texts = self._fetch_texts(ids)
+            file_paths = self.chunk_store.get_file_paths(m.get("source", "") for m in metadatas)
+        docs = []
+        for i, chunk_id in enumerate(ids):
+            metadata = dict(metadatas[i])
+            if "file_path" not in metadata:
+                metadata["file_path"] = file_paths.get(metadata.get("source", "")) or ""
+            docs.append({
+                "id": chunk_id,
+                "text": texts.get(chunk_id, ""),
+                "metadata": metadata,
+                "distance": distances[i] if distances else None
+            })
+        return docs
+    
+    def _fetch_texts(self, ids: List[str]) -> Dict[str, str]:
+        """Fetch chunk texts in one batch, falling back to Chroma for legacy rows."""
+        texts = self.chunk_store.get_many(ids)
+        missing = [chunk_id for chunk_id in ids if chunk_id not in texts]
+        if missing:
+            legacy = self.collection.get(ids=missing, include=["documents"])
+            for chunk_id, text in zip(legacy["ids"], legacy["documents"] or []):
+                if text is not None:
+                    texts[chunk_id] = text
+        return texts
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection."""
+        self.refresh_if_stale()
         count = self.collection.count()
         
-        # Get all documents to extract unique sources
-        all_results = self.collection.get()
-        unique_sources = set()
-        if all_results.get("metadatas"):
-            for metadata in all_results["metadatas"]:
-                if metadata and "source" in metadata:
-                    unique_sources.add(metadata["source"])
+        if self.chunk_store.count() >= count:
+            # Every row is indexed, so sources come straight from the index
+            unique_sources = set(self.chunk_store.list_sources())
+        else:
+            # Legacy rows: scan metadata to extract unique sources
+            all_results = self.collection.get(include=["metadatas"])
+            unique_sources = set(self.chunk_store.list_sources())
+            if all_results.get("metadatas"):
+                for metadata in all_results["metadatas"]:
+                    if metadata and "source" in metadata:
+                        unique_sources.add(metadata["source"])
         
         return {
             "count": count,
-            "collection_name": config.CHROMA_COLLECTION_NAME,
-            "sources": sorted(list(unique_sources))
+            "collection_name": self.collection_name,
+            "sources": sorted(list(unique_sources)),
+            "chunk_store_bytes": self.chunk_store.size_bytes(),
+            "lexical_index_bytes": self.lexical_index.size_bytes(),
+            "hnsw": self.hnsw_params,
+            "metadata_index": self.metadata_index.stats(),
+            "vector_compression": self.vector_index.stats() if self.vector_index is not None else {
+                "mode": "none",
+                "bytes_per_chunk": self._embedding_dim() * 4
+            }
         }
     
+    def close(self) -> None:
+        """Release the Chroma client and index handles; the store is unusable afterwards."""
+        close_client = getattr(self.client, "close", None)
+        if close_client is not None:
+            close_client()
+        self.chunk_store.close()
+        self.lexical_index.close()
+        self.metadata_index.close()
+        if self.vector_index is not None:
+            self.vector_index.close()
+    
+    def _embedding_dim(self) -> int:
+        return self.embedding_model.get_sentence_embedding_dimension() or 0
+    
     def delete_collection(self) -> None:
         """Delete the collection (for testing/reset)."""
+        self._check_writable()
         try:
-            self.client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
-            self.collection = self.client.get_or_create_collection(
-                name=config.CHROMA_COLLECTION_NAME,
-                metadata={"hnsw:space": "cosine"}
-            )
+            self.client.delete_collection(name=self.collection_name)
+            self.chunk_store.clear()
+            self.lexical_index.clear()
+            self.metadata_index.clear()
+            if self.vector_index is not None:
+                self.vector_index.clear()
+            self._open_collection()
+            self._bump_generation()
         except Exception as e:
             print(f"Error deleting collection: {e}")
 
@@ -0,0 +1,132 @@
+"""HTTP helpers: precompressed static assets and fast JSON responses.
+
+The web UI lives in `static/`. At startup every asset is read once, hashed
+and compressed (gzip, and brotli when the `brotli` package is installed), so
+serving it is a dict lookup:
+
+- `index.html` references the other assets by content-hashed names
+  (`app.3f2a9c1b.js`), which are cached by browsers for a year
+  (`immutable`); `index.html` itself is revalidated on every load
+- every variant has a strong ETag, so revalidation is a `304` without a body
+- the encoding is negotiated from `Accept-Encoding` (br, then gzip)
+"""
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+import src.config as config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INDEX = "index.html"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Smaller files are not worth compressing
+MIN_COMPRESS_BYTES = 256
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class StaticAsset:
+    """One asset with its precompressed variants."""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        # Strong ETags must differ between encodings of the same content
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest[:32]}{suffix}"'
+
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """Pick br, gzip or identity from an Accept-Encoding header."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            quality = float(match.group(1))
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and quality > 0:
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """In-memory, precompressed copy of the static directory."""
+
+    def __init__(self, directory: Path = None):
+        self.directory = Path(directory or config.STATIC_DIR)
+        # Keyed by file name and content-hashed name; only hashed names are
+        # immutable, the others must be revalidated since their content can change
+        self.assets: Dict[str, StaticAsset] = {}
+        self.immutable: Set[str] = set()
+        self.load()
+
+    def load(self) -> None:
+        """Read, fingerprint and compress all assets."""
+        assets, immutable = {}, set()
+        index = (self.directory / INDEX).read_text(encoding="utf-8")
+        paths = sorted(p for p in self.directory.iterdir() if p.is_file() and p.name != INDEX)
+        for path in paths:
+            asset = StaticAsset(path.read_bytes(), self._media_type(path))
+            hashed_name = f"{path.stem}.{asset.digest[:8]}{path.suffix}"
+            assets[path.name] = assets[hashed_name] = asset
+            immutable.add(hashed_name)
+            index = index.replace(f'/static/{path.name}"', f'/static/{hashed_name}"')
+        assets[INDEX] = StaticAsset(index.encode("utf-8"), "text/html; charset=utf-8")
+        self.assets, self.immutable = assets, immutable
+
+    @staticmethod
+    def _media_type(path: Path) -> str:
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        return media_type
+
+    def response(self, name: str, request: Request) -> Optional[Response]:
+        """Response for an asset (304 when the client's copy is current), None if unknown."""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+        etag = asset.etag(encoding)
+        cache_control = IMMUTABLE if name in self.immutable else REVALIDATE
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
@@ -0,0 +1,211 @@
+// Load stats
+let availableSources = [];
+async function loadStats() {
+    try {
+        const response = await fetch('/api/stats');
+        const data = await response.json();
+        document.getElementById('stats-text').textContent = 
+            `Chunks indexed: ${data.count || 0}`;
+
+        // Show available sources
+        if (data.sources && data.sources.length > 0) {
+            availableSources = data.sources;
+            const sourcesContainer = document.getElementById('sources-container');
+            sourcesContainer.innerHTML = '';
+            data.sources.forEach(source => {
+                const badge = document.createElement('span');
+                badge.textContent = source;
+                badge.style.cssText = 'background: #667eea; color: white; padding: 5px 10px; border-radius: 15px; font-size: 12px;';
+                sourcesContainer.appendChild(badge);
+            });
+            document.getElementById('sources-list').style.display = 'block';
+        }
+
+        // Populate source filter dropdown
+        populateSourceFilter();
+    } catch (error) {
+        document.getElementById('stats-text').textContent = 'Error loading stats';
+    }
+}
+
+// Populate source filter dropdown
+function populateSourceFilter() {
+    const select = document.getElementById('source-filter');
+    if (!select) return;
+
+    // Clear existing options except the first one
+    while (select.options.length > 1) {
+        select.remove(1);
+    }
+    // Add available sources
+    availableSources.forEach(source => {
+        const option = document.createElement('option');
+        option.value = source;
+        option.textContent = source;
+        select.appendChild(option);
+    });
+}
+
+loadStats();
+
+// Upload form
+document.getElementById('upload-form').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const fileInput = document.getElementById('file-input');
+    const file = fileInput.files[0];
+    const uploadBtn = document.getElementById('upload-btn');
+    const status = document.getElementById('upload-status');
+
+    if (!file) return;
+
+    uploadBtn.disabled = true;
+    status.className = 'status info';
+    status.textContent = 'Uploading and indexing...';
+
+    try {
+        // Stream the raw file; the server indexes it as it arrives
+        const response = await fetch('/api/ingest/' + encodeURIComponent(file.name), {
+            method: 'PUT',
+            body: file
+        });
+        const data = await response.json();
+
+        if (data.status === 'success') {
+            status.className = 'status success';
+            status.textContent = `Success! Indexed ${data.chunks} chunks from ${data.file}`;
+            fileInput.value = '';
+            loadStats();
+        } else {
+            status.className = 'status error';
+            status.textContent = `Error: ${data.error || 'Unknown error'}`;
+        }
+    } catch (error) {
+        status.className = 'status error';
+        status.textContent = `Error: ${error.message}`;
+    } finally {
+        uploadBtn.disabled = false;
+    }
+});
+
+// Follow-up questions continue the same chat session
+let sessionId = null;
+document.getElementById('new-conversation-btn').addEventListener('click', () => {
+    sessionId = null;
+    document.getElementById('answer-section').classList.remove('visible');
+});
+
+// Query
+document.getElementById('query-btn').addEventListener('click', async () => {
+    const queryInput = document.getElementById('query-input');
+    const sourceFilter = document.getElementById('source-filter');
+    const query = queryInput.value.trim();
+    const queryBtn = document.getElementById('query-btn');
+    const loading = document.getElementById('query-loading');
+    const status = document.getElementById('query-status');
+    const answerSection = document.getElementById('answer-section');
+    const answerText = document.getElementById('answer-text');
+    const sourceList = document.getElementById('source-list');
+
+    if (!query) return;
+
+    // Get selected sources
+    const selectedSources = Array.from(sourceFilter.selectedOptions)
+        .map(opt => opt.value)
+        .filter(val => val !== '');
+
+    queryBtn.disabled = true;
+    loading.className = 'loading visible';
+    status.className = 'status';
+    answerSection.classList.remove('visible');
+
+    try {
+        const requestBody = { question: query };
+        if (selectedSources.length > 0) {
+            requestBody.source_filter = selectedSources;
+        }
+        if (sessionId) {
+            requestBody.session_id = sessionId;
+        } else {
+            requestBody.new_session = true;
+        }
+
+        let response = await fetch('/api/query', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(requestBody)
+        });
+        if (response.status === 404 && sessionId) {
+            // Session expired: start a new one
+            sessionId = null;
+            delete requestBody.session_id;
+            requestBody.new_session = true;
+            response = await fetch('/api/query', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(requestBody)
+            });
+        }
+        const data = await response.json();
+
+        loading.className = 'loading';
+
+        if (data.session_id) {
+            sessionId = data.session_id;
+        }
+        if (data.answer) {
+            answerText.textContent = data.answer;
+            sourceList.innerHTML = '';
+            if (data.sources && data.sources.length > 0) {
+                data.sources.forEach(source => {
+                    const li = document.createElement('li');
+                    li.className = 'source-item';
+                    li.textContent = source.source;
+                    sourceList.appendChild(li);
+                });
+            }
+            answerSection.classList.add('visible');
+        } else {
+            status.className = 'status error';
+            status.textContent = 'No answer received';
+        }
+    } catch (error) {
+        loading.className = 'loading';
+        status.className = 'status error';
+        status.textContent = `Error: ${error.message}`;
+    } finally {
+        queryBtn.disabled = false;
+    }
+});
+
+// Enter key for query
+document.getElementById('query-input').addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        document.getElementById('query-btn').click();
+    }
+});
+
+// Prefetch retrieval while the question is being typed
+let prefetchTimer = null;
+let prefetchController = null;
+document.getElementById('query-input').addEventListener('input', (e) => {
+    clearTimeout(prefetchTimer);
+    const question = e.target.value.trim();
+    if (question.length < 8) return;
+    prefetchTimer = setTimeout(() => {
+        if (prefetchController) prefetchController.abort();
+        prefetchController = new AbortController();
+        const selectedSources = Array.from(document.getElementById('source-filter').selectedOptions)
+            .map(opt => opt.value)
+            .filter(val => val !== '');
+        const requestBody = { question: question };
+        if (selectedSources.length > 0) {
+            requestBody.source_filter = selectedSources;
+        }
+        fetch('/api/prefetch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(requestBody),
+            signal: prefetchController.signal
+        }).catch(() => {});
+    }, 300);
+});
@@ -0,0 +1,190 @@
+"""Tune HNSW index parameters for recall vs latency.
+
+Copies the stored vectors into temporary collections built with different
+M / construction_ef values, sweeps search_ef on each, and compares the
+results against exact (brute-force cosine) top-k ground truth. Reports
+recall@k and latency per setting and recommends the fastest setting that
+meets the target recall.
+
+search_ef is swept the way the per-query override applies it: each index is
+built with the smallest search_ef and queried for max(search_ef, k)
+candidates, since HNSW searches with ef = max(ef_search, k).
+
+Examples:
+    python tune_hnsw.py --target-recall 0.95
+    python tune_hnsw.py --m 8,16,32 --construction-ef 100,200 --search-ef 10,20,50,100,200
+    python tune_hnsw.py --queries-file questions.txt --top-k 10 --output hnsw_report.json
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+from benchmark import latency_summary, parse_int_list
+from src.vector_store import VectorStore, hnsw_metadata
+import src.config as config
+
+
+def load_vectors(store: VectorStore, limit: int = None):
+    """Load chunk IDs, texts and embeddings from the store."""
+    ids, texts, vectors = [], [], []
+    for chunks, embeddings in store.export_chunks():
+        ids.extend(chunk["id"] for chunk in chunks)
+        texts.extend(chunk["text"] for chunk in chunks)
+        vectors.extend(embeddings)
+        if limit and len(ids) >= limit:
+            break
+    if limit:
+        ids, texts, vectors = ids[:limit], texts[:limit], vectors[:limit]
+    return ids, texts, np.asarray(vectors, dtype=np.float32)
+
+
+def sample_queries(store: VectorStore, texts: List[str], num_queries: int, seed: int,
+                   queries_file: str = None) -> np.ndarray:
+    """Embed questions from a file, or random word windows from stored chunks."""
+    if queries_file:
+        with open(queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()][:num_queries]
+    else:
+        rng = random.Random(seed)
+        queries = []
+        for text in rng.sample(texts, min(num_queries, len(texts))):
+            words = text.split()
+            length = rng.randint(4, 12)
+            start = rng.randint(0, max(0, len(words) - length))
+            queries.append(" ".join(words[start:start + length]))
+    embeddings = store.embedding_model.encode(queries, show_progress_bar=False)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, ids: List[str], top_k: int) -> List[set]:
+    """Brute-force cosine top-k for each query."""
+    normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = queries @ normalized.T
+    ground_truth = []
+    for row in scores:
+        best = np.argpartition(-row, min(top_k, len(row) - 1))[:top_k]
+        ground_truth.append({ids[i] for i in best})
+    return ground_truth
+
+
+def build_index(client, name: str, ids: List[str], vectors: np.ndarray, m: int, construction_ef: int,
+                search_ef: int):
+    """Create a temporary collection with the given build parameters."""
+    collection = client.create_collection(
+        name=name, metadata=hnsw_metadata(m=m, construction_ef=construction_ef, search_ef=search_ef)
+    )
+    batch_size = client.get_max_batch_size()
+    start = time.perf_counter()
+    for offset in range(0, len(ids), batch_size):
+        collection.add(ids=ids[offset:offset + batch_size], embeddings=vectors[offset:offset + batch_size].tolist())
+    return collection, time.perf_counter() - start
+
+
+def evaluate(collection, queries: np.ndarray, ground_truth: List[set], top_k: int,
+             search_ef: int) -> Dict[str, Any]:
+    """Measure recall@k and latency of one index configuration."""
+    recalls, samples = [], []
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=max(top_k, search_ef),
+                                  include=["distances"])
+        samples.append(time.perf_counter() - start)
+        recalls.append(len(expected & set(result["ids"][0][:top_k])) / len(expected))
+    return {"recall": round(sum(recalls) / len(recalls), 4), "latency": latency_summary(samples)}
+
+
+def main():
+    """Sweep HNSW parameters and write a recall-vs-latency report."""
+    parser = argparse.ArgumentParser(description="Tune HNSW parameters against exact ground truth.")
+    parser.add_argument("--m", type=parse_int_list, default=[8, 16, 32], help="Comma-separated M values")
+    parser.add_argument("--construction-ef", type=parse_int_list, default=[100, 200],
+                        help="Comma-separated construction_ef values")
+    parser.add_argument("--search-ef", type=parse_int_list, default=[10, 20, 40, 80, 160, 320],
+                        help="Comma-separated search_ef values")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--queries", type=int, default=200, help="Number of sample queries")
+    parser.add_argument("--queries-file", type=str, default=None, help="Questions to use, one per line")
+    parser.add_argument("--max-chunks", type=int, default=None, help="Only use the first N stored chunks")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", type=str, default=None, help="Directory for temporary indexes")
+    parser.add_argument("--output", type=str, default="hnsw_report.json")
+    args = parser.parse_args()
+
+    store = VectorStore()
+    ids, texts, vectors = load_vectors(store, args.max_chunks)
+    if len(ids) <= args.top_k:
+        print(f"Need more than {args.top_k} indexed chunks to tune; found {len(ids)}.")
+        return
+
+    queries = sample_queries(store, texts, args.queries, args.seed, args.queries_file)
+    ground_truth = exact_top_k(vectors, queries, ids, args.top_k)
+    print(f"Tuning on {len(ids)} chunks with {len(queries)} queries, recall@{args.top_k} target {args.target_recall}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="hnsw_tune_", dir=args.workdir))
+    client = chromadb.PersistentClient(path=str(workdir), settings=Settings(anonymized_telemetry=False))
+    results = []
+    try:
+        for m in args.m:
+            for construction_ef in args.construction_ef:
+                name = f"tune_m{m}_ef{construction_ef}"
+                collection, build_seconds = build_index(client, name, ids, vectors, m, construction_ef,
+                                                        min(args.search_ef))
+                for search_ef in args.search_ef:
+                    row = {
+                        "M": m,
+                        "construction_ef": construction_ef,
+                        "search_ef": search_ef,
+                        "build_seconds": round(build_seconds, 3),
+                        **evaluate(collection, queries, ground_truth, args.top_k, search_ef)
+                    }
+                    results.append(row)
+                    print(f"  M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                          f"recall={row['recall']:.4f}  p50={row['latency']['p50_ms']:.2f}ms  "
+                          f"p99={row['latency']['p99_ms']:.2f}ms")
+                client.delete_collection(name)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    meeting = [r for r in results if r["recall"] >= args.target_recall]
+    recommended = min(meeting, key=lambda r: (r["latency"]["p50_ms"], r["build_seconds"])) if meeting else None
+
+    report = {
+        "meta": {
+            "chunks": len(ids),
+            "queries": len(queries),
+            "top_k": args.top_k,
+            "target_recall": args.target_recall,
+            "embedding_model": config.EMBEDDING_MODEL,
+            "current": store.hnsw_params
+        },
+        "results": results,
+        "recommended": recommended
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if recommended:
+        print(f"\nRecommended (fastest with recall >= {args.target_recall}):")
+        print(f"  HNSW_M={recommended['M']} HNSW_CONSTRUCTION_EF={recommended['construction_ef']} "
+              f"HNSW_SEARCH_EF={recommended['search_ef']}  (recall {recommended['recall']:.4f}, "
+              f"p50 {recommended['latency']['p50_ms']:.2f}ms)")
+        print("  M and construction_ef apply to new collections; rebuild the index to change them.")
+    else:
+        best = max(results, key=lambda r: r["recall"])
+        print(f"\nNo setting reached recall {args.target_recall}; best was {best['recall']:.4f} "
+              f"(M={best['M']}, construction_ef={best['construction_ef']}, search_ef={best['search_ef']}).")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()